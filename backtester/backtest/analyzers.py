@@ -0,0 +1,44 @@
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+
+class DailyReturns(bt.Analyzer):
+    """
+    Broker value at the end of every bar, in an array preallocated to the
+    length of the preloaded data, and the daily returns computed from it in
+    one pass. Gives the same returns series as the PyFolio analyzer's
+    get_pf_items() for daily bars, without building its positions,
+    transactions and leverage frames.
+    """
+
+    def start(self):
+        size = max(self.strategy.datas[0].buflen(), 1)
+        self._values = np.empty(size)
+        self._dates = np.empty(size)
+        self._count = 0
+        self._start_value = self.strategy.broker.getvalue()
+        self._value = self._start_value
+
+    def notify_fund(self, cash, value, fundvalue, shares):
+        self._value = value
+
+    def next(self):
+        if self._count == len(self._values):
+            self._values = np.concatenate([self._values, np.empty(len(self._values))])
+            self._dates = np.concatenate([self._dates, np.empty(len(self._dates))])
+        self._values[self._count] = self._value
+        self._dates[self._count] = self.strategy.datas[0].datetime[0]
+        self._count += 1
+
+    def get_returns(self):
+        values = self._values[:self._count]
+        previous = np.empty_like(values)
+        previous[:1] = self._start_value
+        previous[1:] = values[:-1]
+        dates = pd.DatetimeIndex([bt.num2date(dt).date() for dt in self._dates[:self._count]])
+        index = pd.DatetimeIndex(dates, name='index').tz_localize('UTC')
+        return pd.Series(values / previous - 1.0, index=index, name='return').dropna()
+
+    def get_analysis(self):
+        return self.get_returns()
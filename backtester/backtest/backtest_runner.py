@@ -1,13 +1,20 @@
-import backtrader as bt
-from utils.data_handler import get_ohlcv, get_secondary_data
-from strategies.trend_change import TrendStrategy, PandasDataWithDirection
-from strategies.rsi_diff import RSIDiffStrategy, PandasDataWithRSIDiff
-import streamlit as st
-import quantstats as qs
-import backtrader.analyzers as btanalyzers
+from utils.data_handler import get_ohlcv, get_secondary_data, build_indicator_params
+from backtest.vectorized import run_vectorized
+from backtest.result_cache import data_version, get_default_result_cache
+from backtest.instrumentation import timed
+from backtest.charts import run_record, chart_image
+from backtest.ledger import trade_stats
+from backtest.portfolio import load_panel, run_panel
 import pandas as pd
 
+# backtrader and the strategy classes are imported inside the functions that
+# run them, so the dashboard pages render without loading backtrader. Only
+# backtest_strategy needs Streamlit, the rest also runs headless (see run.py).
+
 def get_data_feed(strategy, df):
+    from strategies.trend_change import PandasDataWithDirection
+    from strategies.rsi_diff import PandasDataWithRSIDiff
+
     strategy_to_feed_class = {
         "Trend Change": PandasDataWithDirection,
         "RSI Diff": PandasDataWithRSIDiff,
@@ -19,7 +26,8 @@ def get_data_feed(strategy, df):
 
     common_params = {
         'dataname': df,
-        'datetime': 'Date',
+        # Lean frames have no Date column, None reads the index
+        'datetime': 'Date' if 'Date' in df.columns else None,
         'open': 'Open',
         'high': 'High',
         'low': 'Low',
@@ -34,7 +42,12 @@ def get_data_feed(strategy, df):
 
     return data_feed_class(**common_params)
 
+ENGINES = ["backtrader", "vectorized"]
+
+
 def load_strategy_class(strategy):
+    from strategies.trend_change import TrendStrategy
+    from strategies.rsi_diff import RSIDiffStrategy
 
     strategy_to_class = {
         "Trend Change": TrendStrategy,
@@ -47,41 +60,154 @@ def load_strategy_class(strategy):
     return strategy_class
 
 
-def backtest_strategy(code, start_date, end_date, initial_cash=100000, commission=0.001, strategy="Trend Change", strategy_params=None, show_individual_results=True):
+def strategy_lines(strategy):
+    """The indicator lines strategy reads, the only ones its runs compute."""
+    return list(load_strategy_class(strategy).indicator_lines)
+
+
+def run_backtest(code, start_date, end_date, initial_cash=100000, commission=0.001, strategy="Trend Change", strategy_params=None, provider=None, engine="backtrader", indicator_cache=None, result_cache=None, timings=None, records=None, lean=False):
+    """
+    Runs a single backtest and returns (returns, cerebro). Errors are raised to the caller.
+
+    engine="vectorized" uses the NumPy fast path, which gives the same returns
+    but has no Cerebro instance to plot, so cerebro is None. Pass an
+    IndicatorCache to share prices and indicators across the runs of a sweep.
+    With a ResultCache, returns already computed for the same inputs and
+    prices are served without running the strategy, and cerebro is None.
+    Pass a RunTimings to record the load, indicators and run stages, and a
+    dict as records to have the chart record of the run (see
+    charts.run_record) stored under code. lean=True loads lean frames (see
+    get_ohlcv), unless the prices come from indicator_cache.
+    """
+    if strategy_params is None:
+        strategy_params = {}
+    if engine not in ENGINES:
+        raise ValueError(f"Engine '{engine}' not supported.")
+
+    # Load data
+    params = build_indicator_params(strategy_params)
+    with timed(timings, code, 'load'):
+        if indicator_cache is not None:
+            prices = indicator_cache.prices(code, start_date, end_date)
+        else:
+            prices = get_ohlcv(code, start_date, end_date, provider=provider, lean=lean)
+
+    returns = cerebro = None
+    if result_cache is not None:
+        key = result_cache.key(code, start_date, end_date, initial_cash, commission, strategy, strategy_params, engine, data_version(prices))
+        returns = result_cache.get(key)
+        # The chart record still needs the indicators for the fills
+        if returns is not None and records is None:
+            return returns, None
+
+    with timed(timings, code, 'indicators'):
+        lines = strategy_lines(strategy)
+        if indicator_cache is not None:
+            df = indicator_cache.get_secondary_data(code, start_date, end_date, params, lines)
+        else:
+            df = get_secondary_data(prices, params, lean, lines)
+
+    if returns is None:
+        with timed(timings, code, 'run'):
+            returns, cerebro = run_strategy(df, initial_cash, commission, strategy, strategy_params, engine)
+        if result_cache is not None:
+            result_cache.put(key, returns)
+    if records is not None:
+        ledger = cerebro.runstrats[0][0].ledger if cerebro is not None else None
+        records[code] = run_record(df, returns, initial_cash, commission, strategy, strategy_params, ledger)
+    return returns, cerebro
+
+
+def run_strategy(df, initial_cash=100000, commission=0.001, strategy="Trend Change", strategy_params=None, engine="backtrader", pyfolio=False):
+    """
+    Runs the strategy on a frame that already has the get_secondary_data columns.
+
+    Backtrader runs take their returns from the light DailyReturns analyzer.
+    pyfolio=True also attaches the full PyFolio analyzer, for tear sheets
+    that need its positions and transactions (see pyfolio_items).
+    """
     if strategy_params is None:
         strategy_params = {}
+    if engine not in ENGINES:
+        raise ValueError(f"Engine '{engine}' not supported.")
 
-    try:
-        # Load data
-        df = get_ohlcv(code, start_date, end_date)
-        df = get_secondary_data(df)
+    if engine == "vectorized":
+        load_strategy_class(strategy)
+        returns = run_vectorized(df, strategy, initial_cash, commission, strategy_params)
+        return returns, None
+
+    import backtrader as bt
+    import backtrader.analyzers as btanalyzers
+    from backtest.analyzers import DailyReturns
 
-        data_feed = get_data_feed(strategy, df)
+    data_feed = get_data_feed(strategy, df)
 
-        cerebro = bt.Cerebro()
-        cerebro.broker.set_cash(initial_cash)
-        cerebro.broker.setcommission(commission=commission)
-        cerebro.adddata(data_feed)
+    cerebro = bt.Cerebro()
+    cerebro.broker.set_cash(initial_cash)
+    cerebro.broker.setcommission(commission=commission)
+    cerebro.adddata(data_feed)
 
-        # PyFolio Analyzer
+    cerebro.addanalyzer(DailyReturns, _name='returns')
+    if pyfolio:
         cerebro.addanalyzer(btanalyzers.PyFolio, _name='pyfolio')
 
-        # Load strategy class
-        strategy_class = load_strategy_class(strategy)
-        cerebro.addstrategy(strategy_class, **strategy_params)
+    # Load strategy class
+    strategy_class = load_strategy_class(strategy)
+    cerebro.addstrategy(strategy_class, **strategy_params)
 
-        # Run the strategy
-        results = cerebro.run()
+    # Run the strategy
+    results = cerebro.run()
 
-        # Plot the results only if the user wants individual plots
-        if show_individual_results:
-            fig = cerebro.plot(iplot=False)[0][0]
-            st.pyplot(fig)
+    returns = results[0].analyzers.returns.get_returns()
 
-        pyfolio_analyzer = results[0].analyzers.pyfolio
-        returns, _, _, _ = pyfolio_analyzer.get_pf_items()
+    return returns, cerebro
 
-        returns = pd.Series(returns).dropna()
+
+def pyfolio_items(cerebro):
+    """(returns, positions, transactions, gross_lev) of a run_strategy(..., pyfolio=True) run."""
+    return cerebro.runstrats[0][0].analyzers.pyfolio.get_pf_items()
+
+
+def run_portfolio(codes, start_date, end_date, initial_cash=100000, commission=0.001, strategy="Trend Change", strategy_params=None, allocation="cash", max_positions=None, provider=None, timings=None):
+    """
+    Backtests codes as one portfolio: the strategy trades every ticker
+    against a single shared broker holding initial_cash, in one pass over
+    the union of their dates (see portfolio.simulate_portfolio). allocation
+    is one of portfolio.ALLOCATIONS, max_positions caps the tickers held at
+    once.
+
+    The prices and signals of the whole universe are held as a few shared
+    2D arrays instead of one pandas feed per ticker, and there is no Cerebro
+    to set up. Tickers that fail to load are left out and reported.
+
+    Returns a dict with 'returns' (the portfolio's daily returns),
+    'asset_returns' (each ticker's contribution to them, one column per
+    ticker), 'ledgers' (a TradeLedger per ticker) and 'errors' (message per
+    ticker left out).
+    """
+    panel, errors = load_panel(codes, start_date, end_date, strategy, strategy_params, provider, timings)
+    if panel is None:
+        raise ValueError(f"No data for any of the {len(errors)} tickers.")
+    with timed(timings, 'portfolio', 'run'):
+        returns, asset_returns, ledgers = run_panel(panel, initial_cash, commission, strategy, strategy_params, allocation, max_positions)
+    return {'returns': returns, 'asset_returns': asset_returns, 'ledgers': ledgers, 'errors': errors}
+
+
+def backtest_strategy(code, start_date, end_date, initial_cash=100000, commission=0.001, strategy="Trend Change", strategy_params=None, show_individual_results=True, provider=None, engine="backtrader", indicator_cache=None, result_cache=None, timings=None):
+    import streamlit as st
+
+    if result_cache is None:
+        result_cache = get_default_result_cache()
+
+    try:
+        # The chart is drawn from the run's compact record, never from the Cerebro instance
+        records = {} if show_individual_results else None
+        returns, _ = run_backtest(code, start_date, end_date, initial_cash, commission, strategy, strategy_params, provider, engine, indicator_cache, result_cache, timings, records)
+
+        if show_individual_results:
+            with timed(timings, code, 'plot'):
+                st.image(chart_image(records[code], f"{code} - {strategy}"), use_container_width=True)
+            st.dataframe(pd.DataFrame([trade_stats(records[code]['ledger'])]), hide_index=True)
 
         return returns
 
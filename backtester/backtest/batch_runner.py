@@ -0,0 +1,306 @@
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from backtest.backtest_runner import run_backtest, run_strategy, strategy_lines
+from backtest.instrumentation import RunTimings, timed
+from backtest.charts import run_record
+from utils.data_handler import get_ohlcv, warmup_start, get_secondary_data, get_panel_indicators, build_indicator_params, LEAN_DTYPES, LEAN_COLUMNS
+from utils.data_provider import get_default_provider, set_default_provider
+
+# Tickers per get_panel_indicators call when prepare_frames builds lean frames
+LEAN_PANEL_TICKERS = 64
+
+
+class TopK:
+    """
+    The k items with the highest scores seen so far, kept in a bounded
+    min-heap so every add is O(log k). Items without a score (None or NaN)
+    are skipped.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+        self._count = 0  # tie-breaker, so items themselves are never compared
+
+    def add(self, score, item):
+        if score is None or np.isnan(score):
+            return
+        entry = (score, self._count, item)
+        self._count += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def items(self):
+        """Best first, earlier items first on ties."""
+        return [item for _, _, item in sorted(self._heap, key=lambda entry: (-entry[0], entry[1]))]
+
+
+def _run_one(code, start_date, end_date, initial_cash, commission, strategy, strategy_params, engine="backtrader", keep_record=False, lean=False, provider=None, timings=None):
+    """
+    Worker entry point: runs one ticker and never raises, so one bad ticker cannot sink the batch.
+    With timings, the stage records are returned under 'timings' for the parent to merge.
+    With keep_record, the chart record of the run is returned under 'record'.
+    """
+    try:
+        records = {} if keep_record else None
+        returns, _ = run_backtest(code, start_date, end_date, initial_cash, commission, strategy, strategy_params, provider, engine, timings=timings, records=records, lean=lean)
+        result = {'Stock': code, 'returns': returns, 'error': None}
+        if keep_record:
+            result['record'] = records[code]
+    except Exception as e:
+        result = {'Stock': code, 'returns': None, 'error': str(e)}
+    if timings is not None:
+        result['timings'] = timings.records
+    return result
+
+
+def _run_frame(code, df, initial_cash, commission, strategy, strategy_params, engine="backtrader", keep_record=False, timings=None):
+    """Like _run_one, for a frame that already has its indicators."""
+    try:
+        with timed(timings, code, 'run'):
+            returns, cerebro = run_strategy(df, initial_cash, commission, strategy, strategy_params, engine)
+        result = {'Stock': code, 'returns': returns, 'error': None}
+        if keep_record:
+            ledger = cerebro.runstrats[0][0].ledger if cerebro is not None else None
+            result['record'] = run_record(df, returns, initial_cash, commission, strategy, strategy_params, ledger)
+    except Exception as e:
+        result = {'Stock': code, 'returns': None, 'error': str(e)}
+    if timings is not None:
+        result['timings'] = timings.records
+    return result
+
+
+def _init_worker(provider):
+    if provider is not None:
+        set_default_provider(provider)
+
+
+def estimate_history_length(code, start_date, end_date, provider=None):
+    """
+    Rough number of calendar days a backtest of code will cover, taken from
+    the synced range of the local store. Tickers the store does not know yet
+    are assumed to cover the full range, they also need to be downloaded.
+    """
+    provider = provider or get_default_provider()
+    store = getattr(provider, 'store', provider)
+    covered = store.coverage(code) if hasattr(store, 'coverage') else None
+
+    first, last = start_date, end_date
+    if covered is not None:
+        first, last = max(start_date, covered[0]), min(end_date, covered[1])
+    days = (datetime.strptime(last, '%Y-%m-%d') - datetime.strptime(first, '%Y-%m-%d')).days
+    return max(days, 0)
+
+
+def is_local(code, start_date, end_date, provider=None):
+    """
+    True when get_ohlcv can load code for the range without a download:
+    the provider has no remote, or its store has already synced the range.
+    """
+    provider = provider or get_default_provider()
+    is_synced = getattr(provider, 'is_synced', None)
+    return is_synced is None or is_synced(code, warmup_start(start_date), end_date)
+
+
+def prepare_frames(codes, start_date, end_date, strategy_params=None, provider=None, timings=None, lean=False,
+                   lines=None):
+    """
+    Loads every ticker and computes the indicators of the whole universe with
+    a single get_panel_indicators call. Tickers whose bars are not a
+    contiguous run of the shared calendar (e.g. another exchange's holidays)
+    fall back to get_secondary_data. Returns (frames, errors) keyed by ticker.
+
+    lines are the indicator columns to compute (see compute_indicators),
+    all of them by default. With lean=True the frames are lean ones (see
+    get_ohlcv) and the default is the Direction and RSI_Diff columns, like
+    get_secondary_data(lean=True).
+    """
+    params = build_indicator_params(strategy_params)
+    if lines is None and lean:
+        lines = LEAN_COLUMNS
+    frames, errors = {}, {}
+    for code in codes:
+        try:
+            with timed(timings, code, 'load'):
+                frames[code] = get_ohlcv(code, start_date, end_date, provider=provider, lean=lean)
+        except Exception as e:
+            errors[code] = str(e)
+    if not frames:
+        return frames, errors
+
+    calendar = pd.DatetimeIndex(np.unique(np.concatenate([df.index.values for df in frames.values()])))
+    positions = {}  # ticker -> its (first, last + 1) rows of the calendar
+    for code, df in frames.items():
+        pos = calendar.get_indexer(df.index)
+        if pos[-1] - pos[0] + 1 == len(pos):
+            positions[code] = (pos[0], pos[-1] + 1)
+        else:
+            with timed(timings, code, 'indicators'):
+                frames[code] = get_secondary_data(df, params, lean, lines)
+
+    # Lean runs compute the panel a slice of tickers at a time, so its float64 arrays stay small
+    codes = list(positions)
+    chunk = LEAN_PANEL_TICKERS if lean else max(len(codes), 1)
+    for first in range(0, len(codes), chunk):
+        chunk_codes = codes[first:first + chunk]
+        top = min(positions[code][0] for code in chunk_codes)
+        bottom = max(positions[code][1] for code in chunk_codes)
+        shape = (bottom - top, len(chunk_codes))
+        high, low, close = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+        for j, code in enumerate(chunk_codes):
+            pos = slice(positions[code][0] - top, positions[code][1] - top)
+            high[pos, j] = frames[code]['High'].to_numpy(dtype=float)
+            low[pos, j] = frames[code]['Low'].to_numpy(dtype=float)
+            close[pos, j] = frames[code]['Close'].to_numpy(dtype=float)
+
+        with timed(timings, 'universe', 'indicators'):
+            indicators = get_panel_indicators(high, low, close, params, lines)
+        del high, low, close
+        for j, code in enumerate(chunk_codes):
+            df = frames[code]
+            pos = slice(positions[code][0] - top, positions[code][1] - top)
+            for column, values in indicators.items():
+                df[column] = values[pos, j].astype(LEAN_DTYPES.get(column, np.float32)) if lean else values[pos, j]
+        del indicators
+
+    return frames, errors
+
+
+def run_universe(codes, start_date, end_date, initial_cash=100000, commission=0.001, strategy="Trend Change",
+                 strategy_params=None, max_workers=None, progress_callback=None, provider=None, engine="backtrader",
+                 precompute_indicators=False, timings=None, keep_records=False, lean_frames=False):
+    """
+    Backtests every ticker in codes across a process pool.
+
+    Tickers with the longest history are submitted first so the slowest runs
+    do not end up last in the queue. Each result is a dict with 'Stock',
+    'returns' and 'error' (None on success), returned in the order of codes.
+    progress_callback(done, total, code) is called in this process after
+    each ticker finishes. With max_workers=1 everything runs in-process.
+
+    With precompute_indicators the prices of the tickers already synced to
+    the local store (see is_local) are loaded here and their indicators
+    computed in one pass (see prepare_frames), the workers only run the
+    strategies. Tickers that still need a download are loaded and run in
+    the pool as without it, submitted first so the downloads run in
+    parallel while the local tickers are prepared. Only the indicator lines
+    the strategy reads are computed (see BaseStrategy.indicator_lines).
+
+    With a RunTimings, every worker records its stages and they are merged
+    into timings as the results come back.
+
+    With keep_records, each successful result also has the compact chart
+    record of its run under 'record' (see charts.run_record).
+
+    With lean_frames, prices are loaded as lean frames (see get_ohlcv):
+    float32 prices, an int8 Direction and only the indicator columns the
+    strategies read. That cuts the memory of precomputed universes to
+    about a fifth; returns then follow the float32 prices.
+    """
+    codes = [code.strip() for code in codes]
+    total = len(dict.fromkeys(codes))
+
+    results = {}
+    stream = iter_universe(codes, start_date, end_date, initial_cash, commission, strategy, strategy_params,
+                           max_workers, provider, engine, precompute_indicators, timings, keep_records, lean_frames)
+    for done, result in enumerate(stream, start=1):
+        results[result['Stock']] = result
+        if progress_callback:
+            progress_callback(done, total, result['Stock'])
+
+    return [results[code] for code in codes]
+
+
+def iter_universe(codes, start_date, end_date, initial_cash=100000, commission=0.001, strategy="Trend Change",
+                  strategy_params=None, max_workers=None, provider=None, engine="backtrader",
+                  precompute_indicators=False, timings=None, keep_records=False, lean_frames=False):
+    """
+    Same as run_universe, but yields each ticker's result as soon as it
+    finishes, in completion order, once per distinct ticker.
+
+    Closing the generator, e.g. when the loop consuming it is interrupted,
+    cancels the tickers still queued. Runs already started in a worker are
+    left to finish in the background, their results are dropped.
+    """
+    unique_codes = list(dict.fromkeys(code.strip() for code in codes))
+    if not unique_codes:
+        return
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(unique_codes)))
+    strategy_args = (initial_cash, commission, strategy, strategy_params, engine, keep_records)
+
+    # Only tickers the local store already holds are loaded here, downloads stay in the pool
+    frame_codes = []
+    if precompute_indicators:
+        frame_codes = [code for code in unique_codes if is_local(code, start_date, end_date, provider)]
+    local = set(frame_codes)
+    tasks = {code: (_run_one, (code, start_date, end_date) + strategy_args + (lean_frames,), None)
+             for code in unique_codes if code not in local}
+
+    def prepare():
+        """Loads the local tickers, returns their load errors and adds their tasks."""
+        frames, errors = prepare_frames(frame_codes, start_date, end_date, strategy_params, provider, timings, lean_frames,
+                                        strategy_lines(strategy))
+        added = {code: (_run_frame, (code, df) + strategy_args, len(df)) for code, df in frames.items()}
+        tasks.update(added)
+        return [{'Stock': code, 'returns': None, 'error': error} for code, error in errors.items()], added
+
+    def task_timings():
+        # Each task records into its own instance, so pool workers can send theirs back
+        return None if timings is None else RunTimings(timings.trace_memory)
+
+    def collect(result):
+        records = result.pop('timings', None)
+        if records:
+            timings.extend(records)
+        return result
+
+    if max_workers == 1:
+        if frame_codes:
+            yield from prepare()[0]
+        for code, (func, args, _) in tasks.items():
+            if func is _run_one:
+                args += (provider,)  # pool workers get it from _init_worker instead
+            yield collect(func(*args, timings=task_timings()))
+        return
+
+    def history_length(code):
+        length = tasks[code][2]
+        return length if length is not None else estimate_history_length(code, start_date, end_date, provider)
+
+    # spawn avoids forking the threads of the Streamlit server
+    context = multiprocessing.get_context('spawn')
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker, initargs=(provider,))
+    futures = {}
+
+    def submit(codes):
+        for code in sorted(codes, key=history_length, reverse=True):
+            futures[executor.submit(tasks[code][0], *tasks[code][1], timings=task_timings())] = code
+
+    finished = False
+    try:
+        submit(list(tasks))
+        if frame_codes:
+            errors, added = prepare()
+            yield from errors
+            submit(added)
+        for future in as_completed(futures):
+            code = futures[future]
+            try:
+                result = collect(future.result())
+            except Exception as e:
+                # A crashed worker breaks the pool, every unfinished ticker ends up here
+                result = {'Stock': code, 'returns': None, 'error': f"Worker failed: {e}"}
+            yield result
+        finished = True
+    finally:
+        # Only wait for the workers when every ticker is done, a cancelled batch returns right away
+        executor.shutdown(wait=finished, cancel_futures=not finished)
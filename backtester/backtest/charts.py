@@ -0,0 +1,141 @@
+import hashlib
+import io
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from backtest.ledger import BUY, SELL
+from backtest.vectorized import run_ledger
+from utils.data_handler import frame_dates
+
+# Points per line after downsampling, about one per pixel of a dashboard-wide chart
+MAX_POINTS = 1000
+MAX_CACHED_CHARTS = 64
+
+
+def run_record(df, returns, initial_cash=100000, commission=0.001, strategy="Trend Change", strategy_params=None, ledger=None):
+    """
+    Compact record of a run to chart it later without the run: the close and
+    the equity curve as float32 Series, and the run's TradeLedger (computed
+    with run_ledger unless given). A few tens of KB for ten years of daily
+    bars, and picklable, so pool workers can send it back.
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(frame_dates(df)))
+    equity = initial_cash * (1 + returns).cumprod()
+    equity_dates = equity.index.tz_localize(None) if equity.index.tz is not None else equity.index
+    return {
+        'close': pd.Series(df['Close'].to_numpy(dtype=np.float32), index=dates),
+        'equity': pd.Series(equity.to_numpy(dtype=np.float32), index=equity_dates),
+        'ledger': ledger if ledger is not None else run_ledger(df, strategy, initial_cash, commission, strategy_params),
+    }
+
+
+def lttb(x, y, n_out):
+    """
+    Indices of the n_out points Largest-Triangle-Three-Buckets keeps of the
+    line (x, y): the first and last point, and from each of n_out - 2 equal
+    buckets in between the point forming the largest triangle with the point
+    kept before it and the mean of the next bucket. Unlike taking every nth
+    point, the peaks and troughs of the line survive.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # n_out - 2 buckets covering the points between the first and the last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        mean_x, mean_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[a] - mean_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y - y[a]))
+        a = lo + int(np.nanargmax(area)) if not np.isnan(area).all() else lo
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(series, max_points=MAX_POINTS):
+    keep = lttb(series.index.asi8, series.to_numpy(), max_points)
+    return series.iloc[keep]
+
+
+def render_chart(record, title, max_points=MAX_POINTS):
+    """
+    PNG of a run record: the close with the buys and sells on top, the
+    equity curve below, each line downsampled to max_points. Drawn on a bare
+    matplotlib Figure, not pyplot, so nothing stays registered once the
+    image is written.
+    """
+    from matplotlib.figure import Figure
+
+    # Fixed margins, a constrained layout would measure every tick label again
+    fig = Figure(figsize=(10, 6))
+    fig.subplots_adjust(left=0.08, right=0.98, top=0.93, bottom=0.06, hspace=0.08)
+    price_ax, equity_ax = fig.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [2, 1]})
+
+    close = downsample(record['close'], max_points)
+    price_ax.plot(close.index, close.to_numpy(), color='tab:blue', linewidth=1, label='Close')
+    fills = record['ledger'].fills()
+    buys, sells = fills[fills['side'] == BUY], fills[fills['side'] == SELL]
+    price_ax.scatter(buys['date'], buys['price'], marker='^', color='tab:green', s=30, label='Buy', zorder=3)
+    price_ax.scatter(sells['date'], sells['price'], marker='v', color='tab:red', s=30, label='Sell', zorder=3)
+    price_ax.set_ylabel('Price')
+    price_ax.legend(loc='upper left')
+
+    equity = downsample(record['equity'], max_points)
+    equity_ax.plot(equity.index, equity.to_numpy(), color='tab:purple', linewidth=1)
+    equity_ax.set_ylabel('Equity')
+
+    fig.suptitle(title)
+    out = io.BytesIO()
+    fig.savefig(out, format='png', dpi=100)
+    return out.getvalue()
+
+
+def record_version(record):
+    """Hash of everything a chart of record shows."""
+    digest = hashlib.sha1()
+    for series in [record['close'], record['equity']]:
+        digest.update(series.index.asi8.tobytes())
+        digest.update(series.to_numpy().tobytes())
+    digest.update(record['ledger'].rows.tobytes())
+    return digest.hexdigest()
+
+
+class ChartCache:
+    """Rendered chart images in a bounded in-memory LRU, keyed by title, size and record_version."""
+
+    def __init__(self, max_entries=MAX_CACHED_CHARTS):
+        self.max_entries = max_entries
+        self._images = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def image(self, record, title, max_points=MAX_POINTS):
+        """The PNG of record, rendered only if the same chart is not cached yet."""
+        key = (title, max_points, record_version(record))
+        if key in self._images:
+            self._images.move_to_end(key)
+            self.stats['hits'] += 1
+            return self._images[key]
+
+        self.stats['misses'] += 1
+        image = render_chart(record, title, max_points)
+        self._images[key] = image
+        while len(self._images) > self.max_entries:
+            self._images.popitem(last=False)
+        return image
+
+    def clear(self):
+        self._images.clear()
+
+
+_default_chart_cache = ChartCache()
+
+
+def chart_image(record, title, max_points=MAX_POINTS):
+    """PNG of record from the process-wide ChartCache."""
+    return _default_chart_cache.image(record, title, max_points)
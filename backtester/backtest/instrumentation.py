@@ -0,0 +1,141 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Display order of the timing table
+STAGES = ['load', 'indicators', 'run', 'plot', 'metrics']
+PROFILERS = ['cProfile', 'pyinstrument']
+
+_log_handler = None
+
+
+class RunTimings:
+    """
+    Wall time and peak memory of every stage of backtest runs.
+
+    Code under measurement wraps each stage in
+    `with timings.stage(code, 'load'):`. Every finished stage is appended to
+    records and logged as one JSON line on the backtest.instrumentation
+    logger. With trace_memory, tracemalloc is started on first use and each
+    record also gets the peak memory the stage allocated above what was in
+    use when it began. Tracing slows Python code down noticeably, and the
+    peak is per process, so stages running in parallel threads share it.
+
+    Picklable, so it can be handed to pool workers and their records merged
+    back with extend().
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+
+    @contextmanager
+    def stage(self, run, name):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracing = self.trace_memory
+        if tracing:
+            start_memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'run': run, 'stage': name, 'seconds': time.perf_counter() - t0, 'peak_mb': None}
+            if tracing:
+                record['peak_mb'] = max(tracemalloc.get_traced_memory()[1] - start_memory, 0) / 2 ** 20
+            self.records.append(record)
+            logger.info(json.dumps(record))
+
+    def extend(self, records):
+        self.records.extend(records)
+
+    def stop(self):
+        """Stops tracemalloc if memory tracing was on."""
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def table(self):
+        return timing_table(self.records)
+
+
+def enable_timing_log(path=None):
+    """
+    Writes the stage records to stderr, or appends them to the file at path,
+    one JSON object per line. Calling it again does not add a second handler.
+    """
+    global _log_handler
+    if _log_handler is None:
+        _log_handler = logging.FileHandler(path) if path else logging.StreamHandler()
+        _log_handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(_log_handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def timed(timings, run, name):
+    """timings.stage(run, name), or a no-op when timings is None."""
+    if timings is None:
+        return nullcontext()
+    return timings.stage(run, name)
+
+
+def timing_table(records):
+    """Aggregates stage records into one row per stage, in pipeline order."""
+    columns = ['Stage', 'Runs', 'Total (s)', 'Mean (s)', 'Max (s)', 'Peak Memory (MB)', 'Share']
+    if not records:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.DataFrame(records)
+    table = df.groupby('stage').agg(
+        runs=('seconds', 'size'),
+        total=('seconds', 'sum'),
+        mean=('seconds', 'mean'),
+        longest=('seconds', 'max'),
+        peak=('peak_mb', 'max'),
+    )
+    table['share'] = table['total'] / table['total'].sum()
+    order = [stage for stage in STAGES if stage in table.index] + [stage for stage in table.index if stage not in STAGES]
+    table = table.loc[order].reset_index()
+    table.columns = columns
+    return table
+
+
+def profile_call(func, profiler='cProfile', limit=40):
+    """
+    Runs func() under a profiler and returns (result, text report).
+
+    cProfile ships with Python and reports the limit functions with the
+    highest cumulative time. pyinstrument gives a sampled call tree but has
+    to be installed separately.
+    """
+    if profiler == 'cProfile':
+        profile = cProfile.Profile()
+        result = profile.runcall(func)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(limit)
+        return result, out.getvalue()
+
+    if profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ValueError("pyinstrument is not installed, run `pip install pyinstrument` or use cProfile.")
+        profile = Profiler()
+        profile.start()
+        try:
+            result = func()
+        finally:
+            profile.stop()
+        return result, profile.output_text(unicode=True)
+
+    raise ValueError(f"Profiler '{profiler}' not supported.")
@@ -0,0 +1,121 @@
+import logging
+import numpy as np
+import pandas as pd
+
+# Logger of the strategies' order messages, silent unless enable_trade_log is called
+TRADE_LOGGER = 'backtest.trades'
+
+# Ledger events and sides
+CREATE, FILL, REJECT = 0, 1, 2
+BUY, SELL = 1, -1
+EVENT_NAMES = {CREATE: 'create', FILL: 'fill', REJECT: 'reject'}
+SIDE_NAMES = {BUY: 'buy', SELL: 'sell'}
+
+LEDGER_DTYPE = np.dtype([
+    ('date', 'datetime64[D]'),
+    ('event', 'i1'),
+    ('side', 'i1'),
+    ('size', 'f8'),
+    ('price', 'f8'),
+    ('commission', 'f8'),
+])
+
+_log_handler = None
+logging.getLogger(TRADE_LOGGER).setLevel(logging.WARNING)
+
+
+class TradeLedger:
+    """
+    Orders and fills of one run, appended to a preallocated NumPy structured
+    array (LEDGER_DTYPE) that doubles in size when full. Sizes are always
+    positive, side tells buys from sells. Picklable, so it comes back from
+    pool workers with the run's other results.
+    """
+
+    __slots__ = ('_rows', '_count')
+
+    def __init__(self, capacity=64):
+        self._rows = np.zeros(capacity, dtype=LEDGER_DTYPE)
+        self._count = 0
+
+    def add(self, date, event, side, size, price, commission=0.0):
+        if self._count == len(self._rows):
+            self._rows = np.concatenate([self._rows, np.zeros(len(self._rows), dtype=LEDGER_DTYPE)])
+        self._rows[self._count] = (np.datetime64(date, 'D'), event, side, size, price, commission)
+        self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def rows(self):
+        return self._rows[:self._count]
+
+    def fills(self):
+        rows = self.rows
+        return rows[rows['event'] == FILL]
+
+    def frame(self):
+        """The rows as a DataFrame with readable Event and Side columns."""
+        rows = self.rows
+        return pd.DataFrame({
+            'Date': pd.to_datetime(rows['date']),
+            'Event': [EVENT_NAMES[event] for event in rows['event']],
+            'Side': [SIDE_NAMES[side] for side in rows['side']],
+            'Size': rows['size'],
+            'Price': rows['price'],
+            'Commission': rows['commission'],
+        })
+
+
+def round_trips(ledger):
+    """
+    One row per closed trade of a long/flat run: each buy fill paired with
+    the sell fill that follows it. A position still open at the end is left
+    out. Returns a structured array with entry/exit dates and prices, size,
+    pnl after both commissions, return on the entry value and holding days.
+    """
+    fills = ledger.fills()
+    buys, sells = fills[fills['side'] == BUY], fills[fills['side'] == SELL]
+    n = len(sells)
+    buys = buys[:n]
+    trips = np.zeros(n, dtype=[('entry_date', 'datetime64[D]'), ('exit_date', 'datetime64[D]'), ('size', 'f8'),
+                               ('entry_price', 'f8'), ('exit_price', 'f8'), ('pnl', 'f8'), ('return', 'f8'),
+                               ('holding_days', 'i8')])
+    trips['entry_date'], trips['exit_date'] = buys['date'], sells['date']
+    trips['size'] = buys['size']
+    trips['entry_price'], trips['exit_price'] = buys['price'], sells['price']
+    trips['pnl'] = buys['size'] * (sells['price'] - buys['price']) - buys['commission'] - sells['commission']
+    trips['return'] = trips['pnl'] / (buys['size'] * buys['price'])
+    trips['holding_days'] = (sells['date'] - buys['date']).astype(np.int64)
+    return trips
+
+
+def trade_stats(ledger):
+    """Trade count, win rate, average trade return, average holding period and profit factor of a run."""
+    trips = round_trips(ledger)
+    pnl = trips['pnl']
+    gains, losses = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'Trades': len(trips),
+            'Win Rate': float((pnl > 0).mean()) if len(trips) else np.nan,
+            'Average Trade Return': float(trips['return'].mean()) if len(trips) else np.nan,
+            'Average Holding (days)': float(trips['holding_days'].mean()) if len(trips) else np.nan,
+            'Profit Factor': float(gains / losses) if len(trips) else np.nan,
+        }
+
+
+def enable_trade_log(level=logging.INFO):
+    """
+    Writes the strategies' order messages to stderr. They are off by default
+    and then cost one level check per order, nothing is formatted.
+    """
+    global _log_handler
+    logger = logging.getLogger(TRADE_LOGGER)
+    if _log_handler is None:
+        _log_handler = logging.StreamHandler()
+        _log_handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(_log_handler)
+        logger.propagate = False
+    logger.setLevel(level)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+PERIODS = 252
+METRICS = ['Sharpe Ratio', 'Sortino Ratio', 'Calmar Ratio', 'CAGR', 'Max Drawdown', 'Volatility', 'Total Return']
+
+
+def returns_matrix(returns_by_run):
+    """
+    Aligns {run: daily returns Series} into a dates x runs DataFrame, NaN on
+    the dates a run does not cover. Runs with no returns become all-NaN columns.
+    """
+    columns = {run: returns if returns is not None else pd.Series(dtype=float) for run, returns in returns_by_run.items()}
+    if not columns:
+        return pd.DataFrame()
+    return pd.concat(columns, axis=1).sort_index()
+
+
+def compute_metrics(returns, periods=PERIODS):
+    """
+    Performance metrics of every column of a dates x runs returns matrix, in
+    one NumPy pass. Returns a runs x METRICS DataFrame.
+
+    Each column matches what the quantstats function of the same name gives
+    for that run's own Series (qs.stats.sharpe, sortino, calmar, cagr,
+    max_drawdown, volatility and comp), to floating point tolerance: a
+    column's span runs from its first to its last non-NaN date, NaN or inf
+    inside the span counts as a zero return like quantstats' cleanup, and
+    dates outside it are ignored. Like quantstats, CAGR counts the years as
+    calendar days / periods. Metrics that divide by zero (no trades, no
+    drawdown, a single day) come out as inf or NaN instead of raising.
+    """
+    if isinstance(returns, pd.Series):
+        returns = returns.to_frame()
+    if returns.empty:
+        return pd.DataFrame(np.nan, index=returns.columns, columns=METRICS)
+
+    values = returns.to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    inside = (np.cumsum(valid, axis=0) > 0) & (np.cumsum(valid[::-1], axis=0)[::-1] > 0)
+    r = np.where(inside & np.isfinite(values), values, 0.0)
+    n = inside.sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = r.sum(axis=0) / n
+        deviation = np.where(inside, r - mean, 0.0)
+        std = np.sqrt((deviation ** 2).sum(axis=0) / (n - 1))
+        downside = np.sqrt((np.minimum(r, 0.0) ** 2).sum(axis=0) / n)
+
+        sharpe = mean / std * np.sqrt(periods)
+        sortino = mean / downside * np.sqrt(periods)
+        volatility = std * np.sqrt(periods)
+
+        # Compounded equity of each run, flat outside its span
+        wealth = np.cumprod(1.0 + r, axis=0)
+        total_return = wealth[-1] - 1.0
+
+        # The running peak starts at the first day's value, not at 1, like qs.stats.max_drawdown
+        peak = np.maximum.accumulate(np.where(inside, wealth, -np.inf), axis=0)
+        max_drawdown = np.where(inside, wealth / peak, np.inf).min(axis=0) - 1.0
+
+        first = inside.argmax(axis=0)
+        last = len(values) - 1 - inside[::-1].argmax(axis=0)
+        days = np.asarray((returns.index[last] - returns.index[first]).days, dtype=float)
+        years = days / periods
+        cagr = np.abs(total_return + 1.0) ** (1.0 / np.where(years > 0, years, np.nan)) - 1.0
+        calmar = cagr / np.abs(max_drawdown)
+
+    table = pd.DataFrame({
+        'Sharpe Ratio': sharpe,
+        'Sortino Ratio': sortino,
+        'Calmar Ratio': calmar,
+        'CAGR': cagr,
+        'Max Drawdown': max_drawdown,
+        'Volatility': volatility,
+        'Total Return': total_return,
+    }, index=returns.columns)
+
+    # Runs without any returns
+    table.loc[n == 0, :] = np.nan
+    return table
@@ -0,0 +1,282 @@
+import numpy as np
+import pandas as pd
+from backtest.instrumentation import timed
+from backtest.ledger import TradeLedger, CREATE, FILL, REJECT, BUY, SELL
+from backtest.vectorized import LEVERAGE, MULT, get_strategy_params, _buy, _sell
+from utils.data_handler import get_ohlcv, get_secondary_data, get_panel_indicators, build_indicator_params
+
+# How run_portfolio sizes a buy: "cash" like the strategies, position_size of
+# the cash not yet committed, or "equal" slots of position_size of the
+# portfolio value, one per asset (or per max_positions)
+ALLOCATIONS = ["cash", "equal"]
+
+
+class PricePanel:
+    """
+    Open and Close of many tickers on one shared calendar, as 2D arrays
+    (dates x tickers) with NaN where a ticker has no bar, plus the buy and
+    sell signal masks of a strategy. Nothing else of the tickers' frames is
+    kept.
+    """
+
+    __slots__ = ('dates', 'codes', 'open', 'close', 'buy', 'sell')
+
+    def __init__(self, dates, codes, open, close, buy, sell):
+        self.dates = dates
+        self.codes = codes
+        self.open = open
+        self.close = close
+        self.buy = buy
+        self.sell = sell
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ('open', 'close', 'buy', 'sell'))
+
+
+def load_panel(codes, start_date, end_date, strategy="Trend Change", strategy_params=None, provider=None, timings=None):
+    """
+    Loads every ticker onto the union of their dates and computes the
+    strategy's signals for all of them with one get_panel_indicators call,
+    like batch_runner.prepare_frames. Only the price columns of a ticker are
+    held until the panel is built, its frame is dropped as soon as it is
+    read. Returns (panel, errors keyed by ticker); panel is None when no
+    ticker loaded.
+    """
+    from strategies.trend_change import TrendStrategy
+    from strategies.rsi_diff import RSIDiffStrategy
+
+    if strategy == "Trend Change":
+        column = 'Direction'
+    elif strategy == "RSI Diff":
+        column = 'RSI_Diff'
+        threshold = get_strategy_params(RSIDiffStrategy, strategy_params)['rsi_diff_threshold']
+    else:
+        raise ValueError(f"Strategy '{strategy}' not supported by the portfolio engine.")
+    params = build_indicator_params(strategy_params)
+
+    loaded, errors = {}, {}
+    for code in dict.fromkeys(code.strip() for code in codes):
+        try:
+            with timed(timings, code, 'load'):
+                df = get_ohlcv(code, start_date, end_date, provider=provider)
+        except Exception as e:
+            errors[code] = str(e)
+            continue
+        if df.empty:
+            errors[code] = f"No data for {code}."
+            continue
+        loaded[code] = (df.index.values, {name: df[name].to_numpy(dtype=float) for name in ('Open', 'High', 'Low', 'Close')})
+    if not loaded:
+        return None, errors
+
+    dates = pd.DatetimeIndex(np.unique(np.concatenate([index for index, _ in loaded.values()])))
+    codes = list(loaded)
+    shape = (len(dates), len(codes))
+    panel = {name: np.full(shape, np.nan) for name in ('Open', 'High', 'Low', 'Close')}
+    signal = np.full(shape, np.nan)
+    contiguous = []
+    for j, code in enumerate(codes):
+        index, columns = loaded.pop(code)
+        pos = dates.get_indexer(index)
+        for name, values in columns.items():
+            panel[name][pos, j] = values
+        if pos[-1] - pos[0] + 1 == len(pos):
+            contiguous.append(j)
+        else:
+            # Another exchange's holidays: its indicators need its own bars only
+            with timed(timings, code, 'indicators'):
+                df = get_secondary_data(pd.DataFrame(columns, index=index), params, lines=[column])
+            signal[pos, j] = df[column].to_numpy(dtype=float)
+
+    if contiguous:
+        with timed(timings, 'portfolio', 'indicators'):
+            indicators = get_panel_indicators(panel['High'][:, contiguous], panel['Low'][:, contiguous],
+                                              panel['Close'][:, contiguous], params, [column])
+        signal[:, contiguous] = indicators[column]
+        del indicators
+
+    listed = ~np.isnan(panel['Close'])
+    buy = np.zeros(shape, dtype=bool)
+    sell = np.zeros(shape, dtype=bool)
+    if strategy == "Trend Change":
+        # TrendStrategy acts on the bars where a ticker's direction changes, counted on its own bars
+        for j in range(len(codes)):
+            rows = np.flatnonzero(listed[:, j])
+            directions = signal[rows, j]
+            change = np.concatenate(([True], directions[1:] != directions[:-1]))
+            buy[rows[change & (directions == 1)], j] = True
+            sell[rows[change & (directions == -1)], j] = True
+    else:
+        with np.errstate(invalid='ignore'):
+            buy[:] = signal > threshold
+            sell[:] = signal < -threshold
+
+    return PricePanel(dates, codes, panel['Open'], panel['Close'], buy, sell), errors
+
+
+def simulate_portfolio(panel, initial_cash=100000, commission=0.001, position_size=0.8, allocation="cash", max_positions=None):
+    """
+    Runs the long/flat signals of every ticker of panel against one shared
+    broker.
+
+    Each bar is stepped like backtrader steps a strategy with several
+    feeds: the orders of the previous bar fill at this bar's open (sells
+    first, so their cash pays for the buys, then buys in ticker order and
+    rejected if the cash no longer covers them), the book is valued at the
+    close, then the close's signals create new orders. A buy is sized by
+    allocation (see ALLOCATIONS) from the cash not already committed to
+    pending buys, and with max_positions no buy is created while that many
+    tickers are held or being bought. An order waits for its ticker's next
+    bar. Fills, commission and valuation are the ones of the vectorized
+    engine, so a single ticker with allocation="cash" gives run_vectorized's
+    returns.
+
+    Returns (values, contributions, ledgers): the broker value at every
+    close, each ticker's profit on every bar as a share of the previous
+    bar's value (the rows sum to the portfolio return), and a TradeLedger
+    per ticker.
+    """
+    if allocation not in ALLOCATIONS:
+        raise ValueError(f"Allocation '{allocation}' not supported.")
+    n_bars, n_assets = panel.close.shape
+    slots = max_positions or n_assets
+    dates = panel.dates.values.astype('datetime64[D]')
+    opens, closes = panel.open, panel.close
+    # Unlisted bars are valued at the last close, bars before the listing hold nothing
+    marks = pd.DataFrame(closes).ffill().to_numpy()
+    listed = ~np.isnan(closes)
+    # Last bar of every ticker, no order is created on it since nothing could fill it
+    last_bars = n_bars - 1 - np.argmax(listed[::-1], axis=0)
+
+    cash = float(initial_cash)
+    sizes = np.zeros(n_assets)
+    entry_prices = np.zeros(n_assets)
+    pending = {}  # ticker -> (side, size, creation price)
+    ledgers = [TradeLedger() for _ in range(n_assets)]
+    fills = []  # (bar, ticker, size after, entry price, cash flow, cash after)
+
+    # Only bars with a signal or an order to fill need stepping
+    active = np.flatnonzero((panel.buy | panel.sell).any(axis=1)).tolist()
+    cursor = 0
+    t = active[0] if active else n_bars
+    while t < n_bars:
+        if pending:
+            due = [j for j in pending if listed[t, j]]
+            for j in sorted(due, key=lambda j: (pending[j][0] == BUY, j)):
+                side, size, _ = pending.pop(j)
+                price = opens[t, j]
+                if side == SELL:
+                    cash_after = _sell(cash, size, entry_prices[j], price, commission)
+                    sizes[j] = entry_prices[j] = 0.0
+                else:
+                    cash_after = _buy(cash, size, price, commission)
+                    if cash_after is None:
+                        ledgers[j].add(dates[t], REJECT, side, size, price)
+                        continue
+                    sizes[j], entry_prices[j] = size, price
+                ledgers[j].add(dates[t], FILL, side, size, price, size * price * commission)
+                fills.append((t, j, sizes[j], entry_prices[j], cash_after - cash, cash_after))
+                cash = cash_after
+
+        if t + 1 < n_bars:
+            _create_orders(t, panel, closes, marks, dates, cash, sizes, entry_prices, pending, ledgers, last_bars,
+                           commission, position_size, allocation, slots)
+
+        # Next bar with a signal, or the next one if an order waits for it
+        while cursor < len(active) and active[cursor] <= t:
+            cursor += 1
+        t = min(t + 1 if pending else n_bars, active[cursor] if cursor < len(active) else n_bars)
+
+    # Holdings only change on fill bars, everything else is array operations
+    held = np.full((n_bars, n_assets), np.nan)
+    entries = np.full((n_bars, n_assets), np.nan)
+    cash_steps = np.full(n_bars, np.nan)
+    for t, j, size, entry_price, _, cash_after in fills:
+        held[t, j], entries[t, j] = size, entry_price
+        cash_steps[t] = cash_after
+    held = pd.DataFrame(held).ffill().fillna(0.0).to_numpy()
+    entries = pd.DataFrame(entries).ffill().fillna(0.0).to_numpy()
+    cash_steps = pd.Series(cash_steps).ffill().fillna(float(initial_cash)).to_numpy()
+
+    position_values = _position_values(held, marks, entries)
+    del held, entries, marks
+    values = cash_steps + position_values.sum(axis=1)
+
+    previous_values = np.empty(n_bars)
+    previous_values[0] = initial_cash
+    previous_values[1:] = values[:-1]
+    # A ticker's profit is the change in its position value plus the cash its fills paid or took in
+    contributions = position_values
+    contributions[1:] -= position_values[:-1]
+    if fills:
+        bars, tickers, _, _, cash_flows, _ = zip(*fills)
+        np.add.at(contributions, (list(bars), list(tickers)), cash_flows)
+    contributions /= previous_values[:, None]
+    return values, contributions, ledgers
+
+
+def _position_values(sizes, marks, entry_prices):
+    """Value of long positions, with the same operation order as BackBroker._get_value when unlevered."""
+    unrealized = sizes * (marks - entry_prices) * MULT
+    return np.where(sizes > 0, (sizes * marks - unrealized) / LEVERAGE + unrealized, 0.0)
+
+
+def _create_orders(t, panel, closes, marks, dates, cash, sizes, entry_prices, pending, ledgers, last_bars,
+                   commission, position_size, allocation, slots):
+    """The orders of the signals at the close of bar t, added to pending and the ledgers."""
+    open_tickers = last_bars > t
+    for j in np.flatnonzero(panel.sell[t] & (sizes > 0) & open_tickers).tolist():
+        if j not in pending:
+            pending[j] = (SELL, sizes[j], closes[t, j])
+            ledgers[j].add(dates[t], CREATE, SELL, sizes[j], closes[t, j])
+
+    buys = np.flatnonzero(panel.buy[t] & (sizes == 0) & open_tickers).tolist()
+    if not buys:
+        return
+    committed = sum(size * price * (1 + commission) for side, size, price in pending.values() if side == BUY)
+    positions = np.count_nonzero(sizes) + sum(side == BUY for side, _, _ in pending.values())
+    if allocation == "equal":
+        value = cash + _position_values(sizes, marks[t], entry_prices).sum()
+    for j in buys:
+        if j in pending or positions >= slots:
+            continue
+        available = cash - committed
+        price = closes[t, j]
+        if allocation == "cash":
+            size = int(available * position_size / price)
+        else:
+            size = int(min(value * position_size / slots, available) / price)
+        # Checked against the creation price when submitted
+        if not size or _buy(available, size, price, commission) is None:
+            continue
+        pending[j] = (BUY, size, price)
+        ledgers[j].add(dates[t], CREATE, BUY, size, price)
+        committed += size * price * (1 + commission)
+        positions += 1
+
+
+def run_panel(panel, initial_cash=100000, commission=0.001, strategy="Trend Change", strategy_params=None,
+              allocation="cash", max_positions=None):
+    """
+    simulate_portfolio with the strategy's position_size, as (returns,
+    asset_returns, ledgers): the portfolio's daily returns in the format
+    of run_vectorized, the per-ticker contributions to them as a DataFrame
+    with the same index, and the ledgers keyed by ticker.
+    """
+    from strategies.trend_change import TrendStrategy
+    from strategies.rsi_diff import RSIDiffStrategy
+
+    strategy_class = {"Trend Change": TrendStrategy, "RSI Diff": RSIDiffStrategy}.get(strategy)
+    if strategy_class is None:
+        raise ValueError(f"Strategy '{strategy}' not supported by the portfolio engine.")
+    position_size = get_strategy_params(strategy_class, strategy_params)['position_size']
+    values, contributions, ledgers = simulate_portfolio(panel, initial_cash, commission, position_size, allocation, max_positions)
+
+    previous = np.empty_like(values)
+    previous[0] = initial_cash
+    previous[1:] = values[:-1]
+    index = pd.DatetimeIndex(panel.dates, name='index').tz_localize('UTC')
+    returns = pd.Series(values / previous - 1.0, index=index, name='return')
+    asset_returns = pd.DataFrame(contributions, index=index, columns=panel.codes)
+    return returns, asset_returns, dict(zip(panel.codes, ledgers))
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+import numpy as np
+from utils.config import RESULT_CACHE_PARAMS
+
+# Bump when a change to the engines or indicators alters the returns they produce
+CACHE_FORMAT_VERSION = 1
+
+
+def data_version(prices):
+    """
+    Digest of the price bars a backtest reads. Any newly ingested or
+    corrected bar in the range changes it, which invalidates the results
+    computed from the old bars.
+    """
+    digest = hashlib.sha1()
+    digest.update(prices.index.to_numpy(dtype='datetime64[ns]').view(np.int64).tobytes())
+    for column in ['Open', 'High', 'Low', 'Close', 'Volume']:
+        digest.update(np.ascontiguousarray(prices[column].to_numpy(dtype=float)).tobytes())
+    return digest.hexdigest()
+
+
+def _json_default(value):
+    # NumPy scalars from the optimizer grids
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class ResultCache:
+    """
+    Content-addressed cache of backtest returns.
+
+    Keys are a hash of every backtest input plus the data_version of the
+    prices, so identical reruns are served from the cache and new bars
+    never return a stale result. Recently used results are kept in an
+    in-memory LRU of max_entries; with a cache_dir they are also pickled to
+    disk, where the least recently used files are deleted once the
+    directory grows past max_disk_bytes.
+
+    stats counts memory hits, disk hits and misses. Safe to share between
+    the threads of the optimizer.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=256, max_disk_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, code, start_date, end_date, initial_cash, commission, strategy, strategy_params, engine, version):
+        inputs = {
+            'format': CACHE_FORMAT_VERSION,
+            'code': code,
+            'start_date': start_date,
+            'end_date': end_date,
+            'initial_cash': initial_cash,
+            'commission': commission,
+            'strategy': strategy,
+            'strategy_params': strategy_params or {},
+            'engine': engine,
+            'data_version': version,
+        }
+        payload = json.dumps(inputs, sort_keys=True, default=_json_default)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        """Returns the cached returns for key, or None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return self._memory[key].copy()
+
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    returns = pickle.load(f)
+                os.utime(path)  # mark as recently used for eviction
+            except (OSError, EOFError, pickle.UnpicklingError):
+                returns = None
+            if returns is not None:
+                with self._lock:
+                    self._remember(key, returns)
+                    self.stats['disk_hits'] += 1
+                return returns.copy()
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key, returns):
+        with self._lock:
+            self._remember(key, returns.copy())
+
+        if self.cache_dir:
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(returns, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+
+    def _remember(self, key, returns):
+        self._memory[key] = returns
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        # Oldest first
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.cache_dir:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.pkl'):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+
+_default_result_cache = None
+
+
+def get_default_result_cache():
+    """Returns the process-wide cache configured by RESULT_CACHE_PARAMS, or None if disabled."""
+    global _default_result_cache
+    if _default_result_cache is None:
+        if not RESULT_CACHE_PARAMS['enabled']:
+            return None
+        _default_result_cache = ResultCache(
+            RESULT_CACHE_PARAMS['cache_dir'],
+            RESULT_CACHE_PARAMS['max_entries'],
+            RESULT_CACHE_PARAMS['max_disk_bytes'],
+        )
+    return _default_result_cache
+
+
+def set_default_result_cache(cache):
+    global _default_result_cache
+    _default_result_cache = cache
@@ -0,0 +1,263 @@
+import itertools
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from backtest.backtest_runner import run_backtest
+from backtest.metrics import compute_metrics
+
+# Parameter values the optimizer searches, per strategy
+SEARCH_SPACES = {
+    "Trend Change": {
+        'atr_window': list(range(5, 51, 5)),
+        'atr_multiplier': np.arange(1.0, 5.1, 0.5).tolist(),
+    },
+    "RSI Diff": {
+        'rsi_short': list(range(3, 21, 2)),
+        'rsi_long': list(range(20, 51, 5)),
+    },
+}
+
+
+def grid(space):
+    """Every combination of the values in space, as parameter dicts."""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*space.values())]
+
+
+def window_start(start_date, end_date, window):
+    """Start of the most recent window (a fraction) of the start_date..end_date range."""
+    if window >= 1:
+        return start_date
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    return (end - (end - start) * window).strftime('%Y-%m-%d')
+
+
+def backtest_objective(code, start_date, end_date, initial_cash=100000, commission=0.001, strategy="Trend Change",
+                       strategy_params=None, engine="backtrader", provider=None, indicator_cache=None, result_cache=None):
+    """
+    objective(params, window=1.0) for the searches: the Sharpe ratio of a
+    backtest of code with strategy_params overridden by params, over the
+    most recent window (a fraction) of the date range. Failed runs score NaN.
+    """
+    def objective(params, window=1.0):
+        try:
+            returns, _ = run_backtest(code, window_start(start_date, end_date, window), end_date, initial_cash, commission,
+                                      strategy, {**(strategy_params or {}), **params}, provider, engine, indicator_cache, result_cache)
+        except Exception:
+            return float('nan')
+        if returns is None or returns.empty:
+            return float('nan')
+        return float(compute_metrics(returns)['Sharpe Ratio'].iloc[0])
+    return objective
+
+
+class SearchLog:
+    """
+    Evaluations of one search and the budget they are counted against.
+
+    cost counts evaluations in full-window equivalents, so a successive
+    halving run on a third of the history costs a third. The search is
+    exhausted once cost reaches max_evaluations, max_seconds have passed,
+    or, with patience, that many full-window evaluations in a row did not
+    improve on the best score. callback(log) is called after every
+    evaluation, in the thread running the search.
+    """
+
+    def __init__(self, objective, max_evaluations=None, max_seconds=None, patience=None, max_workers=1, callback=None):
+        self.objective = objective
+        self.max_evaluations = max_evaluations
+        self.max_seconds = max_seconds
+        self.patience = patience
+        self.max_workers = max_workers
+        self.callback = callback
+        self.history = []
+        self.cost = 0.0
+        self.stop_reason = None
+        self._best_score = -math.inf
+        self._since_best = 0
+        self._start = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self._start
+
+    @property
+    def exhausted(self):
+        if self.stop_reason is None:
+            if self.max_evaluations is not None and self.cost >= self.max_evaluations - 1e-9:
+                self.stop_reason = 'budget'
+            elif self.max_seconds is not None and self.seconds >= self.max_seconds:
+                self.stop_reason = 'time'
+            elif self.patience is not None and self._since_best >= self.patience:
+                self.stop_reason = 'patience'
+        return self.stop_reason is not None
+
+    def evaluate_many(self, candidates, window=1.0):
+        """
+        Scores the candidates on window, max_workers at a time, until the
+        search is exhausted. Returns their scores in order, NaN for the
+        candidates left out.
+        """
+        scores = [float('nan')] * len(candidates)
+        executor = ThreadPoolExecutor(self.max_workers) if self.max_workers > 1 else None
+        try:
+            i = 0
+            while i < len(candidates) and not self.exhausted:
+                # Never start more runs than the budget has left
+                size = self.max_workers
+                if self.max_evaluations is not None:
+                    size = min(size, max(1, int((self.max_evaluations - self.cost + 1e-9) / window)))
+                chunk = candidates[i:i + size]
+                if executor is None:
+                    chunk_scores = [self.objective(params, window) for params in chunk]
+                else:
+                    chunk_scores = list(executor.map(lambda params: self.objective(params, window), chunk))
+                for params, score in zip(chunk, chunk_scores):
+                    self._record(params, window, score)
+                scores[i:i + len(chunk)] = chunk_scores
+                i += len(chunk)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return scores
+
+    def _record(self, params, window, score):
+        self.cost += window
+        self.history.append({'params': params, 'window': window, 'score': score, 'cost': self.cost, 'seconds': self.seconds})
+        if window >= 1:
+            if score > self._best_score:
+                self._best_score = score
+                self._since_best = 0
+            else:
+                self._since_best += 1
+        if self.callback is not None:
+            self.callback(self)
+
+    def best(self):
+        """
+        (params, score, entry) of the best full-window evaluation, or of the
+        widest window evaluated if the search stopped before any full one.
+        None if nothing has a score.
+        """
+        scored = [entry for entry in self.history if not np.isnan(entry['score'])]
+        if not scored:
+            return None
+        widest = max(entry['window'] for entry in scored)
+        entry = max((entry for entry in scored if entry['window'] == widest), key=lambda entry: entry['score'])
+        return entry['params'], entry['score'], entry
+
+    def frame(self):
+        """One row per evaluation: the parameters, Window, Sharpe Ratio, Cost and Seconds (both cumulative)."""
+        return pd.DataFrame([{**entry['params'], 'Window': entry['window'], 'Sharpe Ratio': entry['score'],
+                              'Cost': entry['cost'], 'Seconds': entry['seconds']} for entry in self.history])
+
+
+def grid_search(space, log, rng):
+    """Every combination, in order."""
+    log.evaluate_many(grid(space))
+
+
+def random_search(space, log, rng):
+    """Combinations in a random order, without repeats."""
+    candidates = grid(space)
+    log.evaluate_many([candidates[i] for i in rng.permutation(len(candidates))])
+
+
+def successive_halving(space, log, rng, eta=3, min_window=1 / 9):
+    """
+    Scores a random sample of combinations on the most recent min_window of
+    the history, keeps the best 1/eta of them and scores those on an eta
+    times longer window, until the survivors run on the full history. With
+    a budget, the sample is sized so all rungs fit in it.
+    """
+    candidates = grid(space)
+    candidates = [candidates[i] for i in rng.permutation(len(candidates))]
+    rungs = round(math.log(1 / min_window, eta)) + 1
+    if log.max_evaluations is not None:
+        # Each rung costs about len(sample) * min_window
+        sample = int(log.max_evaluations / (rungs * min_window))
+        candidates = candidates[:max(sample, eta ** (rungs - 1), 1)]
+
+    window = min_window
+    while True:
+        scores = log.evaluate_many(candidates, window)
+        if window >= 1 or log.exhausted:
+            return
+        keep = max(1, len(candidates) // eta)
+        order = np.argsort(-np.nan_to_num(np.asarray(scores), nan=-np.inf), kind='stable')
+        candidates = [candidates[i] for i in order[:keep]]
+        # A single survivor has nothing left to race against
+        window = 1.0 if keep == 1 else min(1.0, window * eta)
+
+
+def tpe_search(space, log, rng, n_startup=10, gamma=0.25, n_samples=24):
+    """
+    Tree-structured Parzen estimator over the grid. After n_startup random
+    combinations, the scored ones are split into the best gamma and the
+    rest, each parameter gets a smoothed density over its values for both
+    groups, and the next combination is the one of n_samples drawn from the
+    good densities with the highest good/bad density ratio.
+    """
+    names = list(space)
+    values = [list(space[name]) for name in names]
+    candidates = {tuple(params.values()): params for params in grid(space)}
+    seen = set()
+
+    def density(observed, n_values):
+        # Gaussian kernel of one value on the index of every observation, plus a flat prior
+        positions = np.arange(n_values)
+        weights = np.full(n_values, 1.0 / n_values)
+        for index in observed:
+            weights += np.exp(-0.5 * (positions - index) ** 2)
+        return weights / weights.sum()
+
+    while not log.exhausted and len(seen) < len(candidates):
+        done = [(tuple(entry['params'].values()), entry['score']) for entry in log.history if entry['window'] >= 1]
+        unseen = [key for key in candidates if key not in seen]
+        if len(done) < n_startup:
+            key = unseen[rng.integers(len(unseen))]
+        else:
+            done.sort(key=lambda item: -np.inf if np.isnan(item[1]) else item[1], reverse=True)
+            n_good = max(1, math.ceil(gamma * len(done)))
+            good, bad = done[:n_good], done[n_good:]
+            good_density, bad_density = [], []
+            for d, dimension in enumerate(values):
+                good_density.append(density([dimension.index(key[d]) for key, _ in good], len(dimension)))
+                bad_density.append(density([dimension.index(key[d]) for key, _ in bad], len(dimension)))
+
+            draws = np.column_stack([rng.choice(len(dimension), n_samples, p=good_density[d]) for d, dimension in enumerate(values)])
+            ratio = np.prod([good_density[d][draws[:, d]] / bad_density[d][draws[:, d]] for d in range(len(values))], axis=0)
+            key = None
+            for i in np.argsort(-ratio, kind='stable'):
+                draw = tuple(values[d][draws[i, d]] for d in range(len(values)))
+                if draw not in seen:
+                    key = draw
+                    break
+            if key is None:
+                key = unseen[rng.integers(len(unseen))]
+        seen.add(key)
+        log.evaluate_many([candidates[key]])
+
+
+SEARCH_METHODS = {
+    "Grid": grid_search,
+    "Random": random_search,
+    "Successive Halving": successive_halving,
+    "TPE": tpe_search,
+}
+
+
+def search(method, space, objective, max_evaluations=None, max_seconds=None, patience=None, seed=0, max_workers=1, callback=None):
+    """
+    Runs one of SEARCH_METHODS over space, maximizing objective(params,
+    window), and returns its SearchLog. The budget, early stopping and
+    callback are described on SearchLog.
+    """
+    search_method = SEARCH_METHODS.get(method)
+    if not search_method:
+        raise ValueError(f"Search method '{method}' not supported.")
+    log = SearchLog(objective, max_evaluations, max_seconds, patience, max_workers, callback)
+    search_method(space, log, np.random.default_rng(seed))
+    return log
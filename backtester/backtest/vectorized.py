@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from backtest.ledger import TradeLedger, CREATE, FILL, BUY, SELL
+from utils.data_handler import frame_dates
+
+# Broker settings the backtrader path runs with (BackBroker defaults)
+LEVERAGE = 1.0
+MULT = 1.0
+
+
+def get_strategy_params(strategy_class, strategy_params=None):
+    """Strategy class defaults overridden by strategy_params, like cerebro.addstrategy."""
+    params = dict(strategy_class.params._getpairs())
+    params.update(strategy_params or {})
+    return params
+
+
+def run_vectorized(df, strategy="Trend Change", initial_cash=100000, commission=0.001, strategy_params=None):
+    """
+    NumPy fast path for the long/flat strategies.
+
+    Mirrors what backtrader does for TrendStrategy and RSIDiffStrategy: the
+    order is created on a signal bar at that bar's close, sized from the
+    available cash, and filled at the next bar's open with a percentage
+    commission. Signals are turned into a short list of fills, so only the
+    trades are stepped in Python and the equity curve is built with array
+    operations. Returns the same daily returns series as the PyFolio
+    analyzer of the backtrader path.
+    """
+    closes = df['Close'].to_numpy(dtype=float)
+    fills = _strategy_fills(df, strategy, initial_cash, commission, strategy_params)
+    values = _portfolio_values(fills, closes, initial_cash)
+
+    previous = np.empty_like(values)
+    previous[0] = initial_cash
+    previous[1:] = values[:-1]
+    returns = values / previous - 1.0
+
+    index = pd.DatetimeIndex(pd.to_datetime(frame_dates(df)), name='index').tz_localize('UTC')
+    return pd.Series(returns, index=index, name='return').dropna()
+
+
+def run_ledger(df, strategy="Trend Change", initial_cash=100000, commission=0.001, strategy_params=None):
+    """
+    TradeLedger of the run_vectorized run. Its fills are the ones the
+    backtrader strategies record; every order is created on the bar
+    before its fill, at that bar's close. Orders backtrader would reject
+    are not recorded.
+    """
+    opens = df['Open'].to_numpy(dtype=float)
+    closes = df['Close'].to_numpy(dtype=float)
+    dates = pd.to_datetime(frame_dates(df)).to_numpy()
+    ledger = TradeLedger()
+    size = 0
+    for fill_bar, fill_size, _, _ in _strategy_fills(df, strategy, initial_cash, commission, strategy_params):
+        side = BUY if fill_size else SELL
+        size = fill_size or size
+        ledger.add(dates[fill_bar - 1], CREATE, side, size, closes[fill_bar - 1])
+        ledger.add(dates[fill_bar], FILL, side, size, opens[fill_bar], size * opens[fill_bar] * commission)
+    return ledger
+
+
+def _strategy_fills(df, strategy, initial_cash, commission, strategy_params):
+    # The strategy defaults live on the backtrader classes, only loaded once something runs
+    from strategies.trend_change import TrendStrategy
+    from strategies.rsi_diff import RSIDiffStrategy
+
+    opens = df['Open'].to_numpy(dtype=float)
+    closes = df['Close'].to_numpy(dtype=float)
+
+    if strategy == "Trend Change":
+        params = get_strategy_params(TrendStrategy, strategy_params)
+        return _trend_fills(df['Direction'].to_numpy(), opens, closes, initial_cash, commission, params['position_size'])
+    if strategy == "RSI Diff":
+        params = get_strategy_params(RSIDiffStrategy, strategy_params)
+        return _rsi_diff_fills(df['RSI_Diff'].to_numpy(dtype=float), opens, closes, initial_cash, commission,
+                               params['position_size'], params['rsi_diff_threshold'])
+    raise ValueError(f"Strategy '{strategy}' not supported by the vectorized engine.")
+
+
+def _buy(cash, size, price, commission):
+    """Cash left after buying size at price, or None if backtrader would reject it for margin."""
+    cash = cash - abs(size) * price / LEVERAGE
+    cash = cash - abs(size) * commission * price
+    return cash if cash >= 0.0 else None
+
+
+def _sell(cash, size, entry_price, price, commission):
+    closed_cash = abs(size) * entry_price / LEVERAGE
+    pnl = size * (price - entry_price) * MULT
+    cash += closed_cash + pnl
+    return cash - abs(size) * commission * price
+
+
+def _try_entry(t, cash, opens, closes, commission, position_size):
+    """Buy signal on bar t, filled on bar t + 1. Returns (fill bar, size, price, cash) or None."""
+    if t + 1 >= len(closes):
+        return None
+    size = int(cash * position_size / closes[t])
+    if not size:
+        return None
+    # Checked against the creation price when submitted, then at the fill price
+    if _buy(cash, size, closes[t], commission) is None:
+        return None
+    cash_after = _buy(cash, size, opens[t + 1], commission)
+    if cash_after is None:
+        return None
+    return t + 1, size, opens[t + 1], cash_after
+
+
+def _trend_fills(directions, opens, closes, initial_cash, commission, position_size):
+    # TrendStrategy only acts on bars where the direction changes
+    changes = np.flatnonzero(np.concatenate(([True], directions[1:] != directions[:-1])))
+
+    fills = []
+    cash = initial_cash
+    size = entry_price = None
+    for t in changes.tolist():
+        if directions[t] == 1 and size is None:
+            entry = _try_entry(t, cash, opens, closes, commission, position_size)
+            if entry is not None:
+                fill_bar, size, entry_price, cash = entry
+                fills.append((fill_bar, size, entry_price, cash))
+        elif directions[t] == -1 and size is not None and t + 1 < len(closes):
+            cash = _sell(cash, size, entry_price, opens[t + 1], commission)
+            fills.append((t + 1, 0, 0.0, cash))
+            size = entry_price = None
+    return fills
+
+
+def _rsi_diff_fills(rsi_diff, opens, closes, initial_cash, commission, position_size, threshold):
+    # NaN compares False, exactly like the strategy's checks
+    with np.errstate(invalid='ignore'):
+        buy_bars = np.flatnonzero(rsi_diff > threshold)
+        sell_bars = np.flatnonzero(rsi_diff < -threshold)
+
+    fills = []
+    cash = initial_cash
+    t = 0
+    n = len(closes)
+    while t < n:
+        # Flat: first buy signal from bar t on
+        i = np.searchsorted(buy_bars, t)
+        if i == len(buy_bars):
+            break
+        t = int(buy_bars[i])
+        entry = _try_entry(t, cash, opens, closes, commission, position_size)
+        if entry is None:
+            t += 1
+            continue
+        fill_bar, size, entry_price, cash = entry
+        fills.append((fill_bar, size, entry_price, cash))
+
+        # Long: first sell signal from the fill bar on
+        j = np.searchsorted(sell_bars, fill_bar)
+        if j == len(sell_bars) or sell_bars[j] + 1 >= n:
+            break
+        t = int(sell_bars[j])
+        cash = _sell(cash, size, entry_price, opens[t + 1], commission)
+        fills.append((t + 1, 0, 0.0, cash))
+        t += 1
+    return fills
+
+
+def _portfolio_values(fills, closes, initial_cash):
+    """Broker value per bar: cash plus the long position marked at the close."""
+    n = len(closes)
+    cash = np.full(n, float(initial_cash))
+    sizes = np.zeros(n)
+    entry_prices = np.zeros(n)
+    for fill_bar, size, entry_price, cash_after in fills:
+        cash[fill_bar:] = cash_after
+        sizes[fill_bar:] = size
+        entry_prices[fill_bar:] = entry_price
+
+    # Same operation order as BackBroker._get_value for an unlevered long
+    unrealized = sizes * (closes - entry_prices) * MULT
+    position_value = (sizes * closes - unrealized) / LEVERAGE + unrealized
+    return cash + np.where(sizes > 0, position_value, 0.0)
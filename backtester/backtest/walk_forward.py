@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from backtest.backtest_runner import run_strategy, strategy_lines
+from backtest.instrumentation import timed
+from backtest.metrics import METRICS, compute_metrics, returns_matrix
+from backtest.search import grid
+from utils.data_handler import build_indicator_params
+from utils.indicator_cache import IndicatorCache
+
+# Bars that only feed the indicators before the first fold, like the 100 days get_ohlcv fetches before start_date
+WARMUP_BARS = 100
+
+
+def make_folds(n_bars, train_bars, test_bars, anchored=False, warmup_bars=WARMUP_BARS):
+    """
+    (train_start, test_start, test_end) bar positions of the walk-forward
+    folds over n_bars bars. Train is [train_start, test_start) and test is
+    [test_start, test_end); the test windows follow each other without
+    overlap, the last one may be shorter. Rolling folds train on the
+    train_bars before their test window, anchored ones on everything since
+    the warm-up.
+    """
+    folds = []
+    test_start = warmup_bars + train_bars
+    while test_start < n_bars:
+        test_end = min(test_start + test_bars, n_bars)
+        train_start = warmup_bars if anchored else test_start - train_bars
+        folds.append((train_start, test_start, test_end))
+        test_start = test_end
+    return folds
+
+
+def _run_fold(fold, frames, test_start, initial_cash, commission, strategy, engine):
+    """
+    Worker entry point: picks the candidate with the best Sharpe ratio on the
+    train bars of frames (one fold's slice per candidate, with the
+    indicators already computed on the full history) and runs it on the test
+    bars. Both runs start flat with initial_cash.
+    """
+    train_returns, errors = {}, {}
+    for i, (params, df) in enumerate(frames):
+        try:
+            train_returns[i], _ = run_strategy(df.iloc[:test_start], initial_cash, commission, strategy, params, engine)
+        except Exception as e:
+            errors[i] = str(e)
+    if not train_returns:
+        return {'fold': fold, 'params': None, 'train_sharpe': float('nan'), 'returns': None,
+                'error': next(iter(errors.values()), "No candidates.")}
+
+    train_sharpe = compute_metrics(returns_matrix(train_returns))['Sharpe Ratio']
+    best = train_sharpe.fillna(-float('inf')).idxmax()
+    params, df = frames[best]
+    result = {'fold': fold, 'params': params, 'train_sharpe': train_sharpe[best], 'returns': None, 'error': None}
+    try:
+        result['returns'], _ = run_strategy(df.iloc[test_start:], initial_cash, commission, strategy, params, engine)
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def walk_forward(code, start_date, end_date, initial_cash=100000, commission=0.001, strategy="Trend Change",
+                 strategy_params=None, space=None, train_bars=504, test_bars=126, anchored=False,
+                 warmup_bars=WARMUP_BARS, engine="vectorized", provider=None, max_workers=None, timings=None):
+    """
+    Walk-forward validation of strategy on code.
+
+    The indicators are computed once over the whole history for every
+    candidate (strategy_params, overridden by each combination of space if
+    given) and the folds are slices of those frames, so no fold loads prices
+    or recomputes an indicator. Slicing the full-history frames also warms
+    the indicators of every fold up with the bars before it; the first
+    warmup_bars bars only serve that purpose. In each fold the candidate with
+    the best train Sharpe ratio is run on the test window, folds in parallel
+    across max_workers processes.
+
+    Returns a dict with 'folds' (one row per fold: its dates, the chosen
+    parameters, the train Sharpe ratio and the test METRICS), 'returns' (the
+    test returns of all folds stitched together) and 'metrics' (METRICS of
+    the stitched out-of-sample returns).
+    """
+    candidates = [{**(strategy_params or {}), **params} for params in (grid(space) if space else [{}])]
+
+    indicator_cache = IndicatorCache(provider)
+    with timed(timings, code, 'load'):
+        prices = indicator_cache.prices(code, start_date, end_date)
+    with timed(timings, code, 'indicators'):
+        lines = strategy_lines(strategy)
+        frames = [(params, indicator_cache.get_secondary_data(code, start_date, end_date, build_indicator_params(params), lines))
+                  for params in candidates]
+
+    folds = make_folds(len(prices), train_bars, test_bars, anchored, warmup_bars)
+    if not folds:
+        raise ValueError(f"{len(prices)} bars of {code} are not enough for {warmup_bars} warm-up and {train_bars} train bars.")
+
+    strategy_args = (initial_cash, commission, strategy, engine)
+    tasks = [(number, [(params, df.iloc[train_start:test_end]) for params, df in frames], test_start - train_start)
+             for number, (train_start, test_start, test_end) in enumerate(folds, start=1)]
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(tasks)))
+    with timed(timings, code, 'run'):
+        if max_workers == 1:
+            results = [_run_fold(*task, *strategy_args) for task in tasks]
+        else:
+            # spawn avoids forking the threads of the Streamlit server
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+                futures = [executor.submit(_run_fold, *task, *strategy_args) for task in tasks]
+                results = [future.result() for future in futures]
+
+    dates = prices.index
+    test_returns = {result['fold']: result['returns'] for result in results if result['returns'] is not None}
+    with timed(timings, code, 'metrics'):
+        test_metrics = compute_metrics(returns_matrix(test_returns)) if test_returns else None
+        stitched = pd.concat([test_returns[fold] for fold in sorted(test_returns)]) if test_returns else pd.Series(dtype=float)
+        metrics = compute_metrics(stitched).iloc[0] if not stitched.empty else pd.Series(float('nan'), index=METRICS)
+        metrics.name = 'Out of Sample'
+
+    rows = []
+    for (train_start, test_start, test_end), result in zip(folds, results):
+        row = {
+            'Fold': result['fold'],
+            'Train Start': dates[train_start],
+            'Train End': dates[test_start - 1],
+            'Test Start': dates[test_start],
+            'Test End': dates[test_end - 1],
+            **(result['params'] or {}),
+            'Train Sharpe': result['train_sharpe'],
+            **dict.fromkeys(METRICS),
+            'Error': result['error'],
+        }
+        if result['fold'] in test_returns:
+            row.update(test_metrics.loc[result['fold']].to_dict())
+        rows.append(row)
+
+    return {'folds': pd.DataFrame(rows), 'returns': stitched, 'metrics': metrics}
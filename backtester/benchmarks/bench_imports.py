@@ -0,0 +1,94 @@
+"""
+Import-time report for the dashboard pages.
+
+Renders home.py and each page once with Streamlit's AppTest, without
+clicking anything, in a fresh interpreter started with -X importtime, and
+lists the slowest imports the render triggered. Exits with status 1 if a
+render loads one of HEAVY_MODULES, which should only load once a backtest
+actually runs.
+
+Run from the backtester directory:
+    python -m benchmarks.bench_imports
+    python -m benchmarks.bench_imports --top 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKTESTER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ['home.py', 'pages/single_stock.py', 'pages/multiple_stocks.py']
+HEAVY_MODULES = ['backtrader', 'yfinance', 'quantstats', 'matplotlib', 'seaborn']
+MARKER = '--- render ---'
+
+RENDER = f'''
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+before = set(sys.modules)
+sys.stderr.write({MARKER!r} + "\\n")
+t0 = time.perf_counter()
+at = AppTest.from_file(sys.argv[1]).run(timeout=120)
+seconds = time.perf_counter() - t0
+print(json.dumps({{
+    'seconds': seconds,
+    'modules': sorted(set(sys.modules) - before),
+    'exceptions': [e.value for e in at.exception],
+}}))
+'''
+
+
+def parse_importtime(stderr):
+    """(name, depth, cumulative microseconds) for every import logged after the marker."""
+    lines = stderr.split(MARKER, 1)[-1].splitlines()
+    imports = []
+    for line in lines:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((name.strip(), depth, int(cumulative)))
+    return imports
+
+
+def render(script):
+    path = os.path.join(BACKTESTER_DIR, script)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', RENDER, path],
+                          cwd=BACKTESTER_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Rendering {script} failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(proc.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list per script')
+    args = parser.parse_args()
+
+    failures = []
+    for script in SCRIPTS:
+        result = render(script)
+        top_level = [entry for entry in result['imports'] if entry[1] == 0]
+        import_seconds = sum(cumulative for _, _, cumulative in top_level) / 1e6
+        heavy = [name for name in HEAVY_MODULES if name in result['modules']]
+
+        print(f"\n{script}: rendered in {result['seconds']:.2f}s, {import_seconds:.2f}s of it in imports")
+        for name, _, cumulative in sorted(top_level, key=lambda entry: entry[2], reverse=True)[:args.top]:
+            print(f"  {cumulative / 1e3:10.1f} ms  {name}")
+        if result['exceptions']:
+            failures.append(f"{script} raised {result['exceptions']}")
+        if heavy:
+            failures.append(f"{script} loaded {', '.join(heavy)}")
+
+    if failures:
+        print("\nFailed:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"\nNo page loaded {', '.join(HEAVY_MODULES)} before a run.")
+
+
+if __name__ == '__main__':
+    main()
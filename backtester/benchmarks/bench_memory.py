@@ -0,0 +1,90 @@
+"""
+Memory benchmark: full vs lean frames for a precomputed universe, on
+seeded synthetic tickers.
+
+Each mode runs in a fresh process, loads the universe with
+batch_runner.prepare_frames (prices plus indicators, all held at once like
+a precomputed batch) and reports, per 1,000 ticker-years of bars, the
+growth of the process's peak RSS over its state before loading, the
+tracemalloc peak, and what the frames hold (memory_usage(deep=True)).
+Peak RSS needs the resource module, so it is left out on Windows.
+
+Run from the backtester directory:
+    python -m benchmarks.bench_memory
+    python -m benchmarks.bench_memory --tickers 500 --bars 5000
+"""
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import tracemalloc
+import pandas as pd
+from backtest.batch_runner import prepare_frames
+from benchmarks.synthetic import synthetic_universe, write_universe
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+START_DATE, END_DATE = '1990-01-01', '2025-01-01'
+
+
+def peak_rss_mb():
+    if resource is None:
+        return float('nan')
+    # KB on Linux, bytes on macOS
+    scale = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def measure(root, tickers, lean):
+    """Worker entry point: loads the universe once and returns its memory figures in MB."""
+    from database.column_cache import ColumnCache
+
+    provider = ColumnCache(root)
+    # Warm the imports and the provider, so only the frames count
+    prepare_frames(tickers[:1], START_DATE, END_DATE, provider=provider, lean=lean)
+    rss_before = peak_rss_mb()
+    tracemalloc.start()
+    frames, _ = prepare_frames(tickers, START_DATE, END_DATE, provider=provider, lean=lean)
+    traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return {
+        'Peak RSS growth (MB)': peak_rss_mb() - rss_before,
+        'tracemalloc peak (MB)': traced_peak,
+        'Frames (MB)': sum(df.memory_usage(deep=True).sum() for df in frames.values()) / 2 ** 20,
+        'Bars': sum(len(df) for df in frames.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=200)
+    parser.add_argument('--bars', type=int, default=2520, help='bars per ticker, 252 a year')
+    args = parser.parse_args()
+
+    universe = synthetic_universe(args.tickers, args.bars, args.bars, seed=1)
+    tickers = list(universe)
+    rows = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        write_universe(universe, tmp)
+        del universe
+        # A fresh process per mode, the peak RSS of a process never goes down
+        context = multiprocessing.get_context('spawn')
+        for name, lean in [("Full frames", False), ("Lean frames", True)]:
+            with context.Pool(1) as pool:
+                rows[name] = pool.apply(measure, (tmp, tickers, lean))
+
+    table = pd.DataFrame(rows).T
+    ticker_years = table['Bars'] / 252 / 1000
+    per_thousand = table.drop(columns='Bars').div(ticker_years, axis=0)
+    per_thousand.columns = [column.replace('(MB)', '(MB per 1,000 ticker-years)') for column in per_thousand.columns]
+    print(f"{args.tickers} tickers x {args.bars} bars ({ticker_years.iloc[0] * 1000:.0f} ticker-years)")
+    print(per_thousand.T.to_string(float_format=lambda value: f"{value:.1f}"))
+    full, lean = per_thousand.iloc[0], per_thousand.iloc[1]
+    print(f"\nLean frames hold {lean.iloc[-1] / full.iloc[-1]:.0%} of the full frames' memory.")
+
+
+if __name__ == '__main__':
+    main()
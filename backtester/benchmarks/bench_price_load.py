@@ -0,0 +1,90 @@
+"""
+Price load benchmark: SQLite daily_prices vs the memory-mapped column cache,
+and one query_panel read of every ticker vs a fetch per ticker.
+
+Also prints the query plan of every SQLiteStore read and exits with status 1
+if one of them scans daily_prices instead of searching the
+(ticker, timestamp) index.
+
+Run from the backtester directory:
+    python -m benchmarks.bench_price_load --tickers 200 --years 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+from database.column_cache import ColumnCache
+from utils.data_provider import SQLiteStore, FETCH_PRICES, panel_query
+from utils.data_handler import get_ohlcv
+from benchmarks.synthetic import synthetic_ohlcv
+
+
+def time_loads(load, tickers, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for ticker in tickers:
+            load(ticker)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def check_plans(store, ticker, start_date, end_date):
+    """Prints the plan of each read query, returns False if one does not search the (ticker, timestamp) index."""
+    queries = {
+        'fetch': (FETCH_PRICES, (ticker, start_date, end_date)),
+        'query_panel': (panel_query(3), (ticker, ticker + 'X', ticker + 'Y', start_date, end_date)),
+        'coverage': ("SELECT MIN(timestamp), MAX(timestamp) FROM daily_prices WHERE ticker = ?", (ticker,)),
+    }
+    ok = True
+    for name, (query, params) in queries.items():
+        plan = store.query_plan(query, params)
+        uses_index = any('idx_daily_prices_ticker_timestamp' in step for step in plan)
+        scans = any(step.startswith('SCAN daily_prices') for step in plan)
+        ok &= uses_index and not scans
+        print(f"{name:<12} {'ok' if uses_index and not scans else 'NO INDEX'}  {' | '.join(plan)}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=100)
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tickers = [f"SYN{i:04d}" for i in range(args.tickers)]
+    n_bars = args.years * 252
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStore(os.path.join(tmp, 'bench.db'))
+        cache = ColumnCache(os.path.join(tmp, 'price_cache'))
+        for i, ticker in enumerate(tickers):
+            df = synthetic_ohlcv(n_bars, seed=i)
+            end = (df.index[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+            store.write(ticker, df, '1990-01-01', end)
+            cache.write(ticker, df, '1990-01-01', end)
+        # Every ticker has the same calendar, load the last half of it
+        start_date, end_date = df.index[len(df) // 2].strftime('%Y-%m-%d'), end
+
+        results = {
+            'sqlite fetch': time_loads(lambda t: store.fetch(t, start_date, end_date), tickers, args.repeat),
+            'column cache fetch': time_loads(lambda t: cache.fetch(t, start_date, end_date), tickers, args.repeat),
+            'get_ohlcv (sqlite)': time_loads(lambda t: get_ohlcv(t, start_date, end_date, provider=store), tickers, args.repeat),
+            'get_ohlcv (column cache)': time_loads(lambda t: get_ohlcv(t, start_date, end_date, provider=cache), tickers, args.repeat),
+            'sqlite query_panel': time_loads(lambda _: store.query_panel(tickers, start_date, end_date), [None], args.repeat),
+        }
+        plans_ok = check_plans(store, tickers[0], start_date, end_date)
+        store.close()
+
+    print(f"{args.tickers} tickers x {args.years} years, loading {start_date} to {end_date}")
+    for name, seconds in results.items():
+        print(f"{name:<26} {seconds:8.3f}s total  {seconds / len(tickers) * 1e3:8.2f} ms/ticker")
+    if not plans_ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Daily refresh benchmark: one new bar across a universe of seeded synthetic
+tickers, through the incremental indicator engine.
+
+The engine state is built from every bar but the last (the full rebuild,
+timed for comparison), saved, and the last bar is appended to the
+ColumnCache like a day's ingest. The refresh then times what
+`run.py --refresh-indicators` does: load the state, extend every ticker
+by the new bar and save the state again.
+
+Run from the backtester directory:
+    python -m benchmarks.bench_refresh
+    python -m benchmarks.bench_refresh --tickers 600 --bars 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+import pandas as pd
+from benchmarks.synthetic import synthetic_universe, write_universe
+from utils.incremental import IncrementalIndicatorEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=600)
+    parser.add_argument('--bars', type=int, default=2520, help='bars per ticker, 252 a year')
+    args = parser.parse_args()
+
+    universe = synthetic_universe(args.tickers, args.bars, args.bars, seed=1)
+    tickers = list(universe)
+    # Every ticker has the same calendar
+    last_day = next(iter(universe.values())).index[-1]
+    day_before_end = last_day.strftime('%Y-%m-%d')
+    end = (last_day + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, 'indicators.state')
+        cache = write_universe({ticker: df.iloc[:-1] for ticker, df in universe.items()}, os.path.join(tmp, 'prices'))
+
+        start_time = time.perf_counter()
+        engine = IncrementalIndicatorEngine()
+        engine.refresh(tickers, day_before_end, provider=cache)
+        engine.save(state_path)
+        rebuild = time.perf_counter() - start_time
+
+        for ticker, df in universe.items():
+            cache.write(ticker, df.iloc[-1:], '1990-01-01', end)
+
+        start_time = time.perf_counter()
+        engine = IncrementalIndicatorEngine.load(state_path)
+        updates = engine.refresh(tickers, end, provider=cache)
+        engine.save(state_path)
+        refresh = time.perf_counter() - start_time
+        state_mb = os.path.getsize(state_path) / 2 ** 20
+
+    new_rows = sum(len(update) for update in updates.values())
+    print(f"{args.tickers} tickers x {args.bars} bars, state file {state_mb:.1f} MB")
+    print(f"Full rebuild:  {rebuild:7.2f}s ({rebuild / args.tickers * 1000:.1f} ms/ticker)")
+    print(f"Daily refresh: {refresh:7.2f}s ({refresh / args.tickers * 1000:.1f} ms/ticker, {new_rows} new rows)")
+    print(f"\nThe refresh takes {refresh / rebuild:.1%} of the full rebuild.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Parameter search benchmark: how fast each optimizer search method finds
+near-optimal parameters, on seeded synthetic tickers.
+
+Every ticker is first scored on the full grid of the strategy's search
+space, which gives the rank of any combination. Each method then runs
+with a budget of a fraction of the grid, for several seeds, and the table
+reports its average cost (in full backtests), wall time, the time it took
+to first evaluate a combination in the top --top share of the grid, and
+how often the combination it returned is in that top share.
+
+Run from the backtester directory:
+    python -m benchmarks.bench_search
+    python -m benchmarks.bench_search --strategy "RSI Diff" --budget 0.1 --seeds 10
+"""
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from utils.indicator_cache import IndicatorCache
+from backtest.search import SEARCH_METHODS, SEARCH_SPACES, backtest_objective, grid, search
+from benchmarks.synthetic import synthetic_universe, write_universe
+
+START_DATE, END_DATE = '2000-01-01', '2025-01-01'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--strategy', choices=list(SEARCH_SPACES), default="Trend Change")
+    parser.add_argument('--tickers', type=int, default=3)
+    parser.add_argument('--bars', type=int, default=3000)
+    parser.add_argument('--budget', type=float, default=0.15, help='share of the grid each method may evaluate')
+    parser.add_argument('--seeds', type=int, default=5)
+    parser.add_argument('--top', type=float, default=0.05, help='share of the grid counted as near-optimal')
+    parser.add_argument('--engine', default="vectorized")
+    args = parser.parse_args()
+
+    space = SEARCH_SPACES[args.strategy]
+    combinations = grid(space)
+    budget = max(1, round(args.budget * len(combinations)))
+    universe = synthetic_universe(args.tickers, min_bars=args.bars, max_bars=args.bars, seed=1)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        provider = write_universe(universe, tmp)
+
+        def objective(ticker):
+            # A fresh cache per search, so no method runs on indicators another one computed
+            return backtest_objective(ticker, START_DATE, END_DATE, strategy=args.strategy, engine=args.engine,
+                                      provider=provider, indicator_cache=IndicatorCache(provider))
+
+        for ticker in universe:
+            full = search("Grid", space, objective(ticker))
+            scores = {tuple(entry['params'].values()): entry['score'] for entry in full.history}
+            threshold = np.nanquantile(list(scores.values()), 1 - args.top)
+            print(f"{ticker}: best Sharpe {np.nanmax(list(scores.values())):.3f} of {len(combinations)} "
+                  f"in {full.seconds:.2f}s, top {args.top:.0%} from {threshold:.3f}")
+            rows.append({'Method': "Full grid", 'Ticker': ticker, 'Cost': full.cost, 'Seconds': full.seconds,
+                         'Time to top (s)': _time_to_top(full, scores, threshold), 'Found top': True})
+
+            for method in SEARCH_METHODS:
+                if method == "Grid":
+                    continue
+                for seed in range(args.seeds):
+                    log = search(method, space, objective(ticker), max_evaluations=budget, seed=seed)
+                    params, _, _ = log.best()
+                    rows.append({'Method': method, 'Ticker': ticker, 'Cost': log.cost, 'Seconds': log.seconds,
+                                 'Time to top (s)': _time_to_top(log, scores, threshold),
+                                 'Found top': scores[tuple(params.values())] >= threshold})
+
+    df = pd.DataFrame(rows)
+    table = df.groupby('Method', sort=False).agg(
+        cost=('Cost', 'mean'),
+        seconds=('Seconds', 'mean'),
+        time_to_top=('Time to top (s)', 'median'),
+        found_top=('Found top', 'mean'),
+    )
+    table.columns = ['Cost (backtests)', 'Seconds', 'Median time to top (s)', 'Returned a top combination']
+    print(f"\n{args.strategy}, budget {budget} of {len(combinations)} backtests, {args.tickers} tickers x {args.seeds} seeds")
+    print(table.to_string(float_format=lambda value: f"{value:.2f}"))
+
+
+def _time_to_top(log, scores, threshold):
+    """Seconds until the first full-window evaluation of a top combination, NaN if there was none."""
+    for entry in log.history:
+        if entry['window'] >= 1 and scores[tuple(entry['params'].values())] >= threshold:
+            return entry['seconds']
+    return float('nan')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+"""
+Parity checks of the fast paths against the code they replaced, on seeded
+synthetic data and the recorded bars in benchmarks/fixtures, and
+regression checks of fixed bugs.
+
+Every check compares exactly unless its docstring says otherwise. The
+script runs them all and exits with status 1 if one of them failed.
+
+Run from the backtester directory:
+    python -m benchmarks.check_parity
+    python -m benchmarks.check_parity --only direction
+"""
+import argparse
+import os
+import sys
+import tempfile
+import traceback
+import warnings
+from unittest import mock
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_series_equal
+from backtest.backtest_runner import run_strategy
+from backtest.ledger import REJECT
+from backtest.metrics import METRICS, compute_metrics, returns_matrix
+from database.column_cache import ColumnCache
+from utils.data_provider import DataProvider, SQLiteStore, ReadThroughProvider
+from utils.incremental import IncrementalIndicatorEngine, INDICATOR_COLUMNS
+from utils.data_handler import get_ohlcv, get_direction, get_direction_array, get_secondary_data, build_indicator_params
+from benchmarks.synthetic import synthetic_ohlcv, synthetic_universe
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'recorded_ohlcv.csv')
+
+CHECKS = {}
+
+
+def check(func):
+    CHECKS[func.__name__[len('check_'):]] = func
+    return func
+
+
+def load_fixture():
+    """
+    The recorded bars, with the Direction labels the original row-by-row
+    get_direction gave them at a 0.05 threshold (percent mode) and with the
+    default ATR (ATR mode).
+    """
+    return pd.read_csv(FIXTURE, index_col='Date', parse_dates=True)
+
+
+def reference_direction(df, threshold, atr_mode):
+    """get_direction as it was before get_direction_array, row by row."""
+    up_trend = True
+    last_high_i = 0
+    last_low_i = 0
+    last_high = df['High'].iloc[0]
+    last_low = df['High'].iloc[0]
+    directions = []
+
+    for i in range(len(df)):
+        if atr_mode:
+            threshold = df['ATR'].iloc[i]
+        if up_trend:
+            if df['High'].iloc[i] > last_high:
+                last_high_i = i
+                last_high = df['High'].iloc[i]
+            elif (not atr_mode and (df['Close'].iloc[i] < last_high * (1 - threshold))) or \
+                    (atr_mode and (df['Close'].iloc[i] < last_high - threshold)):
+                up_trend = False
+                last_low_i = i
+                last_low = df['Low'].iloc[i]
+        else:
+            if df['Low'].iloc[i] < last_low:
+                last_low_i = i
+                last_low = df['Low'].iloc[i]
+            elif (not atr_mode and (df['Close'].iloc[i] > last_low * (1 + threshold))) or \
+                    (atr_mode and (df['Close'].iloc[i] > last_low + threshold)):
+                up_trend = True
+                last_high_i = i
+                last_high = df['High'].iloc[i]
+
+        directions.append(1 if up_trend else -1)
+
+    return directions
+
+
+def _assert_direction(df, threshold, atr_mode, label):
+    expected = np.array(reference_direction(df, threshold, atr_mode))
+    got = np.asarray(get_direction(df, threshold, atr_mode))
+    mismatches = np.flatnonzero(got != expected)
+    assert len(mismatches) == 0, f"{label}: get_direction differs from the reference at bars {mismatches[:5]}"
+
+
+@check
+def check_direction():
+    """get_direction and the 2D get_direction_array against the row-by-row reference."""
+    params = build_indicator_params()
+
+    # 1D, percent and ATR mode, on synthetic frames with gaps
+    frames = [get_secondary_data(synthetic_ohlcv(1500, seed=seed, gap_probability=0.05), params) for seed in range(5)]
+    for seed, df in enumerate(frames):
+        for threshold in [0.01, 0.05, 0.1]:
+            _assert_direction(df, threshold, False, f"synthetic seed {seed}, threshold {threshold}")
+        _assert_direction(df, params['Direction_threshold'], True, f"synthetic seed {seed}, ATR mode")
+
+    # 1D on the recorded bars, against the reference and the labels recorded with it
+    fixture = get_secondary_data(load_fixture(), params)
+    for atr_mode, column in [(False, 'Direction_percent'), (True, 'Direction_atr')]:
+        _assert_direction(fixture, params['Direction_threshold'], atr_mode, f"fixture {column}")
+        got = np.asarray(get_direction(fixture, params['Direction_threshold'], atr_mode))
+        assert np.array_equal(got, fixture[column].to_numpy()), f"fixture: get_direction differs from the recorded {column}"
+
+    # 2D (tickers x bars), tickers listed at different dates are NaN before their first bar
+    universe = {ticker: get_secondary_data(df, params) for ticker, df in synthetic_universe(8, 200, 1200, seed=7).items()}
+    calendar = pd.DatetimeIndex(sorted(set().union(*(df.index for df in universe.values()))))
+    panel = {column: np.vstack([df[column].reindex(calendar).to_numpy(dtype=float) for df in universe.values()])
+             for column in ['High', 'Low', 'Close', 'ATR']}
+    for atr_mode, threshold in [(False, 0.05), (False, 0.02), (True, params['Direction_threshold'])]:
+        directions = get_direction_array(panel['High'], panel['Low'], panel['Close'], threshold,
+                                         atr=panel['ATR'], atr_mode=atr_mode)
+        for j, (ticker, df) in enumerate(universe.items()):
+            first = calendar.get_loc(df.index[0])
+            assert not directions[j, :first].any(), f"panel {ticker}: labels before its listing"
+            expected = np.array(reference_direction(df, threshold, atr_mode))
+            assert np.array_equal(directions[j, first:], expected), \
+                f"panel {ticker}, atr_mode={atr_mode}, threshold {threshold}: differs from the reference"
+    print(f"direction: {len(frames)} synthetic frames, the fixture and a {len(universe)}-ticker panel match")
+
+
+def _strategy_cases():
+    """(label, strategy, strategy_params, commission, bars) of the vectorized parity runs."""
+    calm = synthetic_ohlcv(1500, seed=11)
+    # Frequent large gaps: orders sized at the signal close no longer fit the cash at the next open
+    gappy = synthetic_ohlcv(1500, seed=12, gap_probability=0.2, gap_size=0.1)
+    cases = []
+    for threshold in [0.03, 0.05, 0.1]:
+        for position_size in [0.5, 0.95]:
+            params = {'direction_threshold': threshold, 'use_absolute': False, 'position_size': position_size}
+            cases.append((f"percent {threshold}", "Trend Change", params, 0.001, calm))
+    for multiplier in [2, 3]:
+        cases.append((f"ATR x{multiplier}", "Trend Change", {'atr_multiplier': multiplier}, 0.001, calm))
+    for threshold in [5, 10, 20]:
+        for position_size in [0.5, 0.95]:
+            params = {'rsi_diff_threshold': threshold, 'position_size': position_size}
+            cases.append((f"threshold {threshold}", "RSI Diff", params, 0.001, calm))
+    for commission in [0.0, 0.01]:
+        cases.append(("commission", "Trend Change", {}, commission, calm))
+        cases.append(("commission", "RSI Diff", {}, commission, calm))
+    cases.append(("gap rejections", "Trend Change", {'position_size': 0.95, 'use_absolute': False}, 0.001, gappy))
+    cases.append(("gap rejections", "RSI Diff", {'position_size': 1.0, 'rsi_diff_threshold': 5}, 0.001, gappy))
+    return cases
+
+
+@check
+def check_vectorized():
+    """run_strategy(engine="vectorized") against engine="backtrader", returns equal to the last bit."""
+    rejections = 0
+    cases = _strategy_cases()
+    for label, strategy, params, commission, bars in cases:
+        df = get_secondary_data(bars.copy(), build_indicator_params(params))
+        df['Date'] = df.index
+        expected, cerebro = run_strategy(df, 100000, commission, strategy, params, engine="backtrader")
+        got, _ = run_strategy(df, 100000, commission, strategy, params, engine="vectorized")
+        try:
+            assert_series_equal(got, expected, check_exact=True)
+        except AssertionError as e:
+            raise AssertionError(f"{strategy} {label} {params}, commission {commission}: {e}") from None
+        if label == "gap rejections":
+            ledger = cerebro.runstrats[0][0].ledger
+            rejections += int((ledger.rows['event'] == REJECT).sum())
+    assert rejections, "the gap cases did not reject any order"
+    print(f"vectorized: {len(cases)} runs match backtrader, {rejections} rejected orders in the gap cases")
+
+
+@check
+def check_incremental():
+    """IncrementalIndicatorEngine fed random chunks, saved and loaded in between, against get_secondary_data."""
+    rng = np.random.default_rng(8)
+    param_sets = [{}, {'use_absolute': False, 'direction_threshold': 0.03}, {'atr_window': 5, 'rsi_short': 3, 'rsi_long': 3}]
+    runs = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'state.pkl')
+        for seed in range(4):
+            bars = synthetic_ohlcv(1200, seed=seed, gap_probability=0.05)
+            for strategy_params in param_sets:
+                params = build_indicator_params(strategy_params)
+                expected = get_secondary_data(bars.copy(), params)
+                engine = IncrementalIndicatorEngine(params)
+                # Single bars first, while the rolling windows are still filling, then random chunks
+                cuts = np.union1d(np.arange(1, 40), rng.choice(np.arange(40, len(bars)), size=40, replace=False))
+                chunks = []
+                for first, last in zip(np.concatenate([[0], cuts]), np.concatenate([cuts, [len(bars)]])):
+                    chunks.append(engine.update('SYN', bars.iloc[first:last]))
+                    if rng.random() < 0.5:
+                        engine.save(path)
+                        engine = IncrementalIndicatorEngine.load(path)
+                got = pd.concat(chunks)
+                for column in INDICATOR_COLUMNS:
+                    assert np.array_equal(got[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                          equal_nan=True), f"seed {seed}, {strategy_params}: {column} differs"
+                runs += 1
+    print(f"incremental: {runs} chunked runs with save/load match get_secondary_data")
+
+
+@check
+def check_metrics():
+    """compute_metrics of a returns matrix against the quantstats functions on each run, to 1e-9 relative."""
+    import quantstats as qs
+
+    runs = {}
+    for seed, (first, last) in enumerate([(0, 1500), (300, 1500), (0, 700), (900, 1100), (1400, 1500)]):
+        bars = synthetic_ohlcv(1500, seed=20 + seed)
+        df = get_secondary_data(bars.copy())
+        df['Date'] = df.index
+        for strategy in ["Trend Change", "RSI Diff"]:
+            returns, _ = run_strategy(df.iloc[first:last], strategy=strategy, engine="vectorized")
+            runs[f"{strategy} {first}-{last}"] = returns
+    dates = next(iter(runs.values())).index
+    rng = np.random.default_rng(16)
+    runs['all zero'] = pd.Series(0.0, index=dates[:300])
+    runs['first day loss'] = pd.Series(np.r_[-0.05, rng.normal(0, 0.01, 199)], index=dates[50:250])
+    runs['first day loss only'] = pd.Series(np.r_[-0.05, np.zeros(99)], index=dates[400:500])
+    runs['all gains'] = pd.Series(np.abs(rng.normal(0, 0.01, 200)), index=dates[100:300])
+
+    got = compute_metrics(returns_matrix(runs))
+    functions = {
+        'Sharpe Ratio': qs.stats.sharpe,
+        'Sortino Ratio': qs.stats.sortino,
+        'Calmar Ratio': qs.stats.calmar,
+        'CAGR': qs.stats.cagr,
+        'Max Drawdown': qs.stats.max_drawdown,
+        'Volatility': qs.stats.volatility,
+        'Total Return': qs.stats.comp,
+    }
+    with warnings.catch_warnings(), np.errstate(all='ignore'):
+        warnings.simplefilter('ignore')
+        expected = pd.DataFrame({run: {metric: functions[metric](returns) for metric in METRICS}
+                                 for run, returns in runs.items()}).T
+    close = np.isclose(got[METRICS].to_numpy(dtype=float), expected[METRICS].to_numpy(dtype=float),
+                       rtol=1e-9, atol=1e-12, equal_nan=True)
+    if not close.all():
+        rows, columns = np.nonzero(~close)
+        mismatches = [f"{got.index[i]} {METRICS[j]}: {got.iat[i, j]} vs {expected[METRICS].iat[i, j]}" for i, j in zip(rows, columns)]
+        raise AssertionError("compute_metrics differs from quantstats:\n  " + "\n  ".join(mismatches[:10]))
+    print(f"metrics: {len(runs)} runs match quantstats")
+
+
+class _PublishedBars(DataProvider):
+    """Remote that only has the bars published before its today, and counts its calls."""
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.today = None
+        self.calls = 0
+
+    def fetch(self, code, start_date, end_date):
+        self.calls += 1
+        published = self.bars[self.bars.index < pd.Timestamp(self.today)]
+        return published[start_date:pd.Timestamp(end_date) - pd.Timedelta(days=1)]
+
+
+@check
+def check_coverage():
+    """A read whose end date is in the future must not mark the future as synced."""
+    remote = _PublishedBars(synthetic_ohlcv(300, seed=1, start='2024-01-01'))
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStore(os.path.join(tmp, 'prices.db'))
+        database = ReadThroughProvider(store, remote, raise_remote_errors=True)
+        providers = {
+            'database': database,
+            'column cache over database': ReadThroughProvider(ColumnCache(os.path.join(tmp, 'price_cache')), database),
+        }
+        for name, provider in providers.items():
+            code = name.upper().replace(' ', '_')
+            for today, last_bar in [('2024-06-01', '2024-05-31'), ('2024-09-02', '2024-08-30')]:
+                remote.today = today
+                calls = remote.calls
+                with mock.patch('utils.data_provider._today', return_value=today):
+                    df = provider.fetch(code, '2024-01-01', '2024-12-31')
+                assert remote.calls > calls, f"{name}: no remote fetch on {today}"
+                assert df.index[-1] == pd.Timestamp(last_bar), \
+                    f"{name}: last bar on {today} is {df.index[-1].date()}, expected {last_bar}"
+                assert provider.store.coverage(code)[1] <= today, f"{name}: coverage ends after {today}"
+        store.close()
+    print("coverage: reads ending in the future fetch the bars published since the last read")
+
+
+class _MissingValues(DataProvider):
+    """Remote whose bars have no volume at all for index tickers (^...), and one NaN volume and close otherwise."""
+
+    def fetch(self, code, start_date, end_date):
+        bars = synthetic_ohlcv(300, seed=2, start='2024-01-01').astype(float)
+        bars.iloc[110, bars.columns.get_loc('Volume')] = np.nan
+        bars.iloc[120, bars.columns.get_loc('Close')] = np.nan
+        if code.startswith('^'):
+            bars['Volume'] = np.nan
+        return bars[start_date:pd.Timestamp(end_date) - pd.Timedelta(days=1)]
+
+
+@check
+def check_missing_values():
+    """Bars with NaN volume or prices are stored and loaded instead of failing the ticker."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStore(os.path.join(tmp, 'prices.db'))
+        database = ReadThroughProvider(store, _MissingValues(), raise_remote_errors=True)
+        providers = {
+            'database': database,
+            'column cache over database': ReadThroughProvider(ColumnCache(os.path.join(tmp, 'price_cache')), database),
+        }
+        for name, provider in providers.items():
+            for code in ['SYN', '^IDX']:
+                with mock.patch('utils.data_provider._today', return_value='2025-01-01'):
+                    df = get_ohlcv(f"{code}_{name.replace(' ', '_')}", '2024-03-01', '2024-12-01', provider=provider)
+                assert len(df) and df['Close'].isna().sum() == 1, f"{name} {code}: {len(df)} bars, NaN closes lost"
+                get_secondary_data(df)
+        store.close()
+    print("missing values: bars with NaN volume or prices load through both stores")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', choices=sorted(CHECKS), action='append', help='run only this check (repeatable)')
+    args = parser.parse_args()
+
+    failures = []
+    for name in args.only or CHECKS:
+        try:
+            CHECKS[name]()
+        except Exception:
+            traceback.print_exc()
+            failures.append(name)
+
+    if failures:
+        print(f"\n{len(failures)} check(s) failed: {', '.join(failures)}")
+        sys.exit(1)
+    print(f"\nAll {len(args.only or CHECKS)} check(s) passed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark suite for the backtest hot paths, on seeded synthetic data.
+
+Runs offline: prices are served from a temporary column cache, yfinance is
+never called and nothing goes through Streamlit. Covers the indicator
+functions, single backtests on both engines, whole-universe batches and the
+portfolio mode.
+
+Run from the backtester directory:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --baseline benchmarks/baseline.json --threshold 0.25
+
+With --baseline the run exits with status 1 when a benchmark is more than
+threshold (a fraction) slower than its saved time. Timings depend on the
+machine, so compare against a baseline saved on the same one.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import timeit
+import numpy as np
+from utils.data_handler import (get_ohlcv, get_true_range, get_atr, get_direction, calculate_rsi,
+                                get_secondary_data, get_panel_indicators, build_indicator_params)
+from backtest.backtest_runner import run_backtest, run_strategy, run_portfolio
+from backtest.batch_runner import run_universe
+from benchmarks.synthetic import synthetic_ohlcv, synthetic_universe, write_universe
+
+START_DATE, END_DATE = '2000-01-01', '2025-01-01'
+
+
+def time_call(func, repeat):
+    """Best time of one call in seconds, over repeat rounds of enough calls to fill ~0.2s."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def build_benchmarks(args, provider, universe):
+    params = build_indicator_params()
+    df = get_secondary_data(synthetic_ohlcv(args.bars, seed=0), params)
+    true_range = get_true_range(df)
+
+    tickers = list(universe)
+    calendar = sorted(set().union(*(frame.index for frame in universe.values())))
+    panel = {column: np.column_stack([frame[column].reindex(calendar).to_numpy(dtype=float) for frame in universe.values()])
+             for column in ['High', 'Low', 'Close']}
+
+    def single(engine, strategy):
+        return lambda: run_backtest(tickers[0], START_DATE, END_DATE, strategy=strategy, provider=provider, engine=engine)
+
+    def strategy_only(pyfolio):
+        frame = df.assign(Date=df.index)
+        return lambda: run_strategy(frame, strategy="Trend Change", engine='backtrader', pyfolio=pyfolio)
+
+    def batch(engine, max_workers, precompute_indicators):
+        return lambda: run_universe(tickers, START_DATE, END_DATE, engine=engine, provider=provider,
+                                    max_workers=max_workers, precompute_indicators=precompute_indicators)
+
+    return {
+        # Indicators on one ticker: the graph nodes behind get_secondary_data, through their public wrappers
+        'get_true_range': lambda: get_true_range(df),
+        'get_atr': lambda: get_atr(true_range, params['ATR_window'], params['ATR_multiplier']),
+        'get_direction (percent)': lambda: get_direction(df, params['Direction_threshold'], False),
+        'get_direction (atr)': lambda: get_direction(df, params['Direction_threshold'], True),
+        'calculate_rsi': lambda: calculate_rsi(df['Close'], params['RSI_periods']['short']),
+        'get_secondary_data': lambda: get_secondary_data(df[['Open', 'High', 'Low', 'Close', 'Volume']].copy(), params),
+        'get_panel_indicators': lambda: get_panel_indicators(panel['High'], panel['Low'], panel['Close'], params),
+        # Only the lines one strategy reads, as the runners compute them
+        'get_secondary_data Direction': lambda: get_secondary_data(df[['Open', 'High', 'Low', 'Close', 'Volume']].copy(), params,
+                                                                   lines=['Direction']),
+        'get_secondary_data RSI_Diff': lambda: get_secondary_data(df[['Open', 'High', 'Low', 'Close', 'Volume']].copy(), params,
+                                                                  lines=['RSI_Diff']),
+        # One backtest end to end, from loading prices to returns
+        'get_ohlcv': lambda: get_ohlcv(tickers[0], START_DATE, END_DATE, provider=provider),
+        'run_backtest backtrader Trend Change': single('backtrader', 'Trend Change'),
+        'run_backtest backtrader RSI Diff': single('backtrader', 'RSI Diff'),
+        'run_backtest vectorized Trend Change': single('vectorized', 'Trend Change'),
+        'run_backtest vectorized RSI Diff': single('vectorized', 'RSI Diff'),
+        # backtrader alone, with the DailyReturns analyzer vs also the PyFolio one tear sheets need
+        'run_strategy backtrader returns analyzer': strategy_only(False),
+        'run_strategy backtrader + PyFolio': strategy_only(True),
+        # The Multiple Stocks page
+        'run_universe backtrader sequential': batch('backtrader', 1, False),
+        'run_universe backtrader pool': batch('backtrader', None, False),
+        'run_universe vectorized panel': batch('vectorized', 1, True),
+        # The same tickers as one portfolio on a shared broker
+        'run_portfolio': lambda: run_portfolio(tickers, START_DATE, END_DATE, allocation='equal', provider=provider),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints the change against the baseline and returns the names that regressed."""
+    regressions = []
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        change = seconds / base - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<40} {base:10.5f}s -> {seconds:10.5f}s  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bars', type=int, default=2500, help='bars of the single-ticker benchmarks')
+    parser.add_argument('--tickers', type=int, default=8, help='tickers of the universe benchmarks')
+    parser.add_argument('--min-bars', type=int, default=500)
+    parser.add_argument('--max-bars', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--baseline', metavar='PATH')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args()
+
+    config = {'bars': args.bars, 'tickers': args.tickers, 'min_bars': args.min_bars, 'max_bars': args.max_bars}
+    universe = synthetic_universe(args.tickers, args.min_bars, args.max_bars)
+    # The single-ticker benchmarks read the first ticker at full length
+    universe['SYN0000'] = synthetic_ohlcv(args.bars, seed=0, start='2000-01-03')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        provider = write_universe(universe, tmp)
+        for name, func in build_benchmarks(args, provider, universe).items():
+            if args.filter not in name:
+                continue
+            results[name] = time_call(func, args.repeat)
+            print(f"{name:<40} {results[name] * 1e3:12.3f} ms")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline['config'] != config:
+            print(f"\nWarning: baseline was recorded with {baseline['config']}, this run used {config}")
+        print(f"\nAgainst {args.baseline} (threshold {args.threshold:.0%}):")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Seeded synthetic daily bars for the benchmarks, so they run offline and
+give the same data on every machine.
+"""
+import numpy as np
+import pandas as pd
+from database.column_cache import ColumnCache
+
+
+def synthetic_ohlcv(n_bars, seed, start='2000-01-03', volatility=0.02, gap_probability=0.01, gap_size=0.08):
+    """
+    Random-walk OHLCV bars on a business-day calendar starting at start.
+
+    Close follows a geometric random walk with the given daily volatility.
+    With gap_probability a bar opens away from the previous close by a
+    normal move of gap_size, like an earnings gap. High and Low always
+    bracket Open and Close.
+    """
+    rng = np.random.default_rng(seed)
+    gaps = np.where(rng.random(n_bars) < gap_probability, rng.normal(0, gap_size, n_bars), 0.0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, volatility, n_bars) + gaps))
+    previous_close = np.concatenate([[100.0], close[:-1]])
+    open_ = previous_close * np.exp(gaps + rng.normal(0, volatility / 4, n_bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, volatility / 2, n_bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, volatility / 2, n_bars)))
+    df = pd.DataFrame({
+        'Open': open_,
+        'High': high,
+        'Low': low,
+        'Close': close,
+        'Volume': rng.integers(1_000, 1_000_000, n_bars),
+    }, index=pd.DatetimeIndex(pd.bdate_range(start, periods=n_bars), name='Date'))
+    return df
+
+
+def synthetic_universe(n_tickers, min_bars=500, max_bars=5000, seed=0, end='2024-12-31'):
+    """
+    {ticker: bars} for n_tickers tickers that all end at end. History
+    lengths are drawn between min_bars and max_bars, like a universe of
+    stocks listed at different times.
+    """
+    rng = np.random.default_rng(seed)
+    universe = {}
+    for i in range(n_tickers):
+        n_bars = int(rng.integers(min_bars, max_bars + 1))
+        start = pd.bdate_range(end=end, periods=n_bars)[0]
+        universe[f"SYN{i:04d}"] = synthetic_ohlcv(n_bars, seed=seed * 100_003 + i, start=start)
+    return universe
+
+
+def write_universe(universe, root):
+    """Writes the bars to a ColumnCache under root and returns it for use as a provider."""
+    cache = ColumnCache(root)
+    for ticker, df in universe.items():
+        end = (df.index[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        cache.write(ticker, df, '1990-01-01', end)
+    return cache
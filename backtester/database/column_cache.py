@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# One raw little-endian file per column, so appends never rewrite history
+COLUMN_DTYPES = {
+    'Date': np.dtype('<i8'),  # datetime64[ns] stored as int64
+    'Open': np.dtype('<f8'),
+    'High': np.dtype('<f8'),
+    'Low': np.dtype('<f8'),
+    'Close': np.dtype('<f8'),
+    'Volume': np.dtype('<i8'),
+}
+
+
+class ColumnCache:
+    """
+    Per-ticker columnar price cache.
+
+    Every ticker gets a directory under root holding one binary file per
+    column plus a meta.json with the row count and the synced date range.
+    Reads map the files with np.memmap and slice the requested range, so
+    no price data is copied until something writes to it. New bars are
+    appended to the end of each file; only bars older than the cached
+    history force a rewrite.
+
+    Implements the same fetch/coverage/write interface as SQLiteStore, so it
+    can sit in front of it in a ReadThroughProvider.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._maps = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def __getstate__(self):
+        # Maps and locks stay with the process that opened them
+        return {'root': self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state['root'])
+
+    def _ticker_dir(self, ticker):
+        return os.path.join(self.root, ticker.replace('/', '_'))
+
+    def _meta_path(self, ticker):
+        return os.path.join(self._ticker_dir(ticker), 'meta.json')
+
+    def _column_path(self, ticker, column):
+        return os.path.join(self._ticker_dir(ticker), f"{column.replace(' ', '_').lower()}.bin")
+
+    def meta(self, ticker):
+        try:
+            with open(self._meta_path(ticker), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, ticker, meta):
+        tmp_path = self._meta_path(ticker) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(ticker))
+
+    def columns(self, ticker):
+        """Returns read-only memmaps of every column, or None if the ticker is not cached."""
+        meta = self.meta(ticker)
+        if meta is None or meta['rows'] == 0:
+            return None
+
+        with self._lock:
+            cached = self._maps.get(ticker)
+            if cached is not None and cached[0] == meta['rows']:
+                return cached[1]
+
+            maps = {
+                column: np.memmap(self._column_path(ticker, column), dtype=dtype, mode='r', shape=(meta['rows'],))
+                for column, dtype in COLUMN_DTYPES.items()
+            }
+            self._maps[ticker] = (meta['rows'], maps)
+            return maps
+
+    def read(self, ticker, start_date, end_date):
+        """Returns zero-copy views of every column for [start_date, end_date)."""
+        maps = self.columns(ticker)
+        if maps is None:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in COLUMN_DTYPES.items()}
+
+        dates = maps['Date']
+        lo = np.searchsorted(dates, pd.Timestamp(start_date).value, side='left')
+        hi = np.searchsorted(dates, pd.Timestamp(end_date).value, side='left')
+        return {column: values[lo:hi] for column, values in maps.items()}
+
+    def fetch(self, code, start_date, end_date):
+        columns = self.read(code, start_date, end_date)
+        index = pd.DatetimeIndex(columns.pop('Date').view('datetime64[ns]'), name='Date')
+        return pd.DataFrame(columns, index=index, copy=False)
+
+    def coverage(self, code):
+        meta = self.meta(code)
+        if meta is None or meta['start'] is None:
+            return None
+        return meta['start'], meta['end']
+
+    def write(self, code, df, start_date, end_date):
+        """Stores bars fetched for [start_date, end_date) and extends the coverage."""
+        self.append(code, df)
+        meta = self.meta(code)
+        meta['start'] = min(start_date, meta['start']) if meta['start'] else start_date
+        meta['end'] = max(end_date, meta['end']) if meta['end'] else end_date
+        self._write_meta(code, meta)
+
+    def append(self, ticker, df):
+        """
+        Adds bars from a DataFrame indexed by date with the OHLCV_COLUMNS.
+
+        Bars after the last cached date are appended in place, bars already
+        cached are skipped, and bars before the first cached date trigger a
+        full rewrite of the ticker's files.
+        """
+        os.makedirs(self._ticker_dir(ticker), exist_ok=True)
+        meta = self.meta(ticker) or {'rows': 0, 'start': None, 'end': None}
+
+        new = self._to_columns(df)
+        if len(new['Date']) == 0:
+            self._write_meta(ticker, meta)
+            return 0
+
+        maps = self.columns(ticker)
+        if maps is None:
+            return self._rewrite(ticker, new, meta)
+
+        cached_dates = maps['Date']
+        if new['Date'][0] < cached_dates[0]:
+            merged = {}
+            keep = ~np.isin(new['Date'], cached_dates)
+            for column in COLUMN_DTYPES:
+                merged[column] = np.concatenate([new[column][keep], np.asarray(maps[column])])
+            order = np.argsort(merged['Date'], kind='stable')
+            return self._rewrite(ticker, {column: values[order] for column, values in merged.items()}, meta)
+
+        after = new['Date'] > cached_dates[-1]
+        if not after.any():
+            return 0
+
+        for column in COLUMN_DTYPES:
+            with open(self._column_path(ticker, column), 'ab') as f:
+                f.write(new[column][after].tobytes())
+
+        # Readers size their maps from meta, so bump rows only after the data is on disk
+        added = int(after.sum())
+        meta['rows'] += added
+        self._write_meta(ticker, meta)
+        return added
+
+    def _rewrite(self, ticker, columns, meta):
+        # Replace the files instead of truncating them, open maps keep the old data
+        for column in COLUMN_DTYPES:
+            path = self._column_path(ticker, column)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(columns[column].tobytes())
+            os.replace(path + '.tmp', path)
+
+        with self._lock:
+            self._maps.pop(ticker, None)
+        meta['rows'] = len(columns['Date'])
+        self._write_meta(ticker, meta)
+        return meta['rows']
+
+    def _to_columns(self, df):
+        df = df.sort_index()
+        df = df[~df.index.duplicated(keep='last')]
+        dates = pd.DatetimeIndex(df.index).tz_localize(None).normalize()
+        columns = {'Date': dates.as_unit('ns').asi8.astype(COLUMN_DTYPES['Date'])}
+        for column in OHLCV_COLUMNS:
+            if column == 'Volume':
+                # The int64 file has no NaN, a missing volume is stored as 0
+                columns[column] = np.nan_to_num(df[column].to_numpy(dtype=float)).astype(COLUMN_DTYPES[column])
+            else:
+                columns[column] = df[column].to_numpy().astype(COLUMN_DTYPES[column])
+        return columns
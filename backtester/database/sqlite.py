@@ -1,16 +1,34 @@
+import argparse
+import os
+import threading
+import time
+import zlib
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
 import pandas as pd
 import sqlite3
 import yfinance as yf
 from asset_universe import *
+from column_cache import ColumnCache
 
 pd.set_option('display.max_rows', None)
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', None)
 
 ### Database connection and table creation ###
-conn = sqlite3.connect('daily_stock_prices.db')
+DB_PATH = os.environ.get('DAILY_PRICES_DB', 'daily_stock_prices.db')
+CACHE_DIR = os.environ.get('PRICE_CACHE_DIR', 'price_cache')
+
+conn = sqlite3.connect(DB_PATH)
 cursor = conn.cursor()
 
+# WAL lets the dashboard keep reading while ingestion writes, NORMAL sync is safe under WAL
+cursor.execute('PRAGMA journal_mode=WAL')
+cursor.execute('PRAGMA synchronous=NORMAL')
+cursor.execute('PRAGMA temp_store=MEMORY')
+cursor.execute('PRAGMA cache_size=-65536')  # 64 MB
+
 cursor.execute('''
 CREATE TABLE IF NOT EXISTS daily_prices (
     ticker TEXT,
@@ -24,17 +42,37 @@ CREATE TABLE IF NOT EXISTS daily_prices (
 ''')
 conn.commit()
 
+# Every read is a range of one ticker's timestamps, nothing filters on timestamp alone
 cursor.execute('''
-CREATE INDEX IF NOT EXISTS idx_daily_prices_timestamp 
-ON daily_prices(timestamp)
+CREATE INDEX IF NOT EXISTS idx_daily_prices_ticker_timestamp
+ON daily_prices(ticker, timestamp)
 ''')
+cursor.execute('DROP INDEX IF EXISTS idx_daily_prices_timestamp')
 conn.commit()
 
+_readers = threading.local()
+
+
+def read_connection():
+    """This thread's read-only connection, so queries never share conn with ingestion."""
+    reader = getattr(_readers, 'conn', None)
+    if reader is None:
+        reader = _readers.conn = sqlite3.connect(Path(os.path.abspath(DB_PATH)).as_uri() + '?mode=ro', uri=True)
+    return reader
+
+# Memory-mapped column files read by get_ohlcv, kept in sync with daily_prices
+column_cache = ColumnCache(CACHE_DIR)
+
+INSERT_PRICES = "INSERT INTO daily_prices (ticker, timestamp, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
 ### Price Data ###
-def fetch_daily_data(ticker):
+def fetch_daily_data(ticker, start=None):
     try:
-        # Fetch data using yfinance
-        df = yf.download(ticker, period='max', interval='1d', auto_adjust=True)
+        # Fetch data using yfinance, only the missing range when start is given
+        if start:
+            df = yf.download(ticker, start=start, interval='1d', auto_adjust=True)
+        else:
+            df = yf.download(ticker, period='max', interval='1d', auto_adjust=True)
         df.reset_index(inplace=True)
         
         df['Date'] = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d')
@@ -56,12 +94,44 @@ def fetch_daily_data(ticker):
         print(f"Failed to fetch data for {ticker}: {e}")
         return None
 
+@lru_cache(maxsize=None)
+def _stub_calendar(start):
+    dates = pd.bdate_range(start or '2000-01-03', pd.Timestamp.today().normalize())
+    offset = len(pd.bdate_range('2000-01-03', dates[0])) - 1 if len(dates) else 0
+    return dates.strftime('%Y-%m-%d').to_numpy(), offset
+
+
+def stub_fetch_daily_data(ticker, start=None):
+    """Offline stand-in for fetch_daily_data: a seeded random walk per ticker up to today."""
+    timestamps, offset = _stub_calendar(start)
+    rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+    # Walk from 2000 so the same ticker always gives the same bars whatever the start
+    steps = rng.normal(0, 0.02, offset + len(timestamps))
+    close = 100 * np.exp(np.cumsum(steps))[offset:]
+    steps = steps[offset:]
+
+    return pd.DataFrame({
+        'ticker': ticker,
+        'timestamp': timestamps,
+        'open': close * (1 - steps / 4),
+        'high': close * (1 + np.abs(steps) / 2),
+        'low': close * (1 - np.abs(steps) / 2),
+        'close': close,
+        'volume': rng.integers(1_000, 1_000_000, len(timestamps)),
+    })
+
+
 def get_latest_timestamp(ticker):
     query = "SELECT MAX(timestamp) FROM daily_prices WHERE ticker = ?"
     cursor.execute(query, (ticker,))
     result = cursor.fetchone()[0]
     return result
 
+def get_latest_timestamps():
+    # One grouped scan instead of a MAX(timestamp) lookup per ticker
+    cursor.execute("SELECT ticker, MAX(timestamp) FROM daily_prices GROUP BY ticker")
+    return dict(cursor.fetchall())
+
 def store_data_to_db(data, latest_timestamp):
     if data is not None:
         data['timestamp'] = pd.to_datetime(data['timestamp']).dt.strftime('%Y-%m-%d')
@@ -74,25 +144,116 @@ def store_data_to_db(data, latest_timestamp):
 
         if not data.empty:
             data.to_sql('daily_prices', conn, if_exists='append', index=False)
+            store_data_to_cache(data, latest_timestamp)
             print(f"Data for {data['ticker'].iloc[0]} stored successfully.")
         else:
             print('No new data to store.')
     else:
         print('No data to store.')
 
+def store_data_to_cache(data, latest_timestamp):
+    ticker = data['ticker'].iloc[0]
+
+    # Only extend the cache if it already holds everything the database had,
+    # otherwise get_ohlcv fills the gap from daily_prices on the next read
+    covered = column_cache.coverage(ticker)
+    if covered is not None and latest_timestamp and covered[1] <= latest_timestamp:
+        return
+
+    frame = data.set_index(pd.to_datetime(data['timestamp']))
+    frame = frame.rename(columns={
+        'open': 'Open',
+        'high': 'High',
+        'low': 'Low',
+        'close': 'Close',
+        'volume': 'Volume'
+    })
+    end = (frame.index[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    column_cache.write(ticker, frame, data['timestamp'].iloc[0], end)
+
+
+def bulk_ingest(tickers, fetcher=fetch_daily_data, chunk_size=50_000):
+    """
+    Ingests every ticker, fetching only the days after its latest stored
+    timestamp (looked up for all tickers in one query). Rows are buffered and written with executemany, one
+    transaction per chunk of chunk_size rows. Returns a stats dict and
+    prints the throughput.
+    """
+    stats = {'tickers': 0, 'rows': 0, 'errors': [], 'lookup_seconds': 0.0, 'fetch_seconds': 0.0, 'write_seconds': 0.0}
+    buffer = []
+    pending = []  # (data, latest_timestamp) waiting for the column cache until their chunk commits
+
+    def flush():
+        t0 = time.perf_counter()
+        with conn:
+            conn.executemany(INSERT_PRICES, buffer)
+        for data, latest_timestamp in pending:
+            store_data_to_cache(data, latest_timestamp)
+        stats['rows'] += len(buffer)
+        stats['write_seconds'] += time.perf_counter() - t0
+        buffer.clear()
+        pending.clear()
+
+    start_time = time.perf_counter()
+    latest_timestamps = get_latest_timestamps()
+    stats['lookup_seconds'] = time.perf_counter() - start_time
+    for i, ticker in enumerate(tickers):
+        try:
+            latest_timestamp = latest_timestamps.get(ticker)
+            start = None
+            if latest_timestamp:
+                start = (pd.Timestamp(latest_timestamp) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+            t0 = time.perf_counter()
+            data = fetcher(ticker, start)
+            stats['fetch_seconds'] += time.perf_counter() - t0
+
+            if data is None or data.empty:
+                continue
+            # Fetchers already return 'YYYY-MM-DD' timestamps
+            data = data[['ticker', 'timestamp', 'open', 'high', 'low', 'close', 'volume']].assign(ticker=ticker)
+            if latest_timestamp:
+                data = data[data['timestamp'] > latest_timestamp]
+            if data.empty:
+                continue
+
+            buffer.extend(data.itertuples(index=False, name=None))
+            pending.append((data, latest_timestamp))
+            stats['tickers'] += 1
+            if len(buffer) >= chunk_size:
+                flush()
+        except Exception as e:
+            print(f"Error processing {ticker}: {e}")
+            stats['errors'].append(ticker)
+
+        if (i + 1) % 100 == 0:
+            print(f"Processed {i + 1}/{len(tickers)} tickers")
+
+    if buffer:
+        flush()
+
+    elapsed = time.perf_counter() - start_time
+    stats['seconds'] = elapsed
+    print(f"\nIngested {stats['rows']} rows for {stats['tickers']} tickers in {elapsed:.2f}s "
+          f"({stats['rows'] / elapsed if elapsed else 0:,.0f} rows/s, "
+          f"lookup {stats['lookup_seconds']:.2f}s, fetch {stats['fetch_seconds']:.2f}s, write {stats['write_seconds']:.2f}s)")
+    return stats
+
 
 ### Querying Data ###
 def query_data(ticker, start_time, end_time):
     start_time = pd.to_datetime(start_time).strftime('%Y-%m-%d')
     end_time = pd.to_datetime(end_time).strftime('%Y-%m-%d')
     
+    # Bounds on the raw column keep the (ticker, timestamp) index usable, the
+    # exclusive day after end_time still takes rows stored with a time
     query = """
     SELECT * FROM daily_prices
     WHERE ticker = ?
-    AND date(timestamp) BETWEEN ? AND ?
+    AND timestamp >= ? AND timestamp < ?
     ORDER BY timestamp ASC
     """
-    df = pd.read_sql(query, conn, params=(ticker, start_time, end_time))
+    end_bound = (pd.Timestamp(end_time) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    df = pd.read_sql(query, read_connection(), params=(ticker, start_time, end_bound))
     
     df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d')
     
@@ -116,7 +277,7 @@ def check_database_stats():
     GROUP BY ticker
     ORDER BY row_count DESC
     """
-    df_stats = pd.read_sql(query_details, conn)
+    df_stats = pd.read_sql(query_details, read_connection())
     
     print(f"\nTotal unique tickers in database: {unique_count}")
     print("\nFirst 10 tickers and their row counts:")
@@ -126,7 +287,7 @@ def check_database_stats():
 
 def get_tracked_tickers():
     query = "SELECT DISTINCT ticker FROM daily_prices"
-    df = pd.read_sql(query, conn)
+    df = pd.read_sql(query, read_connection())
     return set(df['ticker'].tolist())
 
 def update_tracking_list(new_tickers):
@@ -192,35 +353,33 @@ def main():
     
     print(f"\nTotal tickers to process (including delisted): {len(all_tracked_tickers)}")
     
-    processed_count = 0
-    error_count = 0
-    error_tickers = []
-
-    for ticker in all_tracked_tickers:
-        print(f"\nProcessing ticker [{processed_count + 1}/{len(all_tracked_tickers)}]: {ticker}")
-        try:
-            latest_timestamp = get_latest_timestamp(ticker)
-            data = fetch_daily_data(ticker)
-            store_data_to_db(data, latest_timestamp)
-            processed_count += 1
-        except Exception as e:
-            print(f"Error processing {ticker}: {e}")
-            error_count += 1
-            error_tickers.append(ticker)
-            continue
+    stats = bulk_ingest(sorted(all_tracked_tickers))
 
     print("\nProcessing Complete!")
-    print(f"Successfully processed: {processed_count} tickers")
-    print(f"Errors encountered: {error_count} tickers")
-    if error_tickers:
+    print(f"Successfully processed: {len(all_tracked_tickers) - len(stats['errors'])} tickers")
+    print(f"Errors encountered: {len(stats['errors'])} tickers")
+    if stats['errors']:
         print("Tickers with errors:")
-        print(error_tickers)        
+        print(stats['errors'])
 
 if __name__ == '__main__':
-    check_database_stats()
-    print("\nStarting main processing...")
-    main()
-    check_database_stats()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stub', type=int, metavar='N',
+                        help="Ingest N synthetic tickers with stub_fetch_daily_data instead of Yahoo, to benchmark offline "
+                             "(point DAILY_PRICES_DB and PRICE_CACHE_DIR at scratch paths)")
+    args = parser.parse_args()
+
+    if args.stub:
+        stub_tickers = [f"STUB{i:04d}" for i in range(args.stub)]
+        print("Initial load:")
+        bulk_ingest(stub_tickers, fetcher=stub_fetch_daily_data)
+        print("Incremental run (nothing new to fetch):")
+        bulk_ingest(stub_tickers, fetcher=stub_fetch_daily_data)
+    else:
+        check_database_stats()
+        print("\nStarting main processing...")
+        main()
+        check_database_stats()
     conn.close()
 
 
@@ -1,12 +1,16 @@
 import streamlit as st
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from backtest.backtest_runner import backtest_strategy
+import time
+from contextlib import closing
+from backtest.backtest_runner import run_backtest, ENGINES
+from backtest.batch_runner import iter_universe, TopK
+from backtest.metrics import METRICS, compute_metrics, returns_matrix
+from backtest.charts import chart_image
+from backtest.ledger import trade_stats
+from backtest.instrumentation import RunTimings, PROFILERS, enable_timing_log, profile_call, timed
 from datetime import datetime
-import quantstats as qs
 from utils.data_handler import load_stock_list
-import time
+import os
 
 
 
@@ -39,6 +43,7 @@ commission = st.number_input("Commission", value=0.001)
 
 strategies = ["Trend Change", "RSI Diff"]
 selected_strategy = st.selectbox("Select Strategy", strategies)
+selected_engine = st.selectbox("Engine", ENGINES, help="vectorized gives the same returns much faster, without the backtrader plot.")
 
 strategy_params = {}
 if selected_strategy == "Trend Change":
@@ -67,62 +72,175 @@ show_individual_results = st.radio(
     ("Show Each Backtest Result", "Show Summary Only")
 )
 
-if st.button("Run Batch Analysis"):
+max_workers = st.number_input(
+    "Worker Processes",
+    min_value=1,
+    value=os.cpu_count() or 1
+)
+lean_frames = st.checkbox("Lean frames", help="float32 prices and only the indicator columns the strategies read, about a fifth of the memory for large universes. Returns follow the float32 prices.")
+
+with st.expander("Instrumentation"):
+    record_timings = st.checkbox("Record stage timings", help="Wall time of loading, indicators, the run, plots and metrics, also logged as JSON lines.")
+    trace_memory = st.checkbox("Trace peak memory", help="Uses tracemalloc, which makes the runs noticeably slower.")
+    profile_stock = st.selectbox("Profile one run", ["None"] + stock_list)
+    selected_profiler = st.selectbox("Profiler", PROFILERS)
+
+top_k = st.number_input("Top K by Sharpe", min_value=1, value=20, help="Size of the leaderboard updated as results arrive.")
+
+col1, col2 = st.columns(2)
+run_batch = col1.button("Run Batch Analysis")
+# Clicking any button reruns the page, which interrupts a batch in progress
+# and cancels its queued tickers. What finished so far stays in session_state.
+col2.button("Cancel")
+
+METRIC_COLUMNS = ['Stock'] + METRICS
+
+
+def metrics_frame(rows):
+    return pd.DataFrame(rows, columns=METRIC_COLUMNS).sort_values(by='Sharpe Ratio', ascending=False)
+
+
+def top_frame(top):
+    return pd.DataFrame(top.items(), columns=METRIC_COLUMNS)
+
+
+def show_chart(records, timings=None):
+    """Draws the chart of the one stock picked, from the record its run kept."""
+    st.subheader("Charts")
+    stock = st.selectbox("Chart of", ["None"] + list(records), key='chart_stock')
+    if stock != "None":
+        with timed(timings, stock, 'plot'):
+            st.image(chart_image(records[stock], stock), use_container_width=True)
+        st.dataframe(pd.DataFrame([trade_stats(records[stock]['ledger'])]), hide_index=True)
+
+
+if run_batch:
     metrics = []
+    records = {}
+    st.session_state['batch_metrics'] = metrics
+    st.session_state['batch_records'] = records
+    st.session_state['batch_status'] = 'running'
+    top = TopK(int(top_k))
+
+    timings = None
+    if record_timings:
+        enable_timing_log()
+        timings = RunTimings(trace_memory)
 
     # Progress
     num_of_stocks = len(stock_list)  
     progress_bar = st.progress(0) 
     progress_text = st.empty() 
 
-    # Loop 
-    for i, stock in enumerate(stock_list):
-        stock = stock.strip()
-
+    st.subheader(f"Top {int(top_k)} by Sharpe Ratio")
+    top_table = st.empty()
+    st.subheader("Backtest Metrics")
+    metrics_table = st.empty()
+
+    def report_progress(done, total, stock):
+        progress_text.text(f"Finishing processing {done} stocks out of {total} stocks.")
+        progress_bar.progress(done / total)
+
+    # Runs only keep a compact record to chart; charts are drawn when a stock is picked
+    results = iter_universe(
+        stock_list,
+        start_date=start_date.strftime('%Y-%m-%d'),
+        end_date=end_date.strftime('%Y-%m-%d'),
+        initial_cash=initial_cash,
+        commission=commission,
+        strategy=selected_strategy,
+        strategy_params=strategy_params,
+        engine=selected_engine,
+        max_workers=int(max_workers),
+        precompute_indicators=True,
+        timings=timings,
+        keep_records=show_individual_results == "Show Each Backtest Result",
+        lean_frames=lean_frames,
+    )
+    num_of_stocks = len(dict.fromkeys(stock.strip() for stock in stock_list))
+    st.session_state['batch_total'] = num_of_stocks
+
+    def add_metrics(pending):
+        """Scores a chunk of finished runs in one pass over their dates x stocks returns matrix."""
+        returns_by_stock = {result['Stock']: result['returns'] for result in pending
+                            if not result['error'] and result['returns'] is not None and not result['returns'].empty}
+        if returns_by_stock:
+            with timed(timings, f"{len(returns_by_stock)} stocks", 'metrics'):
+                table = compute_metrics(returns_matrix(returns_by_stock))
+        for result in pending:
+            stock = result['Stock']
+            row = {'Stock': stock, **dict.fromkeys(METRICS)}
+            if result['error']:
+                st.write(f"Error with {stock}: {result['error']}")
+            elif stock in returns_by_stock:
+                row.update(table.loc[stock].to_dict())
+            metrics.append(row)
+            top.add(row['Sharpe Ratio'], row)
+        top_table.dataframe(top_frame(top), use_container_width=True)
+
+    # Results are scored in chunks, and re-rendering every row is quadratic,
+    # so the tables refresh at most every half second and the full one every second
+    pending = []
+    last_flush = last_refresh = 0.0
+    with closing(results):
+        for done, result in enumerate(results, start=1):
+            pending.append(result)
+            if result.get('record') is not None:
+                records[result['Stock']] = result['record']
+            report_progress(done, num_of_stocks, result['Stock'])
+
+            if time.perf_counter() - last_flush > 0.5:
+                add_metrics(pending)
+                pending = []
+                last_flush = time.perf_counter()
+            if time.perf_counter() - last_refresh > 1:
+                metrics_table.dataframe(metrics_frame(metrics), use_container_width=True)
+                last_refresh = time.perf_counter()
+
+    add_metrics(pending)
+    st.session_state['batch_status'] = 'done'
+    metrics_table.dataframe(metrics_frame(metrics), use_container_width=True)
+
+    if records:
+        show_chart(records, timings)
+
+    if timings is not None:
+        timings.stop()
+        st.subheader("Stage Timings")
+        st.dataframe(timings.table(), use_container_width=True)
+
+    if profile_stock != "None":
+        st.subheader(f"Profile of {profile_stock}")
         try:
-            progress_text.text(f"Finishing processing {i + 1} stocks out of {num_of_stocks} stocks.")
-            progress_bar.progress((i + 1) / num_of_stocks)  
-
-            returns = backtest_strategy(
-                code=stock,
-                start_date=start_date.strftime('%Y-%m-%d'),
-                end_date=end_date.strftime('%Y-%m-%d'),
-                initial_cash=initial_cash,
-                commission=commission,
-                strategy=selected_strategy,
-                strategy_params=strategy_params,
-                show_individual_results=(show_individual_results == "Show Each Backtest Result")
-            )
-
-            if returns is not None and not returns.empty:
-                sharpe = qs.stats.sharpe(returns)
-                calmar = qs.stats.calmar(returns)
-
-                # Store the metrics 
-                metrics.append({
-                    'Stock': stock,
-                    'Sharpe Ratio': sharpe,
-                    'Calmar Ratio': calmar
-                })
-            else:
-                metrics.append({
-                    'Stock': stock,
-                    'Sharpe Ratio': None,
-                    'Calmar Ratio': None
-                })
-
+            _, report = profile_call(lambda: run_backtest(
+                profile_stock,
+                start_date.strftime('%Y-%m-%d'),
+                end_date.strftime('%Y-%m-%d'),
+                initial_cash,
+                commission,
+                selected_strategy,
+                strategy_params,
+                engine=selected_engine
+            ), selected_profiler)
+            st.code(report)
         except Exception as e:
-            st.write(f"Error with {stock}: {str(e)}")
-            metrics.append({
-                'Stock': stock,
-                'Sharpe Ratio': None,
-                'Calmar Ratio': None
-            })
-
-        time.sleep(0.1)
-
-    metrics_df = pd.DataFrame(metrics)
-    metrics_df_sorted = metrics_df.sort_values(by='Sharpe Ratio', ascending=False)
-
+            st.error(str(e))
+
+elif st.session_state.get('batch_metrics') is not None:
+    # Results of the last batch, which a rerun (e.g. Cancel) may have interrupted
+    metrics = st.session_state['batch_metrics']
+    if st.session_state['batch_status'] == 'running':
+        st.session_state['batch_status'] = 'cancelled'
+    if st.session_state['batch_status'] == 'cancelled':
+        st.warning(f"Batch cancelled after {len(metrics)} of {st.session_state['batch_total']} stocks, showing partial results.")
+
+    top = TopK(int(top_k))
+    for row in metrics:
+        top.add(row['Sharpe Ratio'], row)
+    st.subheader(f"Top {int(top_k)} by Sharpe Ratio")
+    st.dataframe(top_frame(top), use_container_width=True)
     st.subheader("Backtest Metrics")
-    st.dataframe(metrics_df_sorted, use_container_width=True)
\ No newline at end of file
+    st.dataframe(metrics_frame(metrics), use_container_width=True)
+
+    if st.session_state.get('batch_records'):
+        show_chart(st.session_state['batch_records'])
@@ -1,13 +1,12 @@
 import streamlit as st
-from backtest.backtest_runner import backtest_strategy
+from backtest.backtest_runner import backtest_strategy, ENGINES
 from datetime import datetime
-import pandas as pd
-import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
-import quantstats as qs
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.indicator_cache import IndicatorCache
+from backtest.result_cache import get_default_result_cache
+from backtest.search import SEARCH_METHODS, SEARCH_SPACES, backtest_objective, grid, search
+from backtest.walk_forward import walk_forward
+from backtest.instrumentation import RunTimings, PROFILERS, enable_timing_log, profile_call, timed
 
 st.title("Backtest and Optimization Dashboard")
 
@@ -21,6 +20,7 @@ commission = st.number_input("Commission", value=0.001)
 # Strategy Selection
 strategies = ["Trend Change", "RSI Diff"]
 selected_strategy = st.selectbox("Select Strategy", strategies)
+selected_engine = st.selectbox("Engine", ENGINES, help="vectorized gives the same returns much faster, without the backtrader plot.")
 
 strategy_params = {}
 if selected_strategy == "Trend Change":
@@ -44,40 +44,85 @@ elif selected_strategy == "RSI Diff":
         'rsi_diff_threshold': rsi_diff_threshold,
     }
 
+with st.expander("Instrumentation"):
+    record_timings = st.checkbox("Record stage timings", help="Wall time of loading, indicators, the run, the plot and metrics, also logged as JSON lines.")
+    trace_memory = st.checkbox("Trace peak memory", help="Uses tracemalloc, which makes the run noticeably slower.")
+    profile_run = st.checkbox("Profile the backtest")
+    selected_profiler = st.selectbox("Profiler", PROFILERS)
+
 # Buttons
-col1, col2 = st.columns(2)
+col1, col2, col3 = st.columns(3)
 run_backtest = col1.button("Run Backtest")
 run_optimization = col2.button("Run Optimization")
-
+run_walk_forward = col3.button("Run Walk-Forward")
+
+with st.expander("Optimization"):
+    search_method = st.selectbox("Search Method", list(SEARCH_METHODS),
+                                 help="Grid runs every combination. Random, Successive Halving and TPE sample the grid within the budget, "
+                                      "Successive Halving races combinations on growing windows of the most recent history.")
+    search_budget = st.slider("Budget (% of the grid)", min_value=5, max_value=100, value=100,
+                              help="Lower it with an adaptive method to trade the exhaustive result for speed.")
+    search_patience = st.number_input("Stop after N evaluations without improvement (0 = never)", min_value=0, value=0)
+    search_seed = st.number_input("Random Seed", min_value=0, value=0)
+
+with st.expander("Walk-Forward"):
+    train_months = st.number_input("Train Months", min_value=1, value=24)
+    test_months = st.number_input("Test Months", min_value=1, value=6)
+    anchored = st.checkbox("Anchored", help="Train on all history since the start instead of a rolling window.")
+    optimize_folds = st.checkbox("Optimize each fold", value=True,
+                                 help="Pick the best parameters of the optimization grid on each train window. Otherwise the parameters above are used.")
+
+# quantstats is imported inside the run branches, so the page renders without it
 if run_backtest:
+    import quantstats as qs
+
     st.write(f"Running backtest for {selected_strategy} strategy...")
-    returns = backtest_strategy(
-        code=stock_code,
-        start_date=start_date.strftime('%Y-%m-%d'),
-        end_date=end_date.strftime('%Y-%m-%d'),
-        initial_cash=initial_cash,
-        commission=commission,
-        strategy=selected_strategy,
-        strategy_params=strategy_params,
-    )
+    timings = None
+    if record_timings:
+        enable_timing_log()
+        timings = RunTimings(trace_memory)
+
+    def run_single_backtest():
+        return backtest_strategy(
+            code=stock_code,
+            start_date=start_date.strftime('%Y-%m-%d'),
+            end_date=end_date.strftime('%Y-%m-%d'),
+            initial_cash=initial_cash,
+            commission=commission,
+            strategy=selected_strategy,
+            strategy_params=strategy_params,
+            engine=selected_engine,
+            timings=timings,
+        )
+
+    profile_report = None
+    if profile_run:
+        try:
+            returns, profile_report = profile_call(run_single_backtest, selected_profiler)
+        except ValueError as e:
+            st.error(str(e))
+            returns = None
+    else:
+        returns = run_single_backtest()
 
     if returns is not None and not returns.empty:
         st.write("Backtest completed successfully.")
         st.subheader("QuantStats Analysis")
-        cumulative_returns = qs.stats.compsum(returns)
-        final_cumulative_return = cumulative_returns.iloc[-1]
-
-        st.write(f"**Final Cumulative Return**: {final_cumulative_return:.2%}")
-        st.write(f"**Annualized Return (CAGR)**: {qs.stats.cagr(returns):.2%}")
-        st.write(f"**Max Drawdown**: {qs.stats.max_drawdown(returns):.2%}")
-        st.write(f"**Sharpe Ratio**: {qs.stats.sharpe(returns):.2f}")
-
-        static_dir = "static"
-        if not os.path.exists(static_dir):
-            os.makedirs(static_dir)
-        report_name = f"{stock_code}_{selected_strategy}_report.html".replace(" ", "_")
-        output_path = os.path.join(static_dir, report_name)
-        qs.reports.html(returns, output=output_path)
+        with timed(timings, stock_code, 'metrics'):
+            cumulative_returns = qs.stats.compsum(returns)
+            final_cumulative_return = cumulative_returns.iloc[-1]
+
+            st.write(f"**Final Cumulative Return**: {final_cumulative_return:.2%}")
+            st.write(f"**Annualized Return (CAGR)**: {qs.stats.cagr(returns):.2%}")
+            st.write(f"**Max Drawdown**: {qs.stats.max_drawdown(returns):.2%}")
+            st.write(f"**Sharpe Ratio**: {qs.stats.sharpe(returns):.2f}")
+
+            static_dir = "static"
+            if not os.path.exists(static_dir):
+                os.makedirs(static_dir)
+            report_name = f"{stock_code}_{selected_strategy}_report.html".replace(" ", "_")
+            output_path = os.path.join(static_dir, report_name)
+            qs.reports.html(returns, output=output_path)
 
         with open(output_path, "r") as f:
             st.download_button(
@@ -89,68 +134,100 @@ if run_backtest:
     else:
         st.write("No returns data available from the backtest.")
 
+    if timings is not None:
+        timings.stop()
+        st.subheader("Stage Timings")
+        st.dataframe(timings.table(), use_container_width=True)
+
+    if profile_report is not None:
+        st.subheader("Profile")
+        st.code(profile_report)
+
 if run_optimization:
-    st.write("Running optimization with multithreading...")
+    st.write(f"Running {search_method.lower()} search...")
 
-    if selected_strategy == "Trend Change":
-        atr_window_range = range(5, 51, 5)
-        atr_multiplier_range = np.arange(1.0, 5.1, 0.5)
-        param_grid = [(w, m) for w in atr_window_range for m in atr_multiplier_range]
-    elif selected_strategy == "RSI Diff":
-        rsi_short_range = range(3, 21, 2)
-        rsi_long_range = range(20, 51, 5)
-        param_grid = [(s, l) for s in rsi_short_range for l in rsi_long_range]
+    space = SEARCH_SPACES[selected_strategy]
+    total_combinations = len(grid(space))
+    max_evaluations = max(1, round(search_budget / 100 * total_combinations))
 
     # Progress
     progress_bar = st.progress(0)
-    total_combinations = len(param_grid)
-    sharpe_results = []
-
-    def run_single_optimization(params):
-        """Function to run backtest for a single set of parameters."""
-        if selected_strategy == "Trend Change":
-            temp_params = {'atr_window': params[0], 'atr_multiplier': params[1]}
-        elif selected_strategy == "RSI Diff":
-            temp_params = {'rsi_short': params[0], 'rsi_long': params[1]}
-        
-        returns = backtest_strategy(
-            code=stock_code,
-            start_date=start_date.strftime('%Y-%m-%d'),
-            end_date=end_date.strftime('%Y-%m-%d'),
-            initial_cash=initial_cash,
-            commission=commission,
-            strategy=selected_strategy,
-            strategy_params=temp_params,
-        )
-        
-        if returns is not None and not returns.empty:
-            sharpe_ratio = qs.stats.sharpe(returns)
-            return (*params, sharpe_ratio)
-        return (*params, None)
-
-    # Multithreading
-    with ThreadPoolExecutor() as executor:
-        futures = {executor.submit(run_single_optimization, params): params for params in param_grid}
-        for i, future in enumerate(as_completed(futures)):
-            result = future.result()
-            if result[-1] is not None:  # Check if Sharpe Ratio is available
-                sharpe_results.append(result)
-            progress_bar.progress((i + 1) / total_combinations)
-
-    if selected_strategy == "Trend Change":
-        sharpe_df = pd.DataFrame(
-            sharpe_results,
-            columns=["atr_window", "atr_multiplier", "Sharpe Ratio"]
-        )
-    elif selected_strategy == "RSI Diff":
-        sharpe_df = pd.DataFrame(
-            sharpe_results,
-            columns=["rsi_short", "rsi_long", "Sharpe Ratio"]
-        )
+    progress_text = st.empty()
+
+    def report_progress(log):
+        progress_bar.progress(min(log.cost / max_evaluations, 1.0))
+        best = log.best()
+        if best is not None:
+            progress_text.text(f"{log.cost:.1f} of {max_evaluations} backtests, best Sharpe Ratio so far {best[1]:.2f}")
+
+    # Prices and indicators are computed once per distinct parameter value
+    indicator_cache = IndicatorCache()
+    objective = backtest_objective(
+        stock_code,
+        start_date.strftime('%Y-%m-%d'),
+        end_date.strftime('%Y-%m-%d'),
+        initial_cash,
+        commission,
+        selected_strategy,
+        engine=selected_engine,
+        indicator_cache=indicator_cache,
+        result_cache=get_default_result_cache(),
+    )
+    log = search(
+        search_method,
+        space,
+        objective,
+        max_evaluations=max_evaluations,
+        patience=int(search_patience) or None,
+        seed=int(search_seed),
+        max_workers=os.cpu_count() or 1,
+        callback=report_progress,
+    )
+    progress_bar.progress(1.0)
+
+    # Full-history results only, the shorter successive halving windows are not comparable
+    sharpe_df = log.frame()
+    sharpe_df = sharpe_df[sharpe_df['Window'] >= 1].drop(columns=['Window'])
+    if log.stop_reason == 'patience':
+        st.caption(f"Stopped early after {search_patience} evaluations without improvement.")
 
     st.write("Optimization Completed. Results:")
     st.dataframe(sharpe_df)
 
-    # Best Parameters and Heatmap
-    best_params = sharpe_df.loc[sharpe_df["Sharpe Ratio"].idxmax()]
-    st.write(f"**Best Parameters:** {best_params.to_dict()}")
+    result_cache = get_default_result_cache()
+    if result_cache is not None:
+        cache_stats = result_cache.stats
+        st.caption(f"Result cache: {cache_stats['memory_hits']} memory hits, "
+                   f"{cache_stats['disk_hits']} disk hits, {cache_stats['misses']} misses")
+
+    # Best Parameters
+    best = log.best()
+    if best is not None:
+        st.write(f"**Best Parameters:** {best[0]} (Sharpe Ratio {best[1]:.2f}, {log.cost:.1f} of {total_combinations} backtests)")
+
+if run_walk_forward:
+    st.write("Running walk-forward validation...")
+    try:
+        # About 21 trading days a month
+        walk_result = walk_forward(
+            stock_code,
+            start_date.strftime('%Y-%m-%d'),
+            end_date.strftime('%Y-%m-%d'),
+            initial_cash,
+            commission,
+            selected_strategy,
+            strategy_params,
+            space=SEARCH_SPACES[selected_strategy] if optimize_folds else None,
+            train_bars=int(train_months) * 21,
+            test_bars=int(test_months) * 21,
+            anchored=anchored,
+            engine=selected_engine,
+        )
+    except ValueError as e:
+        st.error(str(e))
+    else:
+        st.subheader("Folds")
+        st.dataframe(walk_result['folds'], use_container_width=True)
+        st.subheader("Stitched Out-of-Sample Results")
+        st.dataframe(walk_result['metrics'].to_frame().T, use_container_width=True)
+        st.line_chart((1 + walk_result['returns']).cumprod() * initial_cash)
@@ -0,0 +1,242 @@
+"""
+Headless batch runner: backtests a universe file without Streamlit, for
+cron jobs and batch nodes.
+
+The universe can be split into shards so several processes or machines
+each run one. A ticker always lands in the same shard (a hash of its code),
+however the file is ordered. Each shard writes its metrics and its daily
+returns (one row per stock and date) to the output directory, and
+--merge combines the shard files afterwards.
+
+--refresh-indicators STATE is the daily job of the incremental indicator
+engine: it loads the saved per-ticker state (a new one if the file does
+not exist), extends every ticker's indicators by the bars published since,
+saves the state and writes the new rows to the output directory.
+
+From the repository root or the backtester directory:
+    python -m backtester.run utils/sp500_list.txt --strategy "Trend Change" --param atr_window=20
+    python -m backtester.run utils/sp500_list.txt --shards 4 --shard 0 --output results
+    python -m backtester.run --merge results
+    python -m backtester.run utils/sp500_list.txt --refresh-indicators indicators.state --output indicators
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import date
+
+# The modules import each other as top-level packages (utils, backtest, ...)
+BACKTESTER_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKTESTER_DIR not in sys.path:
+    sys.path.insert(0, BACKTESTER_DIR)
+
+import pandas as pd
+from utils.config import DATA_PARAMS
+from utils.data_handler import read_stock_list, build_indicator_params, warmup_start
+from utils.incremental import IncrementalIndicatorEngine, INDICATOR_COLUMNS
+from utils.data_provider import get_default_provider
+from backtest.backtest_runner import ENGINES
+from backtest.batch_runner import iter_universe
+from backtest.metrics import METRICS, compute_metrics, returns_matrix
+
+STRATEGIES = ["Trend Change", "RSI Diff"]
+FORMATS = ["parquet", "csv"]
+
+
+def shard_of(code, shards):
+    """Shard index of a ticker, stable across runs, machines and file order."""
+    return zlib.crc32(code.encode('utf-8')) % shards
+
+
+def select_shard(codes, shards, shard):
+    return [code for code in dict.fromkeys(codes) if shard_of(code, shards) == shard]
+
+
+def parse_param(text):
+    """KEY=VALUE, with VALUE parsed as JSON when possible (numbers, true/false), else kept as a string."""
+    key, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected KEY=VALUE, got '{text}'.")
+    try:
+        value = json.loads(value)
+    except json.JSONDecodeError:
+        pass
+    return key.strip(), value
+
+
+METRIC_COLUMNS = ['Stock'] + METRICS + ['Days', 'Error']
+
+
+def metrics_frame(results):
+    """One row per result, with the metrics of all of them computed in one pass."""
+    returns_by_stock = {result['Stock']: result['returns'] for result in results
+                        if result['returns'] is not None and not result['returns'].empty}
+    table = compute_metrics(returns_matrix(returns_by_stock)) if returns_by_stock else None
+    rows = []
+    for result in results:
+        stock = result['Stock']
+        row = {'Stock': stock, **dict.fromkeys(METRICS), 'Days': 0, 'Error': result['error']}
+        if stock in returns_by_stock:
+            row.update(table.loc[stock].to_dict())
+            row['Days'] = len(returns_by_stock[stock])
+        rows.append(row)
+    return pd.DataFrame(rows, columns=METRIC_COLUMNS)
+
+
+def returns_frame(result):
+    returns = result['returns']
+    if returns is None or returns.empty:
+        return None
+    return pd.DataFrame({
+        'Date': returns.index.tz_localize(None) if returns.index.tz is not None else returns.index,
+        'Stock': result['Stock'],
+        'Return': returns.to_numpy(),
+    })
+
+
+def write_frame(df, path, fmt):
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def read_frame(path):
+    return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+
+
+def resolve_universe(path):
+    """Universe paths may also be given relative to the backtester directory, e.g. utils/sp500_list.txt."""
+    if not os.path.exists(path) and os.path.exists(os.path.join(BACKTESTER_DIR, path)):
+        return os.path.join(BACKTESTER_DIR, path)
+    return path
+
+
+def run_shard(args):
+    codes = read_stock_list(resolve_universe(args.universe))
+    selected = select_shard(codes, args.shards, args.shard)
+    print(f"Shard {args.shard}/{args.shards}: {len(selected)} of {len(dict.fromkeys(codes))} tickers", file=sys.stderr)
+
+    results, returns = [], []
+    start_time = time.perf_counter()
+    stream = iter_universe(
+        selected,
+        start_date=args.start,
+        end_date=args.end,
+        initial_cash=args.initial_cash,
+        commission=args.commission,
+        strategy=args.strategy,
+        strategy_params=dict(args.param),
+        max_workers=args.workers,
+        provider=get_default_provider(),
+        engine=args.engine,
+        precompute_indicators=True,
+        lean_frames=args.lean,
+    )
+    for done, result in enumerate(stream, start=1):
+        results.append(result)
+        frame = returns_frame(result)
+        if frame is not None:
+            returns.append(frame)
+        status = f"error: {result['error']}" if result['error'] else "ok"
+        print(f"[{done}/{len(selected)}] {result['Stock']} {status}", file=sys.stderr)
+
+    os.makedirs(args.output, exist_ok=True)
+    suffix = f"shard{args.shard:03d}-of-{args.shards:03d}.{args.format}"
+    metrics_df = metrics_frame(results)
+    returns_df = pd.concat(returns, ignore_index=True) if returns else pd.DataFrame(columns=['Date', 'Stock', 'Return'])
+    write_frame(metrics_df, os.path.join(args.output, f"metrics-{suffix}"), args.format)
+    write_frame(returns_df, os.path.join(args.output, f"returns-{suffix}"), args.format)
+
+    failed = int(metrics_df['Error'].notna().sum())
+    print(f"Wrote {len(metrics_df)} stocks ({failed} failed) to {args.output} in {time.perf_counter() - start_time:.1f}s", file=sys.stderr)
+
+
+def refresh_indicators(args):
+    """
+    Extends the saved indicators of the shard's tickers up to --end
+    (exclusive). Tickers new to the state start from the warm-up before
+    --start. The new rows go to indicators-<end>-shard....<format>.
+    """
+    codes = select_shard(read_stock_list(resolve_universe(args.universe)), args.shards, args.shard)
+    params = build_indicator_params(dict(args.param))
+    if os.path.exists(args.refresh_indicators):
+        engine = IncrementalIndicatorEngine.load(args.refresh_indicators)
+        if args.param and engine.params != params:
+            raise SystemExit(f"{args.refresh_indicators} was built with {engine.params}, not {params}.")
+    else:
+        engine = IncrementalIndicatorEngine(params)
+
+    start_time = time.perf_counter()
+    updates = engine.refresh(codes, args.end, warmup_start(args.start), get_default_provider())
+    engine.save(args.refresh_indicators)
+
+    frames = [update.rename_axis('Date').reset_index().assign(Stock=code) for code, update in updates.items() if not update.empty]
+    rows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['Date', 'Stock'] + INDICATOR_COLUMNS)
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"indicators-{args.end}-shard{args.shard:03d}-of-{args.shards:03d}.{args.format}")
+    write_frame(rows[['Date', 'Stock'] + INDICATOR_COLUMNS], path, args.format)
+    print(f"Refreshed {len(codes)} tickers ({len(rows)} new rows) to {path} in {time.perf_counter() - start_time:.1f}s",
+          file=sys.stderr)
+
+
+def merge_shards(output, fmt):
+    """Concatenates the shard files in output into metrics.<fmt> and returns.<fmt>."""
+    for kind in ['metrics', 'returns']:
+        paths = sorted(glob.glob(os.path.join(output, f"{kind}-shard*")))
+        if not paths:
+            raise FileNotFoundError(f"No {kind} shard files in {output}.")
+        merged = pd.concat([read_frame(path) for path in paths], ignore_index=True)
+        if kind == 'metrics':
+            merged = merged.sort_values(by='Sharpe Ratio', ascending=False)
+        path = os.path.join(output, f"{kind}.{fmt}")
+        write_frame(merged, path, fmt)
+        print(f"Merged {len(paths)} {kind} shards into {path}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('universe', nargs='?', help='universe file, one ticker per line')
+    parser.add_argument('--strategy', choices=STRATEGIES, default="Trend Change")
+    parser.add_argument('--param', type=parse_param, action='append', default=[], metavar='KEY=VALUE',
+                        help='strategy parameter, e.g. atr_window=20 (repeatable)')
+    parser.add_argument('--start', default='2012-01-01')
+    parser.add_argument('--end', default=date.today().strftime('%Y-%m-%d'))
+    parser.add_argument('--initial-cash', type=float, default=100000)
+    parser.add_argument('--commission', type=float, default=0.001)
+    parser.add_argument('--engine', choices=ENGINES, default="vectorized",
+                        help='vectorized (default) gives the same returns as backtrader, much faster')
+    parser.add_argument('--lean', action='store_true',
+                        help='float32 prices and only the indicator columns the strategies read, about a fifth of the memory')
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--shard', type=int, default=0, help='0-based index of the shard to run')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--output', default='results')
+    parser.add_argument('--format', choices=FORMATS, default="parquet")
+    parser.add_argument('--offline', action='store_true', help='only read the local price store, never yfinance')
+    parser.add_argument('--merge', metavar='DIR', help='merge the shard files in DIR instead of running')
+    parser.add_argument('--refresh-indicators', metavar='STATE',
+                        help='extend the incremental indicators saved in STATE instead of running, see above')
+    args = parser.parse_args(argv)
+
+    if args.merge:
+        merge_shards(args.merge, args.format)
+        return
+    if args.universe is None:
+        parser.error("a universe file is required unless --merge is given")
+    if not 0 <= args.shard < args.shards:
+        parser.error(f"--shard must be between 0 and {args.shards - 1}")
+    if args.offline:
+        DATA_PARAMS['offline'] = True
+
+    if args.refresh_indicators:
+        refresh_indicators(args)
+        return
+    run_shard(args)
+
+
+if __name__ == '__main__':
+    main()
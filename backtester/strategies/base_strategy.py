@@ -1,28 +1,48 @@
+import logging
 import backtrader as bt
+from backtest.ledger import TradeLedger, TRADE_LOGGER, CREATE, FILL, REJECT, BUY, SELL
+
+logger = logging.getLogger(TRADE_LOGGER)
 
 class BaseStrategy(bt.Strategy):
     params = (
         ('position_size', 0.8),
     )
+    # Indicators (names in utils.data_handler.INDICATORS) the strategy reads from its data feed,
+    # the runners compute only these
+    indicator_lines = ()
 
     def __init__(self):
         self.dataclose = self.datas[0].close
         self.order = None
         self.last_direction = None
+        # Every order and fill of the run, see backtest.ledger
+        self.ledger = TradeLedger()
 
-    def log(self, txt, dt=None):
+    def log(self, txt, *args, dt=None):
+        # Off unless enable_trade_log was called, and then nothing gets formatted
+        if not logger.isEnabledFor(logging.INFO):
+            return
         dt = dt or self.datas[0].datetime.date(0)
-        print(f'{dt.isoformat()} {txt}')
+        logger.info('%s ' + txt, dt.isoformat(), *args)
 
     def notify_order(self, order):
-        if order.status in [order.Submitted, order.Accepted]:
+        side = BUY if order.isbuy() else SELL
+        if order.status == order.Submitted:
+            self.ledger.add(bt.num2date(order.created.dt), CREATE, side, abs(order.created.size), order.created.price)
+            return
+        if order.status == order.Accepted:
             return
 
         if order.status in [order.Completed]:
+            self.ledger.add(bt.num2date(order.executed.dt), FILL, side, abs(order.executed.size),
+                            order.executed.price, order.executed.comm)
             if order.isbuy():
-                self.log(f'BUY EXECUTED, Price: {order.executed.price:.2f}, Size: {order.executed.size}')
+                self.log('BUY EXECUTED, Price: %.2f, Size: %s', order.executed.price, order.executed.size)
             elif order.issell():
-                self.log(f'SELL EXECUTED, Price: {order.executed.price:.2f}, Size: {order.executed.size}')
+                self.log('SELL EXECUTED, Price: %.2f, Size: %s', order.executed.price, order.executed.size)
+        elif order.status in [order.Canceled, order.Margin, order.Rejected]:
+            self.ledger.add(self.datas[0].datetime.date(0), REJECT, side, abs(order.created.size), order.created.price)
 
         self.order = None
 
@@ -9,6 +9,7 @@ class TrendStrategy(BaseStrategy):
         ('use_absolute', True),
         ('position_size', 0.8)
     )
+    indicator_lines = ('Direction',)
 
     def __init__(self):
         super().__init__()  # Inherit from BaseStrategy
@@ -23,11 +24,11 @@ class TrendStrategy(BaseStrategy):
         if current_direction != self.last_direction:
             if current_direction == 1 and not self.position:
                 size = int(self.broker.getcash() * self.params.position_size / self.dataclose[0])
-                self.log(f'BUY CREATE, Price: {self.dataclose[0]:.2f}, Size: {size}')
+                self.log('BUY CREATE, Price: %.2f, Size: %s', self.dataclose[0], size)
                 self.order = self.buy(size=size)
             elif current_direction == -1 and self.position:
                 size = self.position.size
-                self.log(f'SELL CREATE, Price: {self.dataclose[0]:.2f}, Size: {size}')
+                self.log('SELL CREATE, Price: %.2f, Size: %s', self.dataclose[0], size)
                 self.order = self.sell(size=size)
 
         self.last_direction = current_direction
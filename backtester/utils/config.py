@@ -1,3 +1,5 @@
+import os
+
 STRATEGY_PARAMS = {
     'ATR_window': 14,
     'ATR_multiplier': 3,
@@ -7,4 +9,24 @@ STRATEGY_PARAMS = {
     },
     'Direction_threshold': 0.05,
     'Use_absolute': True
-}
\ No newline at end of file
+}
+
+DATA_PARAMS = {
+    # SQLite database filled by database/sqlite.py
+    'db_path': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'daily_stock_prices.db'),
+    # Memory-mapped per-ticker column files kept in front of the database, None to disable
+    'cache_dir': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'price_cache'),
+    # When True, get_ohlcv only reads the local store and never calls yfinance
+    'offline': False,
+}
+
+RESULT_CACHE_PARAMS = {
+    # Set to False to always rerun backtests
+    'enabled': True,
+    # Pickled backtest returns, None to keep results in memory only
+    'cache_dir': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'result_cache'),
+    # Results kept in memory, least recently used dropped first
+    'max_entries': 256,
+    # Size limit of cache_dir, least recently used files deleted first
+    'max_disk_bytes': 256 * 1024 * 1024,
+}
@@ -1,151 +1,476 @@
-import yfinance as yf
+import os
 from datetime import datetime
 import pandas as pd
-import backtrader as bt
-from .config import STRATEGY_PARAMS\
-# from backtester.database.sqlite import query_data 
-
-
-def get_ohlcv(code, start_date, end_date):
-    extended_start = (datetime.strptime(start_date, '%Y-%m-%d') - pd.Timedelta(days=100)).strftime('%Y-%m-%d')
-    ticker = yf.Ticker(code)
-    df = ticker.history(start=extended_start, end=end_date)
+import numpy as np
+from .config import STRATEGY_PARAMS
+from .data_provider import get_default_provider, OHLCV_COLUMNS
+
+# Column types of lean frames (see get_ohlcv and get_secondary_data)
+LEAN_DTYPES = {
+    'Open': np.float32,
+    'High': np.float32,
+    'Low': np.float32,
+    'Close': np.float32,
+    'Volume': np.float32,
+    'Direction': np.int8,
+    'RSI_Diff': np.float32,
+}
+
+# Calendar days get_ohlcv loads before start_date, so the indicators are warmed up by then
+WARMUP_DAYS = 100
+
+
+def warmup_start(start_date):
+    """The first date get_ohlcv fetches for start_date."""
+    return (datetime.strptime(start_date, '%Y-%m-%d') - pd.Timedelta(days=WARMUP_DAYS)).strftime('%Y-%m-%d')
+
+
+def get_ohlcv(code, start_date, end_date, provider=None, lean=False):
+    """
+    Daily bars of code from start_date on, with a Date column repeating the
+    index and a Ticker column.
+
+    With lean=True the frame is built in one copy from the fetched arrays:
+    only the OHLCV columns as float32 (LEAN_DTYPES), the Ticker as a
+    categorical, and no Date column, the dates are the index (see
+    frame_dates). About a quarter of the memory of a full frame, for runs
+    that hold a whole universe at once.
+    """
+    if provider is None:
+        provider = get_default_provider()
+
+    df = provider.fetch(code, warmup_start(start_date), end_date)
+    if df.empty:
+        raise ValueError(f"No price data found for {code}.")
+    if lean:
+        first = df.index.searchsorted(pd.Timestamp(start_date))
+        columns = {column: df[column].to_numpy()[first:].astype(LEAN_DTYPES[column]) for column in OHLCV_COLUMNS}
+        columns['Ticker'] = pd.Categorical.from_codes(np.zeros(len(df) - first, dtype=np.int8), categories=[code])
+        return pd.DataFrame(columns, index=df.index[first:], copy=False)
     df = df[start_date:]
     df['Date'] = df.index
     df['Ticker'] = code
     return df
 
-# import sqlite3
-# import pandas as pd
 
-# db_path = 'C:\\Users\\User\\Desktop\\backtester\\database\\daily_stock_prices.db'
+def frame_dates(df):
+    """Bar dates of a get_ohlcv frame, from its Date column or, for lean frames, its index."""
+    return df['Date'].to_numpy() if 'Date' in df.columns else df.index.to_numpy()
 
 
-# def connect_to_db(db_path):
-#     try:
-#         # Establish the connection
-#         conn = sqlite3.connect(db_path)
-#         print("Successfully connected to the database.")
-#         return conn
-#     except sqlite3.Error as e:
-#         print(f"Database connection failed: {e}")
-#         return None
+def rolling_mean(values, window):
+    """
+    Trailing mean of the last window values along the first axis, NaN until
+    the window is full or while it holds a NaN (like .rolling(window).mean()).
 
-# def query_data(ticker, start_time, end_time, db_path):
-#     start_time = pd.to_datetime(start_time).strftime('%Y-%m-%d')
-#     end_time = pd.to_datetime(end_time).strftime('%Y-%m-%d')
+    Every window is summed from scratch in bar order instead of with a
+    running sum, so a bar's value only depends on the values in its window.
+    That keeps results bit-for-bit identical whether they come from the full
+    history, a panel, or an incremental update from saved state.
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    n = len(values) - window + 1
+    if n <= 0:
+        return out
 
-#     conn = sqlite3.connect(db_path)
-    
-#     query = """
-#     SELECT * FROM daily_prices
-#     WHERE ticker = ?
-#     AND date(timestamp) BETWEEN ? AND ?
-#     ORDER BY timestamp ASC
-#     """
-#     df = pd.read_sql(query, conn, params=(ticker, start_time, end_time))
+    total = values[:n].copy()
+    for k in range(1, window):
+        total += values[k:k + n]
+    out[window - 1:] = total / window
+    return out
 
-#     conn.close()
 
-#     df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d')
+def get_direction(df, threshold, atr_mode): ### For trend_change
+    # The Direction node of the indicator graph, on a frame
+    atr = df['ATR'].to_numpy(dtype=float) if atr_mode else None
+    return _direction(
+        df['High'].to_numpy(dtype=float),
+        df['Low'].to_numpy(dtype=float),
+        df['Close'].to_numpy(dtype=float),
+        atr,
+        threshold=threshold,
+        atr_mode=atr_mode,
+    )
+
+
+def get_direction_array(high, low, close, threshold, atr=None, atr_mode=False, state=None, return_state=False):
+    """
+    Array version of get_direction.
+
+    Takes 1D arrays (bars) for a single ticker or 2D arrays (tickers x bars)
+    for a whole universe and returns the direction labels with the same
+    shape: 1 for up trend, -1 for down trend. Bars before a ticker's first
+    valid High (e.g. before its listing date in a panel) are labeled 0.
+
+    For 1D input, return_state=True also returns the (up_trend, last_high,
+    last_low) reached after the last bar (None if no bar was valid), and
+    passing it back as state continues labeling where that call stopped.
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    close = np.asarray(close, dtype=float)
+    if atr_mode:
+        if atr is None:
+            raise ValueError("ATR values are required when atr_mode is enabled.")
+        atr = np.asarray(atr, dtype=float)
+
+    if high.ndim == 1:
+        directions, state = _direction_1d(high, low, close, threshold, atr, atr_mode, state)
+        return (directions, state) if return_state else directions
+    if high.ndim == 2:
+        if state is not None or return_state:
+            raise ValueError("Direction state is only supported for 1D price arrays.")
+        return _direction_2d(high, low, close, threshold, atr, atr_mode)
+    raise ValueError(f"Expected 1D or 2D price arrays, got {high.ndim}D.")
+
+
+def _direction_1d(high, low, close, threshold, atr, atr_mode, state=None):
+    directions = np.zeros(len(high), dtype=np.int64)
+    if state is not None:
+        start = 0
+    else:
+        valid = np.flatnonzero(~np.isnan(high))
+        if len(valid) == 0:
+            return directions, None
+        start = valid[0]
+
+    # Plain Python floats are much faster to step through than numpy scalars
+    highs = high.tolist()
+    lows = low.tolist()
+    closes = close.tolist()
+    thresholds = atr.tolist() if atr_mode else None
+
+    if state is not None:
+        up_trend, last_high, last_low = state
+    else:
+        up_trend = True
+        last_high = highs[start]
+        last_low = highs[start]
+
+    for i in range(start, len(highs)):
+        if atr_mode:
+            threshold = thresholds[i]
+        if up_trend:
+            if highs[i] > last_high:
+                last_high = highs[i]
+            elif (not atr_mode and (closes[i] < last_high * (1 - threshold))) or \
+                    (atr_mode and (closes[i] < last_high - threshold)):
+                up_trend = False
+                last_low = lows[i]
+        else:
+            if lows[i] < last_low:
+                last_low = lows[i]
+            elif (not atr_mode and (closes[i] > last_low * (1 + threshold))) or \
+                    (atr_mode and (closes[i] > last_low + threshold)):
+                up_trend = True
+                last_high = highs[i]
 
-#     return df
+        directions[i] = 1 if up_trend else -1
 
-# def get_ohlcv(ticker, start_time, end_time, db_path):
-#     # Query the database for OHLCV data
-#     df = query_data(ticker, start_time, end_time, db_path)
+    return directions, (up_trend, last_high, last_low)
 
-#     # Process df to return only the relevant columns and capitalize their names
-#     df = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
-#     df.columns = df.columns.str.capitalize()  # Capitalize the first letter of each column name
 
-#     return df
+def _direction_2d(high, low, close, threshold, atr, atr_mode):
+    n_tickers, n_bars = high.shape
+    directions = np.zeros((n_tickers, n_bars), dtype=np.int64)
+    if n_bars == 0:
+        return directions
 
+    # Each ticker starts tracking from its first valid bar
+    valid = ~np.isnan(high)
+    has_data = valid.any(axis=1)
+    start = np.where(has_data, valid.argmax(axis=1), n_bars)
+    rows = np.arange(n_tickers)
 
+    up_trend = np.ones(n_tickers, dtype=bool)
+    last_high = np.where(has_data, high[rows, np.minimum(start, n_bars - 1)], np.nan)
+    last_low = last_high.copy()
 
+    # Step bars in order, updating every ticker at once
+    for i in range(n_bars):
+        h, l, c = high[:, i], low[:, i], close[:, i]
+        if atr_mode:
+            threshold = atr[:, i]
 
-def get_direction(df, threshold, atr_mode): ### For trend_change
-    up_trend = True
-    last_high_i = 0
-    last_low_i = 0
-    last_high = df['High'].iloc[0]
-    last_low = df['High'].iloc[0]
-    directions = []
-
-    for i in range(len(df)):
+        new_high = up_trend & (h > last_high)
         if atr_mode:
-            threshold = df['ATR'].iloc[i]
-        if up_trend:
-            if df['High'].iloc[i] > last_high:
-                last_high_i = i
-                last_high = df['High'].iloc[i]
-            elif (not atr_mode and (df['Close'].iloc[i] < last_high * (1 - threshold))) or \
-                    (atr_mode and (df['Close'].iloc[i] < last_high - threshold)):
-                up_trend = False
-                last_low_i = i
-                last_low = df['Low'].iloc[i]
+            turn_down = up_trend & ~new_high & (c < last_high - threshold)
         else:
-            if df['Low'].iloc[i] < last_low:
-                last_low_i = i
-                last_low = df['Low'].iloc[i]
-            elif (not atr_mode and (df['Close'].iloc[i] > last_low * (1 + threshold))) or \
-                    (atr_mode and (df['Close'].iloc[i] > last_low + threshold)):
-                up_trend = True
-                last_high_i = i
-                last_high = df['High'].iloc[i]
+            turn_down = up_trend & ~new_high & (c < last_high * (1 - threshold))
+
+        down_trend = ~up_trend
+        new_low = down_trend & (l < last_low)
+        if atr_mode:
+            turn_up = down_trend & ~new_low & (c > last_low + threshold)
+        else:
+            turn_up = down_trend & ~new_low & (c > last_low * (1 + threshold))
 
-        directions.append(1 if up_trend else -1)  # numerical values for backtrader
+        last_high = np.where(new_high | turn_up, h, last_high)
+        last_low = np.where(new_low | turn_down, l, last_low)
+        up_trend = (up_trend & ~turn_down) | turn_up
+
+        directions[:, i] = np.where(i >= start, np.where(up_trend, 1, -1), 0)
 
     return directions
 
 
+# The RSI, TR and ATR nodes of the indicator graph, on Series and frames
+
 def calculate_rsi(data, periods=14): ## For rsi_diff
-    delta = data.diff()
+    return pd.Series(_rsi(data.to_numpy(dtype=float), periods), index=data.index)
+
+def get_true_range(df): ## For trend_change
+    high, low, close = (df[column].to_numpy(dtype=float) for column in ['High', 'Low', 'Close'])
+    return pd.Series(_true_range(high, low, close), index=df.index)
+
+
+def get_atr(true_range, window, multiplier):
+    return pd.Series(_scale(rolling_mean(true_range, window), multiplier), index=true_range.index)
+
 
-    gain = (delta.where(delta > 0, 0))
-    loss = (-delta.where(delta < 0, 0))
+# Strategy parameters that feed get_secondary_data
+STRATEGY_PARAM_KEYS = {
+    'atr_window': 'ATR_window',
+    'atr_multiplier': 'ATR_multiplier',
+    'direction_threshold': 'Direction_threshold',
+    'use_absolute': 'Use_absolute',
+}
 
-    avg_gain = gain.rolling(window=periods).mean()
-    avg_loss = loss.rolling(window=periods).mean()
 
-    rs = avg_gain / avg_loss
+def build_indicator_params(strategy_params=None):
+    """
+    Indicator parameters for get_secondary_data: STRATEGY_PARAMS overridden
+    by the matching strategy parameters (atr_window, atr_multiplier,
+    direction_threshold, use_absolute, rsi_short, rsi_long).
+    """
+    strategy_params = strategy_params or {}
+    params = dict(STRATEGY_PARAMS)
+    params['RSI_periods'] = dict(STRATEGY_PARAMS['RSI_periods'])
 
-    rsi = 100 - (100 / (1 + rs))
+    for strategy_key, indicator_key in STRATEGY_PARAM_KEYS.items():
+        if strategy_key in strategy_params:
+            params[indicator_key] = strategy_params[strategy_key]
+    if 'rsi_short' in strategy_params:
+        params['RSI_periods']['short'] = strategy_params['rsi_short']
+    if 'rsi_long' in strategy_params:
+        params['RSI_periods']['long'] = strategy_params['rsi_long']
 
-    return rsi
+    # Widgets hand over numpy/float values, rolling windows need ints
+    params['ATR_window'] = int(params['ATR_window'])
+    params['RSI_periods']['short'] = int(params['RSI_periods']['short'])
+    params['RSI_periods']['long'] = int(params['RSI_periods']['long'])
+    return params
 
-def get_secondary_data(df, params=None):
+
+# Columns get_secondary_data adds by default, and lean frames when no lines are given
+SECONDARY_COLUMNS = ['TR', 'ATR', 'Direction', 'RSI_7', 'RSI_30', 'RSI_Diff']
+LEAN_COLUMNS = ['Direction', 'RSI_Diff']
+
+
+class Indicator:
+    """
+    One node of the indicator graph.
+
+    compute(*inputs, **params) returns the node's values from the values of
+    its inputs, which are other indicators or price columns, and from its
+    params, each read from the indicator parameters (see
+    build_indicator_params) at a key path like ('RSI_periods', 'short').
+    inputs may also be a function of the indicator parameters, for nodes
+    whose inputs depend on them. Nodes of the same kind with the same inputs
+    and parameters are the same computation and share one result. Cheap
+    nodes set memoize=False so caches do not hold their values.
+    """
+
+    __slots__ = ('name', 'kind', 'compute', 'inputs', 'params', 'memoize')
+
+    def __init__(self, name, compute, inputs, params=None, kind=None, memoize=True):
+        self.name = name
+        self.kind = kind or name
+        self.compute = compute
+        self.inputs = inputs
+        self.params = params or {}
+        self.memoize = memoize
+
+    def input_names(self, params):
+        return list(self.inputs(params) if callable(self.inputs) else self.inputs)
+
+    def param_values(self, params):
+        values = {}
+        for argument, path in self.params.items():
+            value = params
+            for key in path:
+                value = value[key]
+            values[argument] = value
+        return values
+
+
+# Every indicator a strategy can read, by name
+INDICATORS = {}
+
+
+def register_indicator(name, compute, inputs, params=None, kind=None, memoize=True):
+    """Adds an indicator to INDICATORS, see Indicator for the arguments."""
+    INDICATORS[name] = Indicator(name, compute, inputs, params, kind, memoize)
+    return INDICATORS[name]
+
+
+def _previous(values):
+    """values shifted one bar later along the first axis, NaN on the first bar."""
+    previous = np.full_like(values, np.nan)
+    previous[1:] = values[:-1]
+    return previous
+
+
+def _true_range(high, low, close):
+    # fmax skips the NaN previous close on the first bar like .max(axis=1)
+    prev_close = _previous(close)
+    return np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+
+
+def _direction(high, low, close, atr=None, threshold=0.05, atr_mode=True):
+    if high.ndim == 1:
+        return get_direction_array(high, low, close, threshold, atr=atr, atr_mode=atr_mode)
+    # The kernel takes tickers x bars
+    return get_direction_array(high.T, low.T, close.T, threshold, atr=None if atr is None else atr.T, atr_mode=atr_mode).T
+
+
+def _scale(values, multiplier):
+    return values * multiplier
+
+
+def _rsi(close, periods):
+    return _panel_rsi(close, _previous(close), periods)
+
+
+register_indicator('TR', _true_range, ['High', 'Low', 'Close'])
+# The rolling mean is shared by every multiplier, scaling it is cheap
+register_indicator('ATR_mean', rolling_mean, ['TR'], {'window': ('ATR_window',)}, kind='ATR')
+register_indicator('ATR', _scale, ['ATR_mean'], {'multiplier': ('ATR_multiplier',)}, kind='ATR_scale', memoize=False)
+register_indicator('Direction', _direction,
+                   lambda params: ['High', 'Low', 'Close'] + (['ATR'] if params['Use_absolute'] else []),
+                   {'threshold': ('Direction_threshold',), 'atr_mode': ('Use_absolute',)})
+register_indicator('RSI_7', _rsi, ['Close'], {'periods': ('RSI_periods', 'short')}, kind='RSI')
+register_indicator('RSI_30', _rsi, ['Close'], {'periods': ('RSI_periods', 'long')}, kind='RSI')
+register_indicator('RSI_Diff', np.subtract, ['RSI_30', 'RSI_7'], memoize=False)
+
+
+def indicator_key(name, params):
+    """
+    Hashable identity of the computation behind name: its kind, parameter
+    values and the keys of its inputs. Price columns are their own key.
+    """
+    node = INDICATORS.get(name)
+    if node is None:
+        return name
+    return (node.kind, tuple(sorted(node.param_values(params).items())),
+            tuple(indicator_key(input_name, params) for input_name in node.input_names(params)))
+
+
+def compute_indicators(prices, lines, params=None, memo=None):
+    """
+    Values of the indicators named in lines, from prices, a mapping of price
+    columns to float arrays: 1D for one ticker, or 2D (dates x tickers) for a
+    panel. Only the part of the graph the lines depend on is evaluated, and
+    every node of it once.
+
+    memo(key, compute) is asked for every memoizable node with its
+    indicator_key and a function computing it, so a cache can share nodes
+    across calls (see IndicatorCache). Returns {line: array}.
+    """
     if params is None:
         params = STRATEGY_PARAMS  # Use default parameters
 
-    # ATR calculation
-    df['TR'] = pd.DataFrame({
-        'HL': df['High'] - df['Low'],
-        'HC': abs(df['High'] - df['Close'].shift(1)),
-        'LC': abs(df['Low'] - df['Close'].shift(1))
-    }).max(axis=1)
-    df['ATR'] = df['TR'].rolling(window=params['ATR_window']).mean() * params['ATR_multiplier']
+    values = {}
+
+    def evaluate(name):
+        if name not in values:
+            node = INDICATORS.get(name)
+            if node is None:
+                if name not in prices:
+                    raise ValueError(f"Unknown indicator or price column '{name}'.")
+                values[name] = prices[name]
+            else:
+                def compute():
+                    return node.compute(*[evaluate(input_name) for input_name in node.input_names(params)],
+                                        **node.param_values(params))
+                if memo is not None and node.memoize:
+                    values[name] = memo(indicator_key(name, params), compute)
+                else:
+                    values[name] = compute()
+        return values[name]
+
+    return {line: evaluate(line) for line in lines}
+
+
+def get_secondary_data(df, params=None, lean=False, lines=None):
+    """
+    Adds indicator columns to df, in place, and returns it.
+
+    lines names the indicators to add (see INDICATORS), e.g. the
+    indicator_lines a strategy declares; only what they depend on is
+    computed. By default that is SECONDARY_COLUMNS: TR, ATR, Direction,
+    RSI_7, RSI_30 and RSI_Diff. With lean=True the default is LEAN_COLUMNS
+    and the columns get the LEAN_DTYPES (float32 when not listed), computed
+    in float64 from the frame's prices.
+    """
+    if lines is None:
+        lines = LEAN_COLUMNS if lean else SECONDARY_COLUMNS
+    prices = {column: df[column].to_numpy(dtype=float) for column in ['High', 'Low', 'Close']}
+    for line, values in compute_indicators(prices, lines, params).items():
+        df[line] = values.astype(LEAN_DTYPES.get(line, np.float32)) if lean else values
+    return df
 
-    # Direction calculation
-    df['Direction'] = get_direction(df, params['Direction_threshold'], params['Use_absolute'])
 
-    # RSI calculations
-    df['RSI_7'] = calculate_rsi(df['Close'], periods=params['RSI_periods']['short'])
-    df['RSI_30'] = calculate_rsi(df['Close'], periods=params['RSI_periods']['long'])
-    df['RSI_Diff'] = df['RSI_30'] - df['RSI_7']
+def get_panel_indicators(high, low, close, params=None, lines=None):
+    """
+    get_secondary_data for a whole universe in one vectorized pass.
+
+    Takes aligned 2D arrays (dates x tickers) of High, Low and Close, with NaN
+    for dates before a ticker's listing, and returns a dict of 2D arrays with
+    the lines get_secondary_data adds (SECONDARY_COLUMNS by default). 1D
+    arrays of a single ticker work too. A ticker's values match running
+    get_secondary_data on its own bars, as long as its bars are a contiguous
+    run of the panel's dates.
+    """
+    prices = {
+        'High': np.asarray(high, dtype=float),
+        'Low': np.asarray(low, dtype=float),
+        'Close': np.asarray(close, dtype=float),
+    }
+    return compute_indicators(prices, SECONDARY_COLUMNS if lines is None else lines, params)
+
+
+def _panel_rsi(close, prev_close, periods):
+    delta = close - prev_close
+    listed = ~np.isnan(close)
+
+    # The first bar counts as no change, bars before listing count as missing
+    gain = np.where(listed, np.where(delta > 0, delta, 0.0), np.nan)
+    loss = np.where(listed, np.where(delta < 0, -delta, 0.0), np.nan)
+
+    avg_gain = rolling_mean(gain, periods)
+    avg_loss = rolling_mean(loss, periods)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+
+def read_stock_list(file_path):
+    """Tickers of a universe file, one per line like utils/*_list.txt. HSI codes get their .HK suffix."""
+    with open(file_path, 'r') as file:
+        stock_list = [line.strip() for line in file.readlines() if line.strip()]
+
+    if "hsi" in os.path.basename(file_path).lower():
+        stock_list = [f"{str(stock).zfill(4)}.HK" if len(str(stock).strip()) < 4 else f"{stock.strip()}.HK" for stock in stock_list]
+
+    return stock_list
 
-    return df
 
 def load_stock_list(file_name):
     try:
-        file_path = f"utils/{file_name}"
-        with open(file_path, 'r') as file:
-            stock_list = [line.strip() for line in file.readlines()]
-
-        if "hsi" in file_name.lower():
-            stock_list = [f"{str(stock).zfill(4)}.HK" if len(str(stock).strip()) < 4 else f"{stock.strip()}.HK" for stock in stock_list]
-        
-        return stock_list
+        return read_stock_list(f"utils/{file_name}")
     except FileNotFoundError:
         print(f"File {file_name} not found.")
         return []
@@ -0,0 +1,337 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from database.column_cache import ColumnCache
+from .config import DATA_PARAMS
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Same schema as database/sqlite.py
+CREATE_PRICES_TABLE = '''
+CREATE TABLE IF NOT EXISTS daily_prices (
+    ticker TEXT,
+    timestamp TEXT,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume INTEGER
+)
+'''
+
+# Serves every per-ticker range read, the predicates below compare the raw column so it can be used
+CREATE_PRICES_INDEX = '''
+CREATE INDEX IF NOT EXISTS idx_daily_prices_ticker_timestamp
+ON daily_prices(ticker, timestamp)
+'''
+
+CREATE_COVERAGE_TABLE = '''
+CREATE TABLE IF NOT EXISTS price_coverage (
+    ticker TEXT PRIMARY KEY,
+    start TEXT,
+    end TEXT
+)
+'''
+
+FETCH_PRICES = '''
+SELECT timestamp, open, high, low, close, volume FROM daily_prices
+WHERE ticker = ?
+AND timestamp >= ? AND timestamp < ?
+ORDER BY timestamp ASC
+'''
+
+# Tickers per query_panel statement, keeps the bound parameters under SQLite's 999 on older builds
+MAX_PANEL_TICKERS = 500
+
+
+def panel_query(n_tickers):
+    """The query_panel statement for n_tickers tickers, bound as (*tickers, start_date, end_date)."""
+    return f'''
+    SELECT ticker, timestamp, open, high, low, close, volume FROM daily_prices
+    WHERE ticker IN ({', '.join('?' * n_tickers)})
+    AND timestamp >= ? AND timestamp < ?
+    ORDER BY ticker, timestamp
+    '''
+
+
+def empty_ohlcv():
+    df = pd.DataFrame(columns=OHLCV_COLUMNS, dtype=float)
+    df.index = pd.DatetimeIndex([], name='Date')
+    return df
+
+
+def align_frames(frames):
+    """
+    Aligns {ticker: OHLCV frame} on the union of their dates. Returns
+    (dates, panel) where panel maps each of OHLCV_COLUMNS to a float array
+    with one row per date and one column per ticker, in the order of
+    frames, NaN where a ticker has no bar.
+    """
+    dates = pd.DatetimeIndex(np.unique(np.concatenate([df.index.values for df in frames.values()]
+                                                      + [np.array([], dtype='datetime64[ns]')])), name='Date')
+    panel = {column: np.full((len(dates), len(frames)), np.nan) for column in OHLCV_COLUMNS}
+    for j, df in enumerate(frames.values()):
+        rows = dates.get_indexer(df.index)
+        for column in OHLCV_COLUMNS:
+            panel[column][rows, j] = df[column].to_numpy(dtype=float)
+    return dates, panel
+
+
+class DataProvider:
+    """
+    Source of daily OHLCV bars.
+
+    fetch() returns a DataFrame indexed by a tz-naive 'Date' index with the
+    OHLCV_COLUMNS, covering start_date (inclusive) to end_date (exclusive),
+    the same range convention as yfinance.
+    """
+
+    def fetch(self, code, start_date, end_date):
+        raise NotImplementedError
+
+    def query_panel(self, codes, start_date, end_date):
+        """
+        Bars of every ticker in codes for [start_date, end_date), aligned
+        as described in align_frames. Each ticker is fetched on its own;
+        stores that can read many tickers at once override this.
+        """
+        return align_frames({code: self.fetch(code, start_date, end_date) for code in dict.fromkeys(codes)})
+
+
+class YFinanceProvider(DataProvider):
+    def fetch(self, code, start_date, end_date):
+        # Imported on first download, yfinance is slow to import and most reads hit the local store
+        import yfinance as yf
+
+        df = yf.Ticker(code).history(start=start_date, end=end_date)
+        if df.empty:
+            return empty_ohlcv()
+        df = df[OHLCV_COLUMNS]
+        df.index = pd.DatetimeIndex(df.index.tz_localize(None).normalize(), name='Date')
+        return df
+
+
+class SQLiteStore(DataProvider):
+    """
+    Local store on the daily_prices table.
+
+    The price_coverage table remembers which date range has already been
+    synced from the remote source for each ticker, so a range with no bars
+    (holidays, dates before listing) is not fetched again.
+
+    Reads go through one read-only connection per thread, opened on first
+    use and kept for the next reads; writes open their own connection.
+    Every read is a range on the (ticker, timestamp) index.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or DATA_PARAMS['db_path']
+        self._local = threading.local()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(CREATE_PRICES_TABLE)
+            conn.execute(CREATE_PRICES_INDEX)
+            conn.execute(CREATE_COVERAGE_TABLE)
+
+    def __getstate__(self):
+        # Connections stay with the thread that opened them
+        return {'db_path': self.db_path}
+
+    def __setstate__(self, state):
+        self.db_path = state['db_path']
+        self._local = threading.local()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def _reader(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = Path(os.path.abspath(self.db_path)).as_uri() + '?mode=ro'
+            conn = self._local.conn = sqlite3.connect(uri, uri=True)
+        return conn
+
+    def close(self):
+        """Closes this thread's read connection, the next read opens a new one."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def query_plan(self, query, params):
+        """The EXPLAIN QUERY PLAN details of query, e.g. to check that it searches an index."""
+        return [row[-1] for row in self._reader().execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+
+    def fetch(self, code, start_date, end_date):
+        rows = self._reader().execute(FETCH_PRICES, (code, start_date, end_date)).fetchall()
+        if not rows:
+            return empty_ohlcv()
+
+        df = pd.DataFrame(rows, columns=['Date'] + OHLCV_COLUMNS)
+        df['Date'] = pd.to_datetime(df['Date'])
+        for column in OHLCV_COLUMNS:
+            # A column of only NULLs comes back as objects
+            if df[column].dtype == object:
+                df[column] = df[column].astype(float)
+        return df.set_index('Date')
+
+    def query_panel(self, codes, start_date, end_date):
+        """
+        Same as DataProvider.query_panel, in one query per MAX_PANEL_TICKERS
+        tickers instead of one per ticker.
+        """
+        codes = list(dict.fromkeys(codes))
+        reader = self._reader()
+        rows = []
+        for first in range(0, len(codes), MAX_PANEL_TICKERS):
+            chunk = codes[first:first + MAX_PANEL_TICKERS]
+            rows += reader.execute(panel_query(len(chunk)), (*chunk, start_date, end_date)).fetchall()
+
+        frame = pd.DataFrame(rows, columns=['Ticker', 'Date'] + OHLCV_COLUMNS)
+        row_positions, dates = pd.factorize(frame['Date'], sort=True)
+        column_positions = pd.Index(codes).get_indexer(frame['Ticker'])
+        panel = {}
+        for column in OHLCV_COLUMNS:
+            panel[column] = np.full((len(dates), len(codes)), np.nan)
+            panel[column][row_positions, column_positions] = frame[column].to_numpy(dtype=float)
+        return pd.DatetimeIndex(pd.to_datetime(dates), name='Date'), panel
+
+    def coverage(self, code):
+        """Returns the synced (start, end) range for a ticker, or None."""
+        reader = self._reader()
+        row = reader.execute("SELECT start, end FROM price_coverage WHERE ticker = ?", (code,)).fetchone()
+        if row is None:
+            # Rows ingested by database/sqlite.py have no coverage entry yet
+            row = reader.execute("SELECT MIN(timestamp), MAX(timestamp) FROM daily_prices WHERE ticker = ?", (code,)).fetchone()
+            if row[0] is None:
+                return None
+            row = (row[0], _next_day(row[1]))
+        return row
+
+    def write(self, code, df, start_date, end_date):
+        """Stores bars fetched for [start_date, end_date) and extends the coverage."""
+        records = []
+        if not df.empty:
+            existing = set(self.fetch(code, start_date, end_date).index.strftime('%Y-%m-%d'))
+            for date, row in zip(df.index.strftime('%Y-%m-%d'), df[OHLCV_COLUMNS].itertuples(index=False)):
+                if date not in existing:
+                    records.append((code, date, _sql_value(row.Open, float), _sql_value(row.High, float), _sql_value(row.Low, float),
+                                    _sql_value(row.Close, float), _sql_value(row.Volume, int)))
+
+        covered = self.coverage(code)
+        if covered:
+            start_date = min(start_date, covered[0])
+            end_date = max(end_date, covered[1])
+
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT INTO daily_prices VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+            conn.execute("INSERT OR REPLACE INTO price_coverage VALUES (?, ?, ?)", (code, start_date, end_date))
+
+
+class ReadThroughProvider(DataProvider):
+    """
+    Serves bars from a local store and only calls the remote provider for the
+    part of the requested range the store has not synced yet. Whatever the
+    remote returns is written back into the store.
+
+    If the remote fails the bars already in the store are served, unless
+    raise_remote_errors is set. Set it when this provider is itself the
+    remote of another tier, so that tier does not mark the range as synced.
+
+    Only days before today are ever marked as synced: a range reaching into
+    the future is synced up to today, and bars dated today or later are not
+    stored, so later reads fetch the bars published since.
+    """
+
+    def __init__(self, store, remote=None, raise_remote_errors=False):
+        self.store = store
+        self.remote = remote
+        self.raise_remote_errors = raise_remote_errors
+
+    def fetch(self, code, start_date, end_date):
+        self._sync(code, start_date, end_date)
+        return self.store.fetch(code, start_date, end_date)
+
+    def query_panel(self, codes, start_date, end_date):
+        codes = list(dict.fromkeys(codes))
+        for code in codes:
+            self._sync(code, start_date, end_date)
+        if hasattr(self.store, 'query_panel'):
+            return self.store.query_panel(codes, start_date, end_date)
+        return align_frames({code: self.store.fetch(code, start_date, end_date) for code in codes})
+
+    def is_synced(self, code, start_date, end_date):
+        """True when fetch would serve the range from the store alone, without calling the remote."""
+        if self.remote is None:
+            return True
+        end_date = min(end_date, _today())
+        return start_date >= end_date or not self._missing_ranges(code, start_date, end_date)
+
+    def _sync(self, code, start_date, end_date):
+        if self.remote is None:
+            return
+        end_date = min(end_date, _today())
+        if start_date >= end_date:
+            return
+        for missing_start, missing_end in self._missing_ranges(code, start_date, end_date):
+            try:
+                df = self.remote.fetch(code, missing_start, missing_end)
+            except Exception as e:
+                if self.raise_remote_errors:
+                    raise
+                print(f"Remote fetch failed for {code} ({missing_start} to {missing_end}): {e}")
+                continue
+            # Today's bar may still change, it is stored once a later read syncs it
+            df = df[df.index < pd.Timestamp(missing_end)]
+            self.store.write(code, df, missing_start, missing_end)
+
+    def _missing_ranges(self, code, start_date, end_date):
+        covered = self.store.coverage(code)
+        if covered is None:
+            return [(start_date, end_date)]
+
+        # Fetch up to the edges of the synced range so it stays contiguous
+        missing = []
+        covered_start, covered_end = covered
+        if start_date < covered_start:
+            missing.append((start_date, covered_start))
+        if end_date > covered_end:
+            missing.append((covered_end, end_date))
+        return missing
+
+
+def _sql_value(value, cast):
+    # Missing values (e.g. no volume on an index) are stored as NULL, like to_sql does
+    return None if pd.isna(value) else cast(value)
+
+
+def _today():
+    return pd.Timestamp.today().strftime('%Y-%m-%d')
+
+
+def _next_day(date):
+    return (pd.Timestamp(date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+_default_provider = None
+
+
+def get_default_provider():
+    global _default_provider
+    if _default_provider is None:
+        remote = None if DATA_PARAMS['offline'] else YFinanceProvider()
+        if DATA_PARAMS['cache_dir']:
+            database = ReadThroughProvider(SQLiteStore(), remote, raise_remote_errors=True)
+            _default_provider = ReadThroughProvider(ColumnCache(DATA_PARAMS['cache_dir']), database)
+        else:
+            _default_provider = ReadThroughProvider(SQLiteStore(), remote)
+    return _default_provider
+
+
+def set_default_provider(provider):
+    """Overrides the provider used by get_ohlcv, e.g. a fixture database for offline runs."""
+    global _default_provider
+    _default_provider = provider
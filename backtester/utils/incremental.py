@@ -0,0 +1,145 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from .data_handler import rolling_mean, get_direction_array, build_indicator_params
+from .data_provider import get_default_provider
+
+INDICATOR_COLUMNS = ['TR', 'ATR', 'Direction', 'RSI_7', 'RSI_30', 'RSI_Diff']
+
+
+def _tail(values, size):
+    """Last size values, or all of them while the history is shorter."""
+    return values[max(len(values) - size, 0):]
+
+
+class IndicatorState:
+    """
+    Everything needed to extend one ticker's indicators by new bars: the
+    last close, the tail of each rolling window (window - 1 values), and the
+    up_trend/last_high/last_low reached by the direction state machine.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.last_date = None
+        self.last_close = np.nan
+        self.tr_tail = np.empty(0)
+        self.gain_tails = {}
+        self.loss_tails = {}
+        self.direction_state = None
+
+
+class IncrementalIndicatorEngine:
+    """
+    Keeps per-ticker IndicatorState and extends indicators as bars are
+    appended, in O(new bars) per ticker.
+
+    update() returns the get_secondary_data columns for the new bars only.
+    They are bit-for-bit what get_secondary_data gives for those bars when
+    run over the ticker's whole history, because every rolling mean is
+    rebuilt from its saved window tail (see rolling_mean) and the direction
+    labels resume from the saved state machine.
+    """
+
+    def __init__(self, params=None):
+        self.params = params or build_indicator_params()
+        self.states = {}
+
+    def save(self, path):
+        # Replace the file only once written, an interrupted save keeps the previous state
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'params': self.params, 'states': self.states}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+        engine = cls(saved['params'])
+        engine.states = saved['states']
+        return engine
+
+    def update(self, code, df):
+        """Extends code's indicators by the bars in df (indexed by date, OHLC columns)."""
+        state = self.states.get(code)
+        if state is None:
+            state = self.states[code] = IndicatorState(self.params)
+
+        # Bars at or before the saved state are already accounted for
+        if state.last_date is not None:
+            df = df[df.index > state.last_date]
+        if df.empty:
+            return pd.DataFrame(columns=INDICATOR_COLUMNS, index=df.index)
+
+        params = self.params
+        high = df['High'].to_numpy(dtype=float)
+        low = df['Low'].to_numpy(dtype=float)
+        close = df['Close'].to_numpy(dtype=float)
+        prev_close = np.concatenate(([state.last_close], close[:-1]))
+
+        # ATR calculation, fmax skips the missing previous close on the first bar
+        tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+        tr_window = np.concatenate((state.tr_tail, tr))
+        atr = rolling_mean(tr_window, params['ATR_window'])[len(state.tr_tail):] * params['ATR_multiplier']
+        state.tr_tail = _tail(tr_window, params['ATR_window'] - 1)
+
+        # Direction calculation
+        direction, state.direction_state = get_direction_array(
+            high, low, close,
+            params['Direction_threshold'],
+            atr=atr,
+            atr_mode=params['Use_absolute'],
+            state=state.direction_state,
+            return_state=True,
+        )
+
+        # RSI calculations
+        delta = close - prev_close
+        gain = np.where(delta > 0, delta, 0.0)
+        loss = np.where(delta < 0, -delta, 0.0)
+        rsi = {}
+        for periods in {params['RSI_periods']['short'], params['RSI_periods']['long']}:
+            gain_window = np.concatenate((state.gain_tails.get(periods, np.empty(0)), gain))
+            loss_window = np.concatenate((state.loss_tails.get(periods, np.empty(0)), loss))
+            avg_gain = rolling_mean(gain_window, periods)[len(gain_window) - len(gain):]
+            avg_loss = rolling_mean(loss_window, periods)[len(loss_window) - len(loss):]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rsi[periods] = 100 - (100 / (1 + avg_gain / avg_loss))
+            state.gain_tails[periods] = _tail(gain_window, periods - 1)
+            state.loss_tails[periods] = _tail(loss_window, periods - 1)
+
+        state.last_close = close[-1]
+        state.last_date = df.index[-1]
+
+        rsi_short, rsi_long = rsi[params['RSI_periods']['short']], rsi[params['RSI_periods']['long']]
+        # One constructor call, column by column inserts dominate a one-bar update
+        return pd.DataFrame({
+            'TR': tr, 'ATR': atr, 'Direction': direction,
+            'RSI_7': rsi_short, 'RSI_30': rsi_long, 'RSI_Diff': rsi_long - rsi_short,
+        }, index=df.index)
+
+    def refresh(self, codes, end_date, start_date='1900-01-01', provider=None):
+        """
+        Fetches the bars after each ticker's saved state up to end_date
+        (exclusive) and updates them. Tickers without state start from
+        start_date. Returns {code: new indicator rows}; a ticker whose fetch
+        fails is reported and keeps its state.
+        """
+        provider = provider or get_default_provider()
+        updates = {}
+        for code in codes:
+            state = self.states.get(code)
+            fetch_start = start_date
+            if state is not None and state.last_date is not None:
+                fetch_start = (state.last_date + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+            if fetch_start >= end_date:
+                continue
+            try:
+                bars = provider.fetch(code, fetch_start, end_date)
+            except Exception as e:
+                print(f"Refresh failed for {code}: {e}")
+                continue
+            updates[code] = self.update(code, bars)
+        return updates
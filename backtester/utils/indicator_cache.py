@@ -0,0 +1,60 @@
+import threading
+from .data_handler import get_ohlcv, compute_indicators, SECONDARY_COLUMNS
+
+
+class IndicatorCache:
+    """
+    Memoizes prices and indicator series across the runs of a parameter sweep.
+
+    Every node of the indicator graph (see compute_indicators) is keyed by
+    (ticker, date range, its indicator_key), so a sweep loads prices once
+    per ticker, computes the ATR rolling mean once per window, and each RSI
+    once per period. Only the direction labels, which depend on every
+    ATR/threshold combination, are computed per grid cell, and only the
+    lines a run asks for are computed at all. Safe to share between the
+    threads of the optimizer.
+
+    computations counts how many times each kind of series was computed.
+    """
+
+    def __init__(self, provider=None):
+        self.provider = provider
+        self.computations = {'prices': 0, 'TR': 0, 'ATR': 0, 'Direction': 0, 'RSI': 0}
+        self._values = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _memo(self, key, compute):
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # One thread computes a given key while the others wait for it
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+            value = compute()
+            with self._lock:
+                self._values[key] = value
+                self.computations[key[0]] = self.computations.get(key[0], 0) + 1
+        return value
+
+    def prices(self, code, start_date, end_date):
+        return self._memo(('prices', code, start_date, end_date),
+                          lambda: get_ohlcv(code, start_date, end_date, provider=self.provider))
+
+    def indicators(self, code, start_date, end_date, params, lines):
+        """compute_indicators for code's prices, with every memoizable node of the graph cached."""
+        prices = self.prices(code, start_date, end_date)
+        columns = {column: prices[column].to_numpy(dtype=float) for column in ['High', 'Low', 'Close']}
+        return compute_indicators(columns, lines, params,
+                                  memo=lambda key, compute: self._memo((key[0], code, start_date, end_date, key), compute))
+
+    def get_secondary_data(self, code, start_date, end_date, params, lines=None):
+        """Same frame as get_secondary_data(get_ohlcv(...), params, lines=lines), built from cached series."""
+        df = self.prices(code, start_date, end_date).copy()
+        for line, values in self.indicators(code, start_date, end_date, params, SECONDARY_COLUMNS if lines is None else lines).items():
+            df[line] = values
+        return df